@@ -0,0 +1,50 @@
+"""
+Reduce step for parallel runs: merge per-chunk analysis results.
+
+Each chunk's TextResponse carries an AnalysisResponse. When the request set
+include_word_counts, that response holds the chunk's full frequency table, and
+the merged table gives exact corpus-wide totals, unique count and top-K.
+"""
+
+from collections import Counter
+
+
+def merge_analyses(analyses, top_k=10):
+    """Merge AnalysisResponse messages (or None for failed chunks) into global statistics"""
+    merged = Counter()
+    total_words = 0
+    exact = True
+    merged_chunks = 0
+
+    for analysis in analyses:
+        if analysis is None:
+            continue
+        merged_chunks += 1
+        total_words += analysis.total_words
+        if analysis.word_counts:
+            merged.update(analysis.word_counts)
+        else:
+            # Only the top words came back; counts below the chunk's top-K are lost
+            exact = exact and analysis.total_words == 0
+            merged.update({wf.word: wf.count for wf in analysis.top_words})
+
+    return {
+        'chunks': merged_chunks,
+        'total_words': total_words,
+        'unique_words': len(merged),
+        'top_words': merged.most_common(top_k),
+        'word_counts': merged,
+        'exact': exact,
+    }
+
+
+def print_merged_analysis(merged, top_k=10):
+    """Print the global statistics produced by merge_analyses"""
+    label = "exact" if merged['exact'] else "approximate (full tables missing)"
+    print(f"\n🧮 MERGED ANALYSIS ({merged['chunks']} chunks, {label})")
+    print(f"  Total words: {merged['total_words']:,}")
+    print(f"  Unique words: {merged['unique_words']:,}")
+    if merged['top_words']:
+        print(f"  Top {min(top_k, len(merged['top_words']))} words:")
+        for i, (word, count) in enumerate(merged['top_words'][:top_k], 1):
+            print(f"    {i}. '{word}' - {count:,} times")
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Checks that analysis CPU is spread across the Service 3 instances.
+
+Sends unique 512KB documents through the whole pipeline (so Service 1's
+result cache cannot answer them), then compares how much CPU each Service 3
+container used while they ran. `make benchmark-analysis-spread`
+takes the CPU snapshots with `docker exec ... python cpu_usage.py` around
+the load run:
+
+    python analysis_spread_benchmark.py
+    python analysis_spread_benchmark.py --report results/analysis_cpu_before.txt results/analysis_cpu_after.txt
+
+A snapshot file has one "<instance> <cpu seconds>" line per container.
+"""
+
+import argparse
+import os
+import sys
+
+sys.path.insert(0, '/app')
+from server_mode_benchmark import run_load
+
+# Largest/smallest instance share that still counts as evenly spread
+MAX_SPREAD_RATIO = 2.0
+
+
+def read_snapshot(path):
+    snapshot = {}
+    with open(path) as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 2 and parts[1] != 'unknown':
+                snapshot[parts[0]] = float(parts[1])
+    return snapshot
+
+
+def report(before_path, after_path):
+    before = read_snapshot(before_path)
+    after = read_snapshot(after_path)
+    used = {name: after[name] - before[name] for name in sorted(after) if name in before}
+    total = sum(used.values())
+    if not used or total <= 0:
+        print("⚠️  No CPU usage recorded; are the Service 3 containers running?")
+        return 1
+
+    print("\n🧮 Service 3 CPU while the load ran")
+    print("┌──────────────┬──────────┬─────────┐")
+    print("│ Instance     │ CPU s    │ Share   │")
+    print("├──────────────┼──────────┼─────────┤")
+    for name, seconds in used.items():
+        print(f"│ {name:12s} │ {seconds:8.2f} │ {seconds / total:6.1%} │")
+    print("└──────────────┴──────────┴─────────┘")
+
+    busiest, idlest = max(used.values()), min(used.values())
+    ratio = busiest / idlest if idlest > 0 else float('inf')
+    if ratio <= MAX_SPREAD_RATIO:
+        print(f"\n✅ Analysis CPU is spread across {len(used)} instances (busiest/idlest {ratio:.2f}x)")
+        return 0
+    print(f"\n❌ Analysis CPU is uneven: busiest/idlest {ratio:.2f}x (limit {MAX_SPREAD_RATIO:.1f}x)")
+    return 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--address', default=os.getenv('SERVICE1_ADDRESS', 'service1-loadbalancer:8061'))
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--text-size', type=int, default=512 * 1024, help='characters per document')
+    parser.add_argument('--report', nargs=2, metavar=('BEFORE', 'AFTER'))
+    args = parser.parse_args()
+
+    if args.report:
+        sys.exit(report(*args.report))
+
+    print("\n" + "=" * 80)
+    print(f"🚀 ANALYSIS SPREAD BENCHMARK ({args.requests} documents, {args.concurrency} in flight)")
+    print("=" * 80)
+    result = run_load(args.address, args.concurrency, args.requests, args.text_size, unique_payloads=True)
+    print(f"Throughput: {result['throughput_rps']:.1f} docs/s, "
+          f"p50 {result['p50_ms']:.0f} ms, p99 {result['p99_ms']:.0f} ms, errors: {result['errors']}")
+
+
+if __name__ == '__main__':
+    main()
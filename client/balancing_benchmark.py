@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Load balancing policy benchmark with a mixed-size workload.
+
+Sends a fixed, seeded mix of small and large documents through Service 1's
+load balancer with several requests in flight, and reports throughput and
+latency percentiles separately for small and large requests. Policies are
+chosen per load balancer with LB_POLICY, so run this once per deployment
+and --compare the saved JSON files:
+
+    python balancing_benchmark.py --label round_robin
+    python balancing_benchmark.py --label least_bytes
+    python balancing_benchmark.py --compare results/balancing_round_robin.json results/balancing_least_bytes.json
+
+`make benchmark-balancing` does all of this for every policy.
+"""
+
+import argparse
+import grpc
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, '/app')
+import pipeline_pb2
+import pipeline_pb2_grpc
+import channel_pool
+
+SAMPLE_TEXT = b"Distributed systems pass messages between networked computers. "
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def make_document(size):
+    return (SAMPLE_TEXT * (size // len(SAMPLE_TEXT) + 1))[:size]
+
+
+def run_mix(address, concurrency, total_requests, small_size, large_size, large_every, seed):
+    """Send the mixed workload; returns a summary dict"""
+    documents = {'small': make_document(small_size), 'large': make_document(large_size)}
+    rng = random.Random(seed)
+    # Same seed, same order of sizes for every policy
+    kinds = ['large' if rng.randrange(large_every) == 0 else 'small' for _ in range(total_requests)]
+
+    pool = channel_pool.get_pool()
+    latencies = {'small': [], 'large': []}
+    errors = [0]
+    lock = threading.Lock()
+
+    def one_request(kind):
+        stub = pipeline_pb2_grpc.TextInputServiceStub(pool.get(address))
+        request_id = str(uuid.uuid4())[:8]
+        # A unique first word keeps Service 1's result cache out of the measurement
+        request = pipeline_pb2.TextRequest(payload=request_id.encode() + b' ' + documents[kind],
+                                           request_id=request_id)
+        start = time.perf_counter()
+        try:
+            stub.ReceiveText(request, timeout=300)
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies[kind].append(elapsed)
+        except grpc.RpcError:
+            with lock:
+                errors[0] += 1
+
+    overall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(one_request, kinds))
+    wall_time = time.perf_counter() - overall_start
+
+    sent_bytes = sum(len(documents[kind]) for kind in kinds)
+    summary = {
+        'concurrency': concurrency,
+        'requests': total_requests,
+        'large_requests': kinds.count('large'),
+        'errors': errors[0],
+        'wall_time': wall_time,
+        'throughput_rps': sum(len(v) for v in latencies.values()) / wall_time if wall_time > 0 else 0,
+        'throughput_mbps': sent_bytes / (1024 * 1024) / wall_time if wall_time > 0 else 0,
+    }
+    for kind, values in latencies.items():
+        values.sort()
+        summary[f'{kind}_p50_ms'] = percentile(values, 50) * 1000
+        summary[f'{kind}_p99_ms'] = percentile(values, 99) * 1000
+    return summary
+
+
+def print_table(results):
+    print("\n┌────────────────────┬────────┬────────┬──────────┬──────────┬──────────┬──────────┬────────┐")
+    print("│ Policy             │ req/s  │ MB/s   │ small p50│ small p99│ large p50│ large p99│ errors │")
+    print("├────────────────────┼────────┼────────┼──────────┼──────────┼──────────┼──────────┼────────┤")
+    for result in results:
+        r = result['run']
+        print(f"│ {result['label']:<18} │ {r['throughput_rps']:6.1f} │ {r['throughput_mbps']:6.1f} │ "
+              f"{r['small_p50_ms']:8.1f} │ {r['small_p99_ms']:8.1f} │ {r['large_p50_ms']:8.1f} │ "
+              f"{r['large_p99_ms']:8.1f} │ {r['errors']:6d} │")
+    print("└────────────────────┴────────┴────────┴──────────┴──────────┴──────────┴──────────┴────────┘")
+    print("  (latencies in ms)")
+
+
+def compare(paths):
+    results = []
+    for path in paths:
+        with open(path) as f:
+            results.append(json.load(f))
+    print_table(results)
+
+    base = results[0]
+    for other in results[1:]:
+        b, o = base['run'], other['run']
+        ratio = o['throughput_rps'] / b['throughput_rps'] if b['throughput_rps'] else 0
+        p99 = o['small_p99_ms'] / b['small_p99_ms'] if b['small_p99_ms'] else 0
+        print(f"💡 {other['label']} vs {base['label']}: {ratio:5.2f}x throughput, {p99:5.2f}x small-request p99")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--address', default=os.getenv('SERVICE1_ADDRESS', 'service1-loadbalancer:8061'))
+    parser.add_argument('--label', default=os.getenv('LB_POLICY', 'round_robin'))
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--small-size', type=int, default=4 * 1024, help='bytes per small document')
+    parser.add_argument('--large-size', type=int, default=8 * 1024 * 1024, help='bytes per large document')
+    parser.add_argument('--large-every', type=int, default=10, help='one request in N is large (on average)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output-dir', default='/app/results')
+    parser.add_argument('--compare', nargs='+', metavar='JSON')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(args.compare)
+        return
+
+    print("\n" + "=" * 80)
+    print(f"⚖️  BALANCING POLICY BENCHMARK ({args.label})")
+    print("=" * 80)
+    print(f"{args.requests} requests, {args.concurrency} in flight, 1 in {args.large_every} "
+          f"is {args.large_size:,} bytes, the rest {args.small_size:,} bytes")
+
+    run = run_mix(args.address, args.concurrency, args.requests, args.small_size,
+                  args.large_size, args.large_every, args.seed)
+    result = {'label': args.label, 'run': run}
+    print_table([result])
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    path = os.path.join(args.output_dir, f"balancing_{args.label}.json")
+    with open(path, 'w') as f:
+        json.dump(result, f, indent=2)
+    print(f"\nSaved results to {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -15,6 +15,12 @@ from concurrent.futures import ThreadPoolExecutor, as_completed
 sys.path.insert(0, '/app')
 import pipeline_pb2
 import pipeline_pb2_grpc
+import channel_pool
+import chunker
+import stage_report
+from analysis_reducer import merge_analyses
+
+SERVICE1_ADDRESS = os.getenv('SERVICE1_ADDRESS', 'service1-loadbalancer:8061')
 
 def load_dataset_files(datasets_path='/app/datasets'):
     """Load text from dataset files"""
@@ -34,68 +40,59 @@ def load_dataset_files(datasets_path='/app/datasets'):
     print(f"📁 Found {len(txt_files)} dataset file(s):")
     for file_path in txt_files:
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read().strip()
             filename = os.path.basename(file_path)
+            file_size = os.path.getsize(file_path)
             text_files.append({
                 'filename': filename,
-                'content': content,
-                'file_size': len(content)
+                'file_path': file_path,
+                'file_size': file_size
             })
-            print(f"  - {filename} ({len(content):,} chars, ~{len(content.split()):,} words)")
+            print(f"  - {filename} ({file_size:,} bytes)")
         except Exception as e:
             print(f"  - ERROR reading {os.path.basename(file_path)}: {str(e)}")
     
     return text_files
 
-def run_single_test(text, service1_address='service1-loadbalancer:8061'):
-    """Run a single pipeline test"""
+def run_single_test(text, service1_address=SERVICE1_ADDRESS, include_word_counts=False):
+    """Run a single pipeline test; returns (elapsed, success, word_count, analysis, stages)
+
+    `text` may be a str or already-encoded UTF-8 bytes; it is sent as the bytes payload.
+    """
     request_id = str(uuid.uuid4())[:8]
+    payload = text if isinstance(text, bytes) else text.encode('utf-8')
     start_time = time.time()
     
     try:
-        options = [
-            ('grpc.max_send_message_length', 100 * 1024 * 1024),
-            ('grpc.max_receive_message_length', 100 * 1024 * 1024),
-        ]
-        
-        with grpc.insecure_channel(service1_address, options=options) as channel:
-            stub = pipeline_pb2_grpc.TextInputServiceStub(channel)
-            request = pipeline_pb2.TextRequest(
-                text=text,
-                request_id=request_id
-            )
-            response = stub.ReceiveText(request, timeout=300)
+        stub = pipeline_pb2_grpc.TextInputServiceStub(channel_pool.get_pool().get(service1_address))
+        request = pipeline_pb2.TextRequest(
+            payload=payload,
+            request_id=request_id,
+            include_word_counts=include_word_counts
+        )
+        response = stub.ReceiveText(request, timeout=300)
             
         elapsed_time = time.time() - start_time
-        return elapsed_time, True, response.word_count
+        analysis = response.analysis if response.HasField('analysis') else None
+        stages = stage_report.pipeline_stages(response.timings, elapsed_time)
+        return elapsed_time, True, response.word_count, analysis, stages
         
     except Exception as e:
         elapsed_time = time.time() - start_time
+        if channel_pool.is_connection_error(e):
+            channel_pool.get_pool().invalidate(service1_address)
         print(f"Error: {str(e)}")
-        return elapsed_time, False, 0
+        return elapsed_time, False, 0, None, []
 
-def run_parallel_test(text, num_parallel, service1_address='service1-loadbalancer:8061'):
-    """Run parallel pipeline test with chunking"""
+def dataset_chunks(file_info, num_chunks):
+    """Lazy word-aligned chunks of a dataset file (memory-mapped) or of in-memory text"""
+    if 'file_path' in file_info:
+        return chunker.iter_file_chunks(file_info['file_path'], num_chunks)
+    return chunker.iter_chunks(file_info['content'].encode('utf-8'), num_chunks)
+
+def run_parallel_test(chunks, num_parallel, service1_address=SERVICE1_ADDRESS):
+    """Run parallel pipeline test, one pipeline per chunk"""
     from concurrent.futures import ThreadPoolExecutor, as_completed
     
-    def split_text_into_chunks(text, num_chunks):
-        """Split text into chunks"""
-        text_length = len(text)
-        chunk_size = text_length // num_chunks
-        chunks = []
-        
-        for i in range(num_chunks):
-            start = i * chunk_size
-            if i == num_chunks - 1:
-                end = text_length
-            else:
-                end = (i + 1) * chunk_size
-            chunks.append(text[start:end])
-        
-        return chunks
-    
-    chunks = split_text_into_chunks(text, num_parallel)
     request_id_base = str(uuid.uuid4())[:8]
     
     overall_start = time.time()
@@ -103,19 +100,21 @@ def run_parallel_test(text, num_parallel, service1_address='service1-loadbalance
     
     with ThreadPoolExecutor(max_workers=num_parallel) as executor:
         future_to_chunk = {
-            executor.submit(run_single_test, chunk, service1_address): i 
+            executor.submit(run_single_test, chunk, service1_address, True): i 
             for i, chunk in enumerate(chunks)
         }
         
         for future in as_completed(future_to_chunk):
             chunk_id = future_to_chunk[future]
             try:
-                elapsed, success, word_count = future.result()
+                elapsed, success, word_count, analysis, stages = future.result()
                 results.append({
                     'chunk_id': chunk_id,
                     'success': success,
                     'processing_time': elapsed,
-                    'word_count': word_count
+                    'word_count': word_count,
+                    'analysis': analysis,
+                    'stages': stages
                 })
             except Exception as e:
                 print(f"Chunk {chunk_id} generated exception: {e}")
@@ -123,7 +122,8 @@ def run_parallel_test(text, num_parallel, service1_address='service1-loadbalance
                     'chunk_id': chunk_id,
                     'success': False,
                     'processing_time': 0,
-                    'word_count': 0
+                    'word_count': 0,
+                    'stages': []
                 })
     
     overall_time = time.time() - overall_start
@@ -131,11 +131,14 @@ def run_parallel_test(text, num_parallel, service1_address='service1-loadbalance
     # Calculate results
     successful = [r for r in results if r['success']]
     total_words = sum(r['word_count'] for r in successful)
+    merged = merge_analyses(r['analysis'] for r in successful)
     
     return {
         'total_time': overall_time,
         'successful_count': len(successful),
         'total_words': total_words,
+        'unique_words': merged['unique_words'],
+        'top_words': merged['top_words'],
         'pipeline_results': results
     }
 
@@ -153,14 +156,16 @@ def run_comprehensive_benchmark():
         print("Using fallback text (no dataset files found)")
         test_text = "Docker is a platform for developing, shipping, and running applications in containers. " * 500
         file_info = {'filename': 'fallback.txt', 'content': test_text, 'file_size': len(test_text)}
+        test_payload = test_text.encode('utf-8')
     else:
         # Use the first dataset file
         file_info = dataset_files[0]
-    
-    test_text = file_info['content']
+        # Read once and reused for every single-pipeline run
+        with open(file_info['file_path'], 'rb') as f:
+            test_payload = f.read()
     
     print(f"📄 Using: {file_info['filename']}")
-    print(f"📊 File size: {file_info['file_size']:,} characters")
+    print(f"📊 File size: {file_info['file_size']:,} bytes")
     print(f"🔢 Testing pipelines: 1, 2, and 4 parallel pipelines")
     print(f"🔄 Runs per configuration: 3")
     print("=" * 80)
@@ -179,6 +184,7 @@ def run_comprehensive_benchmark():
         
         config_times = []
         config_successes = []
+        config_pipelines = []
         
         for run in range(num_runs):
             print(f"\n--- Run {run+1}/{num_runs} ---")
@@ -186,23 +192,27 @@ def run_comprehensive_benchmark():
             if num_pipelines == 1:
                 # Single pipeline test
                 start_time = time.time()
-                elapsed, success, word_count = run_single_test(test_text)
+                elapsed, success, word_count, analysis, stages = run_single_test(test_payload)
                 total_time = time.time() - start_time
                 result = {
                     'total_time': elapsed,
                     'successful_count': 1 if success else 0,
-                    'total_words': word_count if success else 0
+                    'total_words': word_count if success else 0,
+                    'unique_words': analysis.unique_words if analysis is not None else 0,
+                    'pipeline_results': [{'success': success, 'processing_time': elapsed, 'stages': stages}]
                 }
             else:
                 # Parallel pipeline test
-                result = run_parallel_test(test_text, num_pipelines)
+                result = run_parallel_test(dataset_chunks(file_info, num_pipelines), num_pipelines)
             
             config_times.append(result['total_time'])
             config_successes.append(result['successful_count'])
+            config_pipelines.extend(r for r in result['pipeline_results'] if r['success'])
             
             print(f"  Time: {result['total_time']:.3f}s")
             print(f"  Success: {result['successful_count']}/{num_pipelines}")
             print(f"  Words processed: {result['total_words']:,}")
+            print(f"  Unique words: {result['unique_words']:,}")
             
             # Wait between runs
             if run < num_runs - 1:
@@ -216,14 +226,15 @@ def run_comprehensive_benchmark():
             'avg_time': statistics.mean(config_times),
             'best_time': min(config_times),
             'worst_time': max(config_times),
-            'success_rate': sum(config_successes) / (num_pipelines * num_runs) * 100
+            'success_rate': sum(config_successes) / (num_pipelines * num_runs) * 100,
+            'pipelines': config_pipelines
         }
     
     # Print comprehensive results
     print("\n" + "=" * 80)
     print("📊 COMPREHENSIVE BENCHMARK RESULTS")
     print("=" * 80)
-    print(f"File: {file_info['filename']} ({file_info['file_size']:,} chars)")
+    print(f"File: {file_info['filename']} ({file_info['file_size']:,} bytes)")
     print(f"Configuration: {num_runs} runs per pipeline type")
     print("=" * 80)
     
@@ -264,6 +275,18 @@ def run_comprehensive_benchmark():
     print(f"  • 4 pipelines vs 1: {single_avg/quad_avg:.2f}x faster") 
     print(f"  • 4 pipelines vs 2: {double_avg/quad_avg:.2f}x faster")
     
+    # Where the time goes inside the pipeline, per configuration
+    for num_pipelines in pipeline_configs:
+        pipelines = all_results[num_pipelines]['pipelines']
+        if not pipelines:
+            continue
+        by_time = sorted(pipelines, key=lambda r: r['processing_time'])
+        median = by_time[len(by_time) // 2]
+        stage_report.print_waterfall(median['stages'], median['processing_time'],
+                                     f"{num_pipelines} pipeline(s): median request")
+        stage_report.print_stage_percentiles((r['stages'] for r in pipelines),
+                                             f"{num_pipelines} pipeline(s): per-stage latency percentiles")
+    
     print("=" * 80)
     
     return all_results
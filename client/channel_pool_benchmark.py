@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Per-hop latency with and without the shared channel pool.
+
+Calls each stage's load balancer directly with a small payload, once over
+pooled channels and once with a fresh channel per request (the old
+behaviour). Entering at stage N runs stages N..4, so the difference between
+consecutive entry points is the cost of one hop.
+"""
+
+import grpc
+import sys
+import time
+import statistics
+import uuid
+import os
+
+sys.path.insert(0, '/app')
+import pipeline_pb2
+import pipeline_pb2_grpc
+import channel_pool
+
+SAMPLE_TEXT = "Distributed systems pass messages between networked computers. " * 20
+
+HOPS = [
+    ('Service 1', os.getenv('SERVICE1_ADDRESS', 'service1-loadbalancer:8061'),
+     pipeline_pb2_grpc.TextInputServiceStub, 'ReceiveText',
+     lambda rid: pipeline_pb2.TextRequest(text=SAMPLE_TEXT, request_id=rid)),
+    ('Service 2', os.getenv('SERVICE2_ADDRESS', 'service2-loadbalancer:8062'),
+     pipeline_pb2_grpc.PreprocessServiceStub, 'CleanText',
+     lambda rid: pipeline_pb2.CleanRequest(text=SAMPLE_TEXT, request_id=rid)),
+    ('Service 3', os.getenv('SERVICE3_ADDRESS', 'service3-loadbalancer:8063'),
+     pipeline_pb2_grpc.AnalysisServiceStub, 'AnalyzeText',
+     lambda rid: pipeline_pb2.AnalysisRequest(text=SAMPLE_TEXT.lower(), request_id=rid)),
+    ('Service 4', os.getenv('SERVICE4_ADDRESS', 'service4-loadbalancer:8064'),
+     pipeline_pb2_grpc.ReportServiceStub, 'GenerateReport',
+     lambda rid: pipeline_pb2.ReportRequest(request_id=rid, total_words=1, unique_words=1)),
+]
+
+
+def time_calls(address, stub_class, method, make_request, num_requests, pooled):
+    """Return per-request latencies (seconds) for one entry point"""
+    pool = channel_pool.get_pool()
+    latencies = []
+
+    for _ in range(num_requests):
+        request = make_request(str(uuid.uuid4())[:8])
+        start = time.perf_counter()
+        if pooled:
+            stub = stub_class(pool.get(address))
+            getattr(stub, method)(request, timeout=300)
+        else:
+            with grpc.insecure_channel(address, options=channel_pool.DEFAULT_OPTIONS) as channel:
+                stub = stub_class(channel)
+                getattr(stub, method)(request, timeout=300)
+        latencies.append(time.perf_counter() - start)
+
+    return latencies
+
+
+def run_channel_pool_benchmark(num_requests=50):
+    print("\n" + "=" * 80)
+    print("🔌 CHANNEL POOL BENCHMARK (per-hop latency)")
+    print("=" * 80)
+    print(f"Requests per entry point: {num_requests}")
+    print(f"Channels per target: {channel_pool.get_pool().channels_per_target}")
+
+    results = {}
+    for name, address, stub_class, method, make_request in HOPS:
+        # Warm up the pool so the first handshake is not counted
+        time_calls(address, stub_class, method, make_request, 1, pooled=True)
+        results[name] = {}
+        for pooled in (False, True):
+            try:
+                latencies = time_calls(address, stub_class, method, make_request, num_requests, pooled)
+            except grpc.RpcError as e:
+                print(f"  {name} ({address}) failed: {e.code().name} - {e.details()}")
+                latencies = []
+            results[name]['pooled' if pooled else 'fresh'] = latencies
+
+    print("\n┌────────────┬──────────────┬──────────────┬──────────────┬──────────────┐")
+    print("│ Entry      │ Fresh p50 ms │ Pooled p50ms │ Hop fresh ms │ Hop pooled ms│")
+    print("├────────────┼──────────────┼──────────────┼──────────────┼──────────────┤")
+
+    medians = {}
+    for name, *_ in HOPS:
+        medians[name] = {
+            mode: statistics.median(values) * 1000 if values else float('nan')
+            for mode, values in results[name].items()
+        }
+
+    names = [hop[0] for hop in HOPS]
+    for i, name in enumerate(names):
+        fresh = medians[name]['fresh']
+        pooled = medians[name]['pooled']
+        # Cost of this hop alone = entering here minus entering one stage later
+        if i + 1 < len(names):
+            hop_fresh = fresh - medians[names[i + 1]]['fresh']
+            hop_pooled = pooled - medians[names[i + 1]]['pooled']
+        else:
+            hop_fresh, hop_pooled = fresh, pooled
+        print(f"│ {name:<10} │ {fresh:12.2f} │ {pooled:12.2f} │ {hop_fresh:12.2f} │ {hop_pooled:12.2f} │")
+
+    print("└────────────┴──────────────┴──────────────┴──────────────┴──────────────┘")
+    print("=" * 80)
+    return results
+
+
+if __name__ == '__main__':
+    print("⏳ Waiting for services to be ready...")
+    time.sleep(10)
+
+    num_requests = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    run_channel_pool_benchmark(num_requests)
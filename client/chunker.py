@@ -0,0 +1,56 @@
+"""
+Word-boundary-aware chunking shared by every client.
+
+Files are memory-mapped instead of read into memory. Each chunk ends at
+the first whitespace byte at or after its target offset, so no word is
+split between two pipelines and per-chunk counts merge exactly. Only ASCII
+whitespace is used as a boundary; those bytes never occur inside a
+multi-byte UTF-8 sequence, so every chunk is valid UTF-8 on its own and
+the file never needs decoding. Chunks are produced lazily: a chunk is
+copied out of the mapping only when the caller asks for it.
+"""
+
+import mmap
+import os
+import re
+
+_WHITESPACE = re.compile(rb'[ \t\n\r\x0b\x0c]')
+
+
+def chunk_bounds(buffer, num_chunks):
+    """Yield (start, end) offsets of up to `num_chunks` chunks ending at whitespace
+
+    Fewer chunks come back when the text has too little whitespace to cut
+    at, for example a single enormous word.
+    """
+    size = len(buffer)
+    start = 0
+    for i in range(1, num_chunks):
+        target = max(start, size * i // num_chunks)
+        match = _WHITESPACE.search(buffer, target)
+        if match is None:
+            break
+        end = match.start()
+        if end > start:
+            yield start, end
+            start = end
+    if start < size:
+        yield start, size
+
+
+def iter_chunks(buffer, num_chunks):
+    """Lazily yield `num_chunks` bytes chunks of `buffer` (bytes, mmap, ...)"""
+    for start, end in chunk_bounds(buffer, num_chunks):
+        yield buffer[start:end]
+
+
+def iter_file_chunks(path, num_chunks):
+    """Memory-map `path` and lazily yield its chunks as bytes
+
+    The mapping stays open until the generator is exhausted or closed.
+    """
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            yield from iter_chunks(mapped, num_chunks)
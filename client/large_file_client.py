@@ -9,71 +9,52 @@ from concurrent.futures import ThreadPoolExecutor, as_completed
 sys.path.insert(0, '/app')
 import pipeline_pb2
 import pipeline_pb2_grpc
+import channel_pool
+import chunker
+from analysis_reducer import merge_analyses, print_merged_analysis
 
 class LargeFilePipelineClient:
     def __init__(self):
-        self.service1_lb = 'service1-loadbalancer:8061'
-        
-    def split_text_into_chunks(self, text, num_chunks):
-        """Split text into chunks optimized for large files"""
-        print(f"Splitting {len(text):,} characters into {num_chunks} chunks...")
-        
-        # For large files, use character-based splitting
-        chunk_size = len(text) // num_chunks
-        chunks = []
-        
-        for i in range(num_chunks):
-            start = i * chunk_size
-            if i == num_chunks - 1:
-                end = len(text)
-            else:
-                end = (i + 1) * chunk_size
-            chunks.append(text[start:end])
-        
-        # Print chunk sizes
-        for i, chunk in enumerate(chunks):
-            word_count_estimate = len(chunk.split())
-            print(f"  Chunk {i+1}: {len(chunk):,} chars, ~{word_count_estimate:,} words")
-        
-        return chunks
-    
-    def process_single_chunk(self, chunk_text, chunk_id, request_id_base):
-        """Process chunk with larger message limits"""
+        # A comma-separated list of Service 1 instances skips the load balancer
+        self.service1_lb = os.getenv('SERVICE1_ADDRESS', 'service1-loadbalancer:8061')
+        self.channel_pool = channel_pool.get_pool()
+        self.stream_frame_size = int(os.getenv('STREAM_FRAME_SIZE', str(1024 * 1024)))
+        
+    def process_single_chunk(self, chunk, chunk_id, request_id_base):
+        """Process chunk (UTF-8 bytes) with larger message limits"""
         request_id = f"{request_id_base}_chunk{chunk_id}"
         
-        print(f"[Pipeline {chunk_id}] Processing {len(chunk_text):,} characters...")
+        print(f"[Pipeline {chunk_id}] Processing {len(chunk):,} bytes...")
         start_time = time.time()
         
         try:
-            # LARGER MESSAGE LIMITS
-            options = [
-                ('grpc.max_send_message_length', 100 * 1024 * 1024),
-                ('grpc.max_receive_message_length', 100 * 1024 * 1024),
-            ]
+            # POOLED CHANNEL (100MB message limits)
+            stub = pipeline_pb2_grpc.TextInputServiceStub(self.channel_pool.get(self.service1_lb))
             
-            with grpc.insecure_channel(self.service1_lb, options=options) as channel:
-                stub = pipeline_pb2_grpc.TextInputServiceStub(channel)
-                
-                request = pipeline_pb2.TextRequest(
-                    text=chunk_text,
-                    request_id=request_id
-                )
-                
-                # LONGER TIMEOUT
-                response = stub.ReceiveText(request, timeout=300)
-                
-                elapsed_time = time.time() - start_time
-                print(f"[Pipeline {chunk_id}] ✓ Completed in {elapsed_time:.3f}s - {response.word_count:,} words")
-                
-                return {
-                    'chunk_id': chunk_id,
-                    'success': True,
-                    'word_count': response.word_count,
-                    'processing_time': elapsed_time
-                }
+            request = pipeline_pb2.TextRequest(
+                payload=chunk,
+                request_id=request_id,
+                include_word_counts=True
+            )
+            
+            # LONGER TIMEOUT
+            response = stub.ReceiveText(request, timeout=300)
+            
+            elapsed_time = time.time() - start_time
+            print(f"[Pipeline {chunk_id}] ✓ Completed in {elapsed_time:.3f}s - {response.word_count:,} words")
+            
+            return {
+                'chunk_id': chunk_id,
+                'success': True,
+                'word_count': response.word_count,
+                'processing_time': elapsed_time,
+                'analysis': response.analysis if response.HasField('analysis') else None
+            }
                 
         except Exception as e:
             elapsed_time = time.time() - start_time
+            if channel_pool.is_connection_error(e):
+                self.channel_pool.invalidate(self.service1_lb)
             print(f"[Pipeline {chunk_id}] ✗ Failed in {elapsed_time:.3f}s: {str(e)}")
             return {
                 'chunk_id': chunk_id,
@@ -86,17 +67,14 @@ class LargeFilePipelineClient:
         """Process a single large file"""
         print(f"\n📖 Processing large file: {os.path.basename(filepath)}")
         
-        # Read file
-        with open(filepath, 'r', encoding='utf-8') as f:
-            content = f.read()
-        
-        print(f"📊 File size: {len(content):,} characters, ~{len(content.split()):,} words")
+        file_size = os.path.getsize(filepath)
+        print(f"📊 File size: {file_size:,} bytes")
         
-        if len(content) > 100 * 1024 * 1024:
-            print("⚠️  Warning: File is very large (>100MB), consider splitting it manually")
+        if file_size > 100 * 1024 * 1024 * num_parallel:
+            print("⚠️  Warning: chunks will exceed the 100MB message limit, use more pipelines or streaming mode")
         
-        # Split and process
-        chunks = self.split_text_into_chunks(content, num_parallel)
+        # The file is memory-mapped and cut at whitespace; each chunk is read
+        # from the mapping only when its pipeline is submitted
         request_id_base = str(uuid.uuid4())[:8]
         
         print(f"🚀 Starting {num_parallel} parallel pipelines...")
@@ -106,7 +84,7 @@ class LargeFilePipelineClient:
         with ThreadPoolExecutor(max_workers=num_parallel) as executor:
             future_to_chunk = {
                 executor.submit(self.process_single_chunk, chunk, i, request_id_base): i 
-                for i, chunk in enumerate(chunks)
+                for i, chunk in enumerate(chunker.iter_file_chunks(filepath, num_parallel))
             }
             
             for future in as_completed(future_to_chunk):
@@ -133,8 +111,43 @@ class LargeFilePipelineClient:
             speedup = (avg_time * len(results)) / overall_time
             print(f"Parallel speedup: {speedup:.2f}x")
         
+        print_merged_analysis(merge_analyses(r.get('analysis') for r in successful))
+        
         return overall_time
 
+    def process_large_file_streaming(self, filepath):
+        """Stream a file through the pipeline in bounded frames (no 100MB ceiling)"""
+        print(f"\n📖 Streaming large file: {os.path.basename(filepath)}")
+        print(f"📦 Frame size: {self.stream_frame_size:,} bytes")
+        
+        request_id = str(uuid.uuid4())[:8]
+        frame_count = [0]
+        
+        def frames():
+            # Raw bytes straight from disk: the text is never decoded on either side.
+            # Frames may split a UTF-8 character; Service 2 reassembles it.
+            with open(filepath, 'rb') as f:
+                while True:
+                    data = f.read(self.stream_frame_size)
+                    if not data:
+                        break
+                    frame_count[0] += 1
+                    yield pipeline_pb2.TextRequest(payload=data, request_id=request_id)
+        
+        start_time = time.time()
+        try:
+            stub = pipeline_pb2_grpc.TextInputServiceStub(self.channel_pool.get(self.service1_lb))
+            response = stub.StreamText(frames(), timeout=300)
+            elapsed_time = time.time() - start_time
+            print(f"[Stream] ✓ Completed in {elapsed_time:.3f}s - {frame_count[0]} frames, {response.word_count:,} words")
+        except Exception as e:
+            elapsed_time = time.time() - start_time
+            if channel_pool.is_connection_error(e):
+                self.channel_pool.invalidate(self.service1_lb)
+            print(f"[Stream] ✗ Failed in {elapsed_time:.3f}s: {str(e)}")
+        
+        return elapsed_time
+
 def main():
     client = LargeFilePipelineClient()
     
@@ -172,6 +185,10 @@ def main():
             if parallelism < 4:
                 print("\nWaiting 5 seconds before next test...")
                 time.sleep(5)
+        
+        # Streaming mode: one request, text flows through in bounded frames
+        print(f"\n🧪 Testing streaming mode")
+        client.process_large_file_streaming(filepath)
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
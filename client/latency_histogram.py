@@ -0,0 +1,106 @@
+"""
+HDR-style latency histogram.
+
+Values are recorded in microseconds into log-linear buckets: each power of
+two is split into enough sub-buckets to keep `significant_digits` (3 by
+default, under 0.1% error), so memory stays small however many samples
+are recorded and percentiles stay exact to that precision from a
+microsecond to minutes. Histograms from several threads or runs can be
+merged, and to_dict() keeps the buckets so saved results can be
+re-aggregated later.
+
+    histogram = LatencyHistogram()
+    histogram.record(elapsed_seconds)
+    histogram.percentile(99.9)   # seconds
+"""
+
+import math
+import threading
+
+REPORTED_PERCENTILES = (50, 90, 99, 99.9)
+
+
+class LatencyHistogram:
+    def __init__(self, significant_digits=3):
+        self.significant_digits = significant_digits
+        # Sub-bucket bits so neighbouring buckets differ by under 10^-digits
+        self.sub_bits = math.ceil(math.log2(2 * 10 ** significant_digits))
+        self.counts = {}
+        self.total = 0
+        self.min_us = None
+        self.max_us = 0
+        self.sum_us = 0
+        self._lock = threading.Lock()
+
+    def _key(self, value_us):
+        shift = max(0, value_us.bit_length() - self.sub_bits)
+        return shift, value_us >> shift
+
+    @staticmethod
+    def _highest(key):
+        """Largest value that falls in the bucket, as HdrHistogram reports it"""
+        shift, sub = key
+        return ((sub + 1) << shift) - 1
+
+    def record(self, seconds, count=1):
+        value_us = max(0, int(seconds * 1_000_000))
+        key = self._key(value_us)
+        with self._lock:
+            self.counts[key] = self.counts.get(key, 0) + count
+            self.total += count
+            self.sum_us += value_us * count
+            self.max_us = max(self.max_us, value_us)
+            self.min_us = value_us if self.min_us is None else min(self.min_us, value_us)
+
+    def merge(self, other):
+        with self._lock:
+            for key, count in other.counts.items():
+                self.counts[key] = self.counts.get(key, 0) + count
+            self.total += other.total
+            self.sum_us += other.sum_us
+            self.max_us = max(self.max_us, other.max_us)
+            if other.min_us is not None:
+                self.min_us = other.min_us if self.min_us is None else min(self.min_us, other.min_us)
+        return self
+
+    def percentile(self, pct):
+        """Seconds at or below which `pct` percent of the recorded values fall"""
+        if not self.total:
+            return 0.0
+        target = max(1, math.ceil(pct / 100 * self.total))
+        seen = 0
+        for key in sorted(self.counts):
+            seen += self.counts[key]
+            if seen >= target:
+                return min(self._highest(key), self.max_us) / 1_000_000
+        return self.max_us / 1_000_000
+
+    def mean(self):
+        return self.sum_us / self.total / 1_000_000 if self.total else 0.0
+
+    def summary(self):
+        """count, mean, min, max and the reported percentiles, in ms"""
+        row = {
+            'count': self.total,
+            'mean_ms': self.mean() * 1000,
+            'min_ms': (self.min_us or 0) / 1000,
+            'max_ms': self.max_us / 1000,
+        }
+        for pct in REPORTED_PERCENTILES:
+            row[f"p{pct:g}_ms"] = self.percentile(pct) * 1000
+        return row
+
+    def to_dict(self):
+        return {
+            'significant_digits': self.significant_digits,
+            'summary': self.summary(),
+            # [highest value in the bucket (us), count], lowest bucket first
+            'buckets': [[self._highest(key), self.counts[key]] for key in sorted(self.counts)],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        histogram = cls(data.get('significant_digits', 3))
+        for value_us, count in data['buckets']:
+            histogram.record(value_us / 1_000_000, count)
+        return histogram
@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+"""
+Open-loop load generator for the pipeline.
+
+benchmark.py sends one request at a time and waits for it, so a slow
+pipeline lowers the load it is offered and its latencies look better than a
+real client would see. This generator offers load independently of how fast
+responses come back:
+
+    --rate 20,50,100      open loop: requests start on a fixed schedule
+                          (Poisson arrivals by default) whether or not earlier
+                          ones have finished; latency is measured from the
+                          scheduled start, so time spent queued behind a slow
+                          pipeline is counted (no coordinated omission)
+    --concurrency 8,32    closed loop: that many requests always in flight
+
+Each step runs for --duration seconds after --warmup seconds whose requests
+are not recorded. Document sizes are drawn from a weighted mix (--sizes),
+and each document starts with a unique word so Service 1's result cache
+does not answer it. Latencies go into HDR-style histograms
+(latency_histogram.py), overall and per size, and every step reports
+p50/p90/p99/p99.9, docs/s and MB/s. Results are saved as JSON:
+
+    python load_generator.py --rate 10,20,40 --duration 30 --label proxied
+    python load_generator.py --concurrency 16 --sizes 4KB:1 --label small
+    python load_generator.py --compare results/load_proxied.json results/load_direct.json
+"""
+
+import argparse
+import grpc
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+
+sys.path.insert(0, '/app')
+import pipeline_pb2
+import pipeline_pb2_grpc
+import channel_pool
+from latency_histogram import LatencyHistogram, REPORTED_PERCENTILES
+
+SAMPLE_TEXT = b"Distributed systems pass messages between networked computers. "
+DEFAULT_SIZES = '4KB:60,64KB:30,1MB:9,2MB:1'
+MB = 1024 * 1024
+
+_UNITS = {'B': 1, 'KB': 1024, 'MB': MB}
+
+
+def parse_size(text):
+    """'64KB' -> 65536"""
+    text = text.strip().upper()
+    for unit in ('KB', 'MB', 'B'):
+        if text.endswith(unit):
+            return int(float(text[:-len(unit)]) * _UNITS[unit])
+    return int(text)
+
+
+def parse_sizes(spec):
+    """'4KB:60,1MB:10' -> [(4096, 60.0), (1048576, 10.0)]"""
+    mix = []
+    for item in spec.split(','):
+        size, _, weight = item.partition(':')
+        mix.append((parse_size(size), float(weight or 1)))
+    return mix
+
+
+def size_label(size):
+    if size >= MB and size % MB == 0:
+        return f"{size // MB}MB"
+    if size >= 1024 and size % 1024 == 0:
+        return f"{size // 1024}KB"
+    return f"{size}B"
+
+
+def make_document(size):
+    return (SAMPLE_TEXT * (size // len(SAMPLE_TEXT) + 1))[:size]
+
+
+class Workload:
+    """Seeded stream of documents drawn from the size mix"""
+
+    def __init__(self, mix, seed):
+        self.sizes = [size for size, _ in mix]
+        self.weights = [weight for _, weight in mix]
+        self.documents = {size: make_document(size) for size in self.sizes}
+        self.rng = random.Random(seed)
+
+    def next_request(self):
+        size = self.rng.choices(self.sizes, self.weights)[0]
+        request_id = str(uuid.uuid4())[:8]
+        # A unique first word keeps Service 1's result cache out of the measurement
+        payload = request_id.encode() + b' ' + self.documents[size]
+        return size, pipeline_pb2.TextRequest(payload=payload, request_id=request_id)
+
+
+class Recorder:
+    """Latencies and byte counts of one step; safe to call from gRPC callback threads"""
+
+    def __init__(self, sizes):
+        self.latency = LatencyHistogram()
+        self.by_size = {size: LatencyHistogram() for size in sizes}
+        self.completed = 0
+        self.bytes = 0
+        self.errors = {}
+        self.lock = threading.Lock()
+
+    def success(self, size, latency):
+        self.latency.record(latency)
+        self.by_size[size].record(latency)
+        with self.lock:
+            self.completed += 1
+            self.bytes += size
+
+    def failure(self, error):
+        code = error.code().name if isinstance(error, grpc.RpcError) else type(error).__name__
+        with self.lock:
+            self.errors[code] = self.errors.get(code, 0) + 1
+
+
+def run_open_loop(stub, workload, rate, duration, warmup, timeout, max_outstanding, poisson):
+    """Start requests at `rate` per second; returns (recorder, stats)"""
+    recorder = Recorder(workload.sizes)
+    outstanding = [0]
+    lock = threading.Lock()
+    idle = threading.Condition(lock)
+    skipped = [0]
+    max_lag = [0.0]
+
+    def finished(future, size, scheduled, recorded):
+        done = time.perf_counter()
+        error = future.exception()
+        if recorded:
+            if error is None:
+                recorder.success(size, done - scheduled)
+            else:
+                recorder.failure(error)
+        with idle:
+            outstanding[0] -= 1
+            idle.notify_all()
+
+    start = time.perf_counter()
+    measure_from = start + warmup
+    end = measure_from + duration
+    scheduled = start
+    sent = 0
+    while scheduled < end:
+        scheduled += workload.rng.expovariate(rate) if poisson else 1.0 / rate
+        now = time.perf_counter()
+        if scheduled > now:
+            time.sleep(scheduled - now)
+        else:
+            max_lag[0] = max(max_lag[0], now - scheduled)
+        recorded = scheduled >= measure_from
+        with lock:
+            if outstanding[0] >= max_outstanding:
+                # Over the cap the generator itself would become the bottleneck;
+                # count the request instead of waiting for a slot
+                if recorded:
+                    skipped[0] += 1
+                continue
+            outstanding[0] += 1
+        size, request = workload.next_request()
+        future = stub.ReceiveText.future(request, timeout=timeout)
+        future.add_done_callback(
+            lambda f, size=size, scheduled=scheduled, recorded=recorded: finished(f, size, scheduled, recorded))
+        if recorded:
+            sent += 1
+
+    with idle:
+        idle.wait_for(lambda: outstanding[0] == 0, timeout=timeout)
+    wall_time = max(time.perf_counter(), end) - measure_from
+    return recorder, {
+        'offered': sent,
+        'skipped': skipped[0],
+        'wall_time': wall_time,
+        'max_send_lag_ms': max_lag[0] * 1000,
+    }
+
+
+def run_closed_loop(stub, workload, concurrency, duration, warmup, timeout):
+    """Keep `concurrency` requests in flight; returns (recorder, stats)"""
+    recorder = Recorder(workload.sizes)
+    lock = threading.Lock()
+    sent = [0]
+    start = time.perf_counter()
+    measure_from = start + warmup
+    end = measure_from + duration
+
+    def worker():
+        while True:
+            began = time.perf_counter()
+            if began >= end:
+                return
+            with lock:
+                size, request = workload.next_request()
+            try:
+                stub.ReceiveText(request, timeout=timeout)
+                if began >= measure_from:
+                    recorder.success(size, time.perf_counter() - began)
+            except grpc.RpcError as e:
+                if began >= measure_from:
+                    recorder.failure(e)
+            if began >= measure_from:
+                with lock:
+                    sent[0] += 1
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall_time = max(time.perf_counter(), end) - measure_from
+    return recorder, {'offered': sent[0], 'skipped': 0, 'wall_time': wall_time, 'max_send_lag_ms': 0.0}
+
+
+def step_result(mode, load, recorder, stats):
+    wall_time = stats['wall_time']
+    return {
+        'mode': mode,
+        'load': load,
+        **stats,
+        'completed': recorder.completed,
+        'errors': sum(recorder.errors.values()),
+        'errors_by_code': recorder.errors,
+        'docs_per_s': recorder.completed / wall_time if wall_time > 0 else 0,
+        'mb_per_s': recorder.bytes / MB / wall_time if wall_time > 0 else 0,
+        'latency': recorder.latency.summary(),
+        'histogram': recorder.latency.to_dict()['buckets'],
+        'by_size': {
+            size_label(size): histogram.summary()
+            for size, histogram in recorder.by_size.items() if histogram.total
+        },
+    }
+
+
+def print_steps(title, steps):
+    columns = [f"p{pct:g}" for pct in REPORTED_PERCENTILES]
+    print(f"\n{title}")
+    print(f"  {'load':>10s} {'docs/s':>8s} {'MB/s':>8s} "
+          + ' '.join(f"{c + ' ms':>9s}" for c in columns)
+          + f" {'max ms':>9s} {'errors':>7s} {'skipped':>7s}")
+    for step in steps:
+        load = f"{step['load']:g}/s" if step['mode'] == 'rate' else f"{step['load']}x"
+        latency = step['latency']
+        print(f"  {load:>10s} {step['docs_per_s']:8.1f} {step['mb_per_s']:8.2f} "
+              + ' '.join(f"{latency[c + '_ms']:9.1f}" for c in columns)
+              + f" {latency['max_ms']:9.1f} {step['errors']:7d} {step['skipped']:7d}")
+    print("  (load: offered requests per second, or requests kept in flight)")
+
+
+def print_sizes(step):
+    if len(step['by_size']) < 2:
+        return
+    print(f"\n  By document size at {step['load']:g}{'/s' if step['mode'] == 'rate' else 'x'}:")
+    for label, row in step['by_size'].items():
+        print(f"    {label:>6s}  n={row['count']:<6d} p50 {row['p50_ms']:8.1f}  p99 {row['p99_ms']:8.1f}  "
+              f"p99.9 {row['p99.9_ms']:8.1f} ms")
+
+
+def compare(paths):
+    results = []
+    for path in paths:
+        with open(path) as f:
+            results.append(json.load(f))
+    for result in results:
+        print_steps(f"🧪 {result['label']} ({result['address']})", result['steps'])
+
+    base = results[0]
+    for other in results[1:]:
+        print(f"\n💡 {other['label']} vs {base['label']} (docs/s ratio, p99 ratio, p99.9 ratio):")
+        for a, b in zip(base['steps'], other['steps']):
+            ratio = b['docs_per_s'] / a['docs_per_s'] if a['docs_per_s'] else 0
+            p99 = b['latency']['p99_ms'] / a['latency']['p99_ms'] if a['latency']['p99_ms'] else 0
+            p999 = b['latency']['p99.9_ms'] / a['latency']['p99.9_ms'] if a['latency']['p99.9_ms'] else 0
+            print(f"  • load {a['load']:g}: {ratio:5.2f}x docs/s, {p99:5.2f}x p99, {p999:5.2f}x p99.9")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--address', default=os.getenv('SERVICE1_ADDRESS', 'service1-loadbalancer:8061'))
+    parser.add_argument('--label', default='load')
+    load = parser.add_mutually_exclusive_group()
+    load.add_argument('--rate', help='comma-separated offered request rates (requests/s), open loop')
+    load.add_argument('--concurrency', help='comma-separated in-flight request counts, closed loop')
+    parser.add_argument('--duration', type=float, default=30, help='measured seconds per step')
+    parser.add_argument('--warmup', type=float, default=5, help='unrecorded seconds before each step')
+    parser.add_argument('--sizes', default=DEFAULT_SIZES,
+                        help='document size mix as size:weight pairs (default: %(default)s)')
+    parser.add_argument('--arrivals', choices=('poisson', 'uniform'), default='poisson',
+                        help='gaps between open-loop requests')
+    parser.add_argument('--max-outstanding', type=int, default=1000,
+                        help='open-loop requests in flight before new ones are skipped')
+    parser.add_argument('--timeout', type=float, default=300, help='per-request deadline (s)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output-dir', default='/app/results')
+    parser.add_argument('--compare', nargs='+', metavar='JSON')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(args.compare)
+        return
+
+    mix = parse_sizes(args.sizes)
+    mode = 'concurrency' if args.concurrency else 'rate'
+    loads = [int(c) for c in args.concurrency.split(',')] if args.concurrency else \
+        [float(r) for r in (args.rate or '10').split(',')]
+
+    print("\n" + "=" * 80)
+    print(f"🚀 LOAD GENERATOR ({args.label}: {args.address})")
+    print("=" * 80)
+    print(f"Size mix: {', '.join(f'{size_label(s)} x{w:g}' for s, w in mix)}")
+
+    stub = pipeline_pb2_grpc.TextInputServiceStub(channel_pool.get_pool().get(args.address))
+    steps = []
+    for value in loads:
+        workload = Workload(mix, args.seed)
+        if mode == 'rate':
+            print(f"Offering {value:g} requests/s for {args.warmup:g}s warmup + {args.duration:g}s...")
+            recorder, stats = run_open_loop(stub, workload, value, args.duration, args.warmup, args.timeout,
+                                            args.max_outstanding, args.arrivals == 'poisson')
+        else:
+            print(f"Keeping {value} requests in flight for {args.warmup:g}s warmup + {args.duration:g}s...")
+            recorder, stats = run_closed_loop(stub, workload, value, args.duration, args.warmup, args.timeout)
+        step = step_result(mode, value, recorder, stats)
+        if step['max_send_lag_ms'] > 100:
+            print(f"  ⚠️  The generator fell {step['max_send_lag_ms']:.0f} ms behind schedule; "
+                  f"latencies include that lag")
+        steps.append(step)
+
+    print_steps(f"🧪 {args.label} ({args.address})", steps)
+    for step in steps:
+        print_sizes(step)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    path = os.path.join(args.output_dir, f"load_{args.label}.json")
+    with open(path, 'w') as f:
+        json.dump({
+            'label': args.label,
+            'address': args.address,
+            'mode': mode,
+            'sizes': {size_label(s): w for s, w in mix},
+            'arrivals': args.arrivals if mode == 'rate' else None,
+            'duration': args.duration,
+            'warmup': args.warmup,
+            'steps': steps,
+        }, f, indent=2)
+    print(f"\nSaved results to {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Benchmark of pipeline throughput under different logging settings.
+
+verbose       LOG_LEVEL=DEBUG: every step of every request, as the old
+              print() calls did, written by each process's log thread
+verbose-sync  LOG_LEVEL=DEBUG LOG_QUEUE_SIZE=0: the same lines written from
+              the handler threads, which is what print() cost
+production    LOG_LEVEL=INFO LOG_SAMPLE_RATE=0.1: one line per stage for a
+              tenth of the requests; warnings and errors are always kept
+
+Small unique requests are used so the per-request logging cost is not
+hidden by the word count or skipped by Service 1's result cache. Restart
+the pipeline with each setting, run once per setting with --label, then
+--compare the saved JSON files (the first one is the baseline):
+
+    LOG_LEVEL=DEBUG docker-compose -f docker-compose-parallel.yml up -d --force-recreate ...
+    python logging_benchmark.py --label verbose
+    python logging_benchmark.py --compare results/logging_verbose.json results/logging_production.json
+"""
+
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, '/app')
+from server_mode_benchmark import run_load, print_table
+
+
+def compare(paths):
+    results = []
+    for path in paths:
+        with open(path) as f:
+            results.append(json.load(f))
+    for result in results:
+        print_table(f"🧪 {result['label']} ({result['address']})", result['runs'])
+
+    base = results[0]
+    for other in results[1:]:
+        print(f"\n💡 {other['label']} vs {base['label']} (throughput ratio, p50 ratio, p99 ratio):")
+        for a, b in zip(base['runs'], other['runs']):
+            ratio = b['throughput_rps'] / a['throughput_rps'] if a['throughput_rps'] else 0
+            p50 = b['p50_ms'] / a['p50_ms'] if a['p50_ms'] else 0
+            p99 = b['p99_ms'] / a['p99_ms'] if a['p99_ms'] else 0
+            print(f"  • concurrency {a['concurrency']:4d}: {ratio:5.2f}x throughput, "
+                  f"{p50:5.2f}x p50, {p99:5.2f}x p99")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--address', default=os.getenv('SERVICE1_ADDRESS', 'service1-loadbalancer:8061'))
+    parser.add_argument('--label', default=os.getenv('LOG_LEVEL', 'INFO').lower())
+    parser.add_argument('--concurrency', default='8,32,128',
+                        help='comma-separated in-flight request counts')
+    parser.add_argument('--requests', type=int, default=400, help='requests per concurrency level')
+    parser.add_argument('--text-size', type=int, default=4 * 1024, help='characters per request')
+    parser.add_argument('--output-dir', default='/app/results')
+    parser.add_argument('--compare', nargs='+', metavar='JSON')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(args.compare)
+        return
+
+    print("\n" + "=" * 80)
+    print(f"🚀 LOGGING BENCHMARK ({args.label}: {args.address})")
+    print("=" * 80)
+
+    runs = []
+    for concurrency in [int(c) for c in args.concurrency.split(',')]:
+        print(f"Running {args.requests} requests at concurrency {concurrency}...")
+        runs.append(run_load(args.address, concurrency, args.requests, args.text_size, unique_payloads=True))
+
+    print_table(f"🧪 {args.label} ({args.address})", runs)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    path = os.path.join(args.output_dir, f"logging_{args.label}.json")
+    with open(path, 'w') as f:
+        json.dump({'label': args.label, 'address': args.address, 'runs': runs}, f, indent=2)
+    print(f"\nSaved results to {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -10,93 +10,67 @@ from concurrent.futures import ThreadPoolExecutor, as_completed
 sys.path.insert(0, '/app')
 import pipeline_pb2
 import pipeline_pb2_grpc
+import channel_pool
+import chunker
+import hedging
+import stage_report
+from analysis_reducer import merge_analyses, print_merged_analysis
 
 class ParallelPipelineClient:
     def __init__(self):
-        self.service1_lb = 'service1-loadbalancer:8061'
+        # A comma-separated list of Service 1 instances skips the load balancer
+        self.service1_lb = os.getenv('SERVICE1_ADDRESS', 'service1-loadbalancer:8061')
         self.num_parallel_pipelines = 4  # Can be 2, 4, 8, etc.
+        self.channel_pool = channel_pool.get_pool()
+        # HEDGE_PERCENTILE > 0 re-sends a straggling chunk; see hedging.py
+        self.hedger = hedging.Hedger()
         
-    def split_text_into_chunks(self, text, num_chunks):
-        """Split text into chunks with optimized handling for large files"""
-        text_length = len(text)
-        
-        # For very large files (>5MB), use character-based splitting
-        if text_length > 5 * 1024 * 1024:
-            print(f"📊 Large file detected: {text_length:,} characters, using optimized chunking...")
-            chunk_size = text_length // num_chunks
-            chunks = []
-            
-            for i in range(num_chunks):
-                start = i * chunk_size
-                if i == num_chunks - 1:  # Last chunk gets remaining characters
-                    end = text_length
-                else:
-                    end = (i + 1) * chunk_size
-                chunk_text = text[start:end]
-                chunks.append(chunk_text)
-        else:
-            # For smaller files, use word-based splitting (better for analysis)
-            words = text.split()
-            chunk_size = len(words) // num_chunks
-            chunks = []
-            
-            for i in range(num_chunks):
-                start = i * chunk_size
-                if i == num_chunks - 1:
-                    end = len(words)
-                else:
-                    end = (i + 1) * chunk_size
-                chunk_text = ' '.join(words[start:end])
-                chunks.append(chunk_text)
-            
-        print(f"Split {text_length:,} characters into {num_chunks} chunks:")
-        for i, chunk in enumerate(chunks):
-            word_count = len(chunk.split())
-            print(f"  Chunk {i+1}: {word_count:,} words, {len(chunk):,} chars")
-            
-        return chunks
-    
-    def process_single_chunk(self, chunk_text, chunk_id, request_id_base):
-        """Process a single text chunk through the entire pipeline with large file support"""
+    def process_single_chunk(self, chunk, chunk_id, request_id_base):
+        """Process a single chunk (UTF-8 bytes) through the entire pipeline with large file support"""
         request_id = f"{request_id_base}_chunk{chunk_id}"
         
         print(f"\n[Pipeline {chunk_id}] Starting processing...")
-        print(f"[Pipeline {chunk_id}] Chunk size: {len(chunk_text):,} chars, {len(chunk_text.split()):,} words")
+        print(f"[Pipeline {chunk_id}] Chunk size: {len(chunk):,} bytes")
         
         start_time = time.time()
         
         try:
-            # ADDED: Larger message size options and longer timeout
-            options = [
-                ('grpc.max_send_message_length', 100 * 1024 * 1024),      # 100MB send limit
-                ('grpc.max_receive_message_length', 100 * 1024 * 1024),   # 100MB receive limit
-            ]
+            # Pooled channels (100MB limits) are shared by all pipelines in this client
+            stub = pipeline_pb2_grpc.TextInputServiceStub(self.channel_pool.get(self.service1_lb))
             
-            with grpc.insecure_channel(self.service1_lb, options=options) as channel:
-                stub = pipeline_pb2_grpc.TextInputServiceStub(channel)
-                
-                request = pipeline_pb2.TextRequest(
-                    text=chunk_text,
-                    request_id=request_id
-                )
-                
+            request = pipeline_pb2.TextRequest(
+                payload=chunk,
+                request_id=request_id,
+                include_word_counts=True  # Full table so chunks can be merged exactly
+            )
+            
+            def start(hedge):
+                # A hedge goes back through the load balancer, which sends it to another instance
+                if hedge:
+                    print(f"[Pipeline {chunk_id}] ⏱ Slower than p{self.hedger.percentile:g}, sending a hedged duplicate")
                 # ADDED: Longer timeout for large files (5 minutes)
-                response = stub.ReceiveText(request, timeout=300)
-                
-                elapsed_time = time.time() - start_time
-                print(f"[Pipeline {chunk_id}] ✓ Completed in {elapsed_time:.3f}s - {response.word_count:,} words")
-                
-                return {
-                    'chunk_id': chunk_id,
-                    'success': True,
-                    'word_count': response.word_count,
-                    'processing_time': elapsed_time,
-                    'status': response.status,
-                    'message': response.message
-                }
+                return stub.ReceiveText.future(request, timeout=300)
+            
+            response = hedging.call_hedged(start, self.hedger, len(chunk))
+            
+            elapsed_time = time.time() - start_time
+            print(f"[Pipeline {chunk_id}] ✓ Completed in {elapsed_time:.3f}s - {response.word_count:,} words")
+            
+            return {
+                'chunk_id': chunk_id,
+                'success': True,
+                'word_count': response.word_count,
+                'processing_time': elapsed_time,
+                'status': response.status,
+                'message': response.message,
+                'analysis': response.analysis if response.HasField('analysis') else None,
+                'stages': stage_report.pipeline_stages(response.timings, elapsed_time)
+            }
                 
         except grpc.RpcError as e:
             elapsed_time = time.time() - start_time
+            if channel_pool.is_connection_error(e):
+                self.channel_pool.invalidate(self.service1_lb)
             error_msg = f"gRPC Error: {e.code().name} - {e.details()}"
             print(f"[Pipeline {chunk_id}] ✗ Failed in {elapsed_time:.3f}s: {error_msg}")
             
@@ -118,21 +92,28 @@ class ParallelPipelineClient:
             }
     
     def process_parallel(self, text, num_parallel=None):
-        """Process text through multiple parallel pipelines"""
-        if num_parallel is None:
-            num_parallel = self.num_parallel_pipelines
-            
+        """Process in-memory text through multiple parallel pipelines"""
+        num_parallel = num_parallel or self.num_parallel_pipelines
+        payload = text.encode('utf-8')
+        return self._process_chunks(chunker.iter_chunks(payload, num_parallel), len(payload), num_parallel)
+    
+    def process_file(self, file_path, num_parallel=None):
+        """Process a file through multiple parallel pipelines without reading it into memory"""
+        num_parallel = num_parallel or self.num_parallel_pipelines
+        return self._process_chunks(chunker.iter_file_chunks(file_path, num_parallel),
+                                    os.path.getsize(file_path), num_parallel)
+    
+    def _process_chunks(self, chunks, total_size, num_parallel):
+        """Run one pipeline per chunk; `chunks` is a lazy generator of bytes"""
         print("\n" + "="*80)
         print("🚀 PARALLEL PIPELINE PROCESSING")
         print("="*80)
-        print(f"Total text length: {len(text):,} characters")
+        print(f"Total text size: {total_size:,} bytes")
         print(f"Number of parallel pipelines: {num_parallel}")
         print(f"Service instances: 4x each service type")
         print(f"Message size limit: 100MB per chunk")
         print(f"Timeout: 300 seconds")
         
-        # Split text into chunks
-        chunks = self.split_text_into_chunks(text, num_parallel)
         request_id_base = str(uuid.uuid4())[:8]
         
         print(f"\nStarting {num_parallel} parallel pipelines...")
@@ -165,14 +146,15 @@ class ParallelPipelineClient:
         overall_time = time.time() - overall_start
         
         # Aggregate results
-        return self.aggregate_results(results, chunks, overall_time)
+        return self.aggregate_results(results, overall_time)
     
-    def aggregate_results(self, results, chunks, total_time):
+    def aggregate_results(self, results, total_time):
         """Aggregate results from all parallel pipelines"""
         successful = [r for r in results if r['success']]
         failed = [r for r in results if not r['success']]
         
         total_words = sum(r['word_count'] for r in successful)
+        merged = merge_analyses(r.get('analysis') for r in successful)
         avg_time = sum(r['processing_time'] for r in results) / len(results) if results else 0
         
         print("\n" + "="*80)
@@ -190,6 +172,9 @@ class ParallelPipelineClient:
             speedup = (avg_time * len(results)) / total_time if total_time > 0 else 1
             print(f"Parallel speedup: {speedup:.2f}x")
         
+        if self.hedger.enabled:
+            print(f"Hedged requests: {self.hedger.hedges} sent, {self.hedger.hedge_wins} won")
+        
         print("\nPipeline Details:")
         for result in sorted(results, key=lambda x: x['chunk_id']):
             status = "✓" if result['success'] else "✗"
@@ -202,18 +187,30 @@ class ParallelPipelineClient:
             for fail in failed:
                 print(f"  Pipeline {fail['chunk_id']}: {fail['error']}")
         
+        if successful:
+            # The slowest pipeline sets the total time, so show where it spent it
+            slowest = max(successful, key=lambda r: r['processing_time'])
+            stage_report.print_waterfall(slowest['stages'], slowest['processing_time'],
+                                         f"Stage waterfall of the slowest pipeline ({slowest['chunk_id']})")
+        stage_percentiles = stage_report.print_stage_percentiles(r['stages'] for r in successful)
+        
+        print_merged_analysis(merged)
+        
         return {
             'total_time': total_time,
             'successful_count': len(successful),
             'failed_count': len(failed),
             'total_words': total_words,
+            'unique_words': merged['unique_words'],
+            'top_words': merged['top_words'],
             'speedup': speedup,
+            'stage_percentiles': stage_percentiles,
             'pipeline_results': results
         }
 
 
 def read_text_files(datasets_path='/app/datasets'):
-    """Read all .txt files from datasets directory with better error handling"""
+    """List the .txt files in the datasets directory; contents are memory-mapped later"""
     text_files = []
     
     if not os.path.exists(datasets_path):
@@ -232,24 +229,18 @@ def read_text_files(datasets_path='/app/datasets'):
     for file_path in txt_files:
         try:
             file_size = os.path.getsize(file_path)
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read().strip()
-                filename = os.path.basename(file_path)
+            filename = os.path.basename(file_path)
+            
+            if file_size:
+                text_files.append({
+                    'filename': filename,
+                    'file_path': file_path,
+                    'file_size': file_size
+                })
+                print(f"  - {filename} ({file_size:,} bytes)")
+            else:
+                print(f"  - {filename} (EMPTY - skipping)")
                 
-                if content:
-                    text_files.append({
-                        'filename': filename,
-                        'content': content,
-                        'file_path': file_path,
-                        'file_size': file_size
-                    })
-                    word_count = len(content.split())
-                    print(f"  - {filename} ({file_size:,} bytes, {len(content):,} chars, {word_count:,} words)")
-                else:
-                    print(f"  - {filename} (EMPTY - skipping)")
-                    
-        except UnicodeDecodeError:
-            print(f"  - {os.path.basename(file_path)} (ENCODING ERROR - not UTF-8)")
         except Exception as e:
             print(f"  - ERROR reading {os.path.basename(file_path)}: {str(e)}")
     
@@ -325,7 +316,10 @@ def main():
             print(f"🧪 TESTING WITH {parallelism} PARALLEL PIPELINES")
             print(f"{'='*60}")
             
-            result = client.process_parallel(file_info['content'], parallelism)
+            if 'file_path' in file_info:
+                result = client.process_file(file_info['file_path'], parallelism)
+            else:
+                result = client.process_parallel(file_info['content'], parallelism)
             
             # Wait between tests
             if parallelism < max(parallelism_levels):
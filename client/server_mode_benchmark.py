@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+High-concurrency benchmark for comparing SERVER_MODE=thread and SERVER_MODE=aio.
+
+Keeps `concurrency` requests in flight against Service 1's load balancer and
+records throughput and latency percentiles. Run it once per deployment mode
+with --label, then --compare the saved JSON files:
+
+    python server_mode_benchmark.py --label thread
+    python server_mode_benchmark.py --label aio
+    python server_mode_benchmark.py --compare results/server_mode_thread.json results/server_mode_aio.json
+"""
+
+import argparse
+import grpc
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, '/app')
+import pipeline_pb2
+import pipeline_pb2_grpc
+import channel_pool
+
+SAMPLE_TEXT = "Distributed systems pass messages between networked computers. "
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def run_load(address, concurrency, total_requests, text_size, unique_payloads=False):
+    """Send `total_requests` requests with `concurrency` in flight; returns a summary dict
+
+    With `unique_payloads` every request differs, so Service 1's result cache
+    cannot answer it and the whole pipeline is measured.
+    """
+    payload = (SAMPLE_TEXT * (text_size // len(SAMPLE_TEXT) + 1))[:text_size].encode('utf-8')
+    pool = channel_pool.get_pool()
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+
+    def one_request(_):
+        stub = pipeline_pb2_grpc.TextInputServiceStub(pool.get(address))
+        request_id = str(uuid.uuid4())[:8]
+        body = request_id.encode('utf-8') + b' ' + payload if unique_payloads else payload
+        request = pipeline_pb2.TextRequest(payload=body, request_id=request_id)
+        start = time.perf_counter()
+        try:
+            stub.ReceiveText(request, timeout=300)
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+        except grpc.RpcError:
+            with lock:
+                errors[0] += 1
+
+    overall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(one_request, range(total_requests)))
+    wall_time = time.perf_counter() - overall_start
+
+    latencies.sort()
+    return {
+        'concurrency': concurrency,
+        'requests': total_requests,
+        'text_size': text_size,
+        'errors': errors[0],
+        'wall_time': wall_time,
+        'throughput_rps': len(latencies) / wall_time if wall_time > 0 else 0,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p90_ms': percentile(latencies, 90) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'max_ms': (latencies[-1] if latencies else 0) * 1000,
+    }
+
+
+def print_table(title, rows):
+    print(f"\n{title}")
+    print("┌─────────────┬──────────┬──────────┬──────────┬──────────┬──────────┬────────┐")
+    print("│ Concurrency │  req/s   │ p50 ms   │ p90 ms   │ p99 ms   │ max ms   │ errors │")
+    print("├─────────────┼──────────┼──────────┼──────────┼──────────┼──────────┼────────┤")
+    for r in rows:
+        print(f"│ {r['concurrency']:11d} │ {r['throughput_rps']:8.1f} │ {r['p50_ms']:8.1f} │ "
+              f"{r['p90_ms']:8.1f} │ {r['p99_ms']:8.1f} │ {r['max_ms']:8.1f} │ {r['errors']:6d} │")
+    print("└─────────────┴──────────┴──────────┴──────────┴──────────┴──────────┴────────┘")
+
+
+def compare(paths):
+    results = []
+    for path in paths:
+        with open(path) as f:
+            results.append(json.load(f))
+    for result in results:
+        print_table(f"🧪 SERVER_MODE={result['label']}", result['runs'])
+
+    if len(results) == 2:
+        base, other = results
+        print(f"\n💡 {other['label']} vs {base['label']} (throughput ratio, p99 ratio):")
+        for a, b in zip(base['runs'], other['runs']):
+            ratio = b['throughput_rps'] / a['throughput_rps'] if a['throughput_rps'] else 0
+            p99 = b['p99_ms'] / a['p99_ms'] if a['p99_ms'] else 0
+            print(f"  • concurrency {a['concurrency']:4d}: {ratio:5.2f}x throughput, {p99:5.2f}x p99")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--address', default=os.getenv('SERVICE1_ADDRESS', 'service1-loadbalancer:8061'))
+    parser.add_argument('--label', default=os.getenv('SERVER_MODE', 'thread'))
+    parser.add_argument('--concurrency', default='8,32,128',
+                        help='comma-separated in-flight request counts')
+    parser.add_argument('--requests', type=int, default=400, help='requests per concurrency level')
+    parser.add_argument('--text-size', type=int, default=64 * 1024, help='characters per request')
+    parser.add_argument('--output-dir', default='/app/results')
+    parser.add_argument('--compare', nargs='+', metavar='JSON')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(args.compare)
+        return
+
+    print("\n" + "=" * 80)
+    print(f"🚀 SERVER MODE BENCHMARK ({args.label})")
+    print("=" * 80)
+
+    runs = []
+    for concurrency in [int(c) for c in args.concurrency.split(',')]:
+        print(f"Running {args.requests} requests at concurrency {concurrency}...")
+        runs.append(run_load(args.address, concurrency, args.requests, args.text_size))
+
+    print_table(f"🧪 SERVER_MODE={args.label}", runs)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    path = os.path.join(args.output_dir, f"server_mode_{args.label}.json")
+    with open(path, 'w') as f:
+        json.dump({'label': args.label, 'runs': runs}, f, indent=2)
+    print(f"\nSaved results to {path}")
+
+
+if __name__ == '__main__':
+    main()
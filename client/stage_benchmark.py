@@ -0,0 +1,384 @@
+#!/usr/bin/env python3
+"""
+In-process microbenchmark of each pipeline stage, without Docker.
+
+The servicer classes are imported straight from service*/app.py (each under
+its own module name, since every service calls its file app.py) and run in
+this process. The stage under test is the entry point; the stages below it
+run as gRPC servers in the same process, so its downstream calls are real:
+
+    --transport direct   the stage's handler is called as a function, so no
+                         request parsing or response encoding is measured;
+                         stages below it listen on Unix sockets
+    --transport unix     every stage, the entry included, listens on a Unix
+                         socket (the default)
+    --transport tcp      the same over localhost TCP, for comparison
+
+Each stage reports its own time from its StageTiming entry (see
+common/stage_timing.py), so the stages below it are not counted. Inputs are
+the datasets/ corpora, each repeated up to --min-size MB, and generated
+documents of the --generate sizes. With --memory, a second pass records
+each call's peak Python allocation with tracemalloc. That pass is slower and
+counts the stages below the entry too, since they run in the same process.
+
+    python client/stage_benchmark.py
+    python client/stage_benchmark.py --stages clean,analyze --generate 1MB,16MB --memory
+    python client/stage_benchmark.py --label before
+    python client/stage_benchmark.py --compare results/stages_before.json results/stages_after.json
+
+Needs the services' requirements (grpcio, grpcio-tools, protobuf, prometheus-client).
+"""
+
+import argparse
+import glob
+import importlib.util
+import json
+import os
+import random
+import resource
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+from concurrent import futures
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.join(ROOT, 'common')] + [
+    os.path.join(ROOT, d) for d in ('service1-input', 'service2-preprocess', 'service3-analysis', 'service4-report')
+]
+
+# Set before the servicers read them: no result cache answering repeated
+# inputs, and no per-request log lines in the timings
+os.environ.setdefault('RESULT_CACHE_BYTES', '0')
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+DEFAULT_DATASETS = os.path.join(ROOT, 'datasets', '*')
+MB = 1024 * 1024
+
+
+def load_stubs():
+    """Import pipeline_pb2, generating it from proto/ into a temporary directory if needed"""
+    try:
+        import pipeline_pb2  # noqa: F401
+    except ImportError:
+        from grpc_tools import protoc
+        out = tempfile.mkdtemp(prefix='pipeline_stubs_')
+        proto_dir = os.path.join(ROOT, 'proto')
+        if protoc.main(['protoc', f'-I{proto_dir}', f'--python_out={out}', f'--grpc_python_out={out}',
+                        os.path.join(proto_dir, 'pipeline.proto')]) != 0:
+            raise SystemExit("✗ Could not generate the pipeline stubs")
+        sys.path.insert(0, out)
+
+
+load_stubs()
+import grpc
+import pipeline_pb2
+import pipeline_pb2_grpc
+import channel_pool
+import log
+import stage_timing
+from stage_report import pipeline_stages
+
+
+def load_app(directory):
+    """Import service `directory`/app.py as module 'stage_benchmark_<directory>'"""
+    name = 'stage_benchmark_' + directory.replace('-', '_')
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.spec_from_file_location(name, os.path.join(ROOT, directory, 'app.py'))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+class Stage:
+    def __init__(self, key, label, directory, service, method, address_env):
+        self.key = key
+        self.label = label
+        self.directory = directory
+        self.service = service
+        self.method = method
+        # The variable the stage above reads this stage's address from
+        self.address_env = address_env
+
+    def servicer(self):
+        return getattr(load_app(self.directory), f"{self.service}Servicer")()
+
+    def add_to_server(self, server):
+        getattr(pipeline_pb2_grpc, f"add_{self.service}Servicer_to_server")(self.servicer(), server)
+
+    def stub_method(self, channel):
+        return getattr(getattr(pipeline_pb2_grpc, f"{self.service}Stub")(channel), self.method)
+
+
+# In call order; each stage calls the next one
+STAGES = [
+    Stage('input', 'Service 1', 'service1-input', 'TextInputService', 'ReceiveText', 'SERVICE1_ADDRESS'),
+    Stage('clean', 'Service 2', 'service2-preprocess', 'PreprocessService', 'CleanText', 'SERVICE2_ADDRESS'),
+    Stage('analyze', 'Service 3', 'service3-analysis', 'AnalysisService', 'AnalyzeText', 'SERVICE3_ADDRESS'),
+    Stage('report', 'Service 4', 'service4-report', 'ReportService', 'GenerateReport', 'SERVICE4_ADDRESS'),
+]
+
+
+class Pipeline:
+    """The stages from `entry` down, as in-process servers; the entry may be called directly"""
+
+    def __init__(self, entry, transport, socket_dir):
+        self.servers = []
+        self.entry = entry
+        index = STAGES.index(entry)
+        self.handler = None
+        self.stub_method = None
+        # Bottom up, so each servicer reads the address of a stage already listening
+        for stage in reversed(STAGES[index:]):
+            if stage is entry and transport == 'direct':
+                self.handler = getattr(stage.servicer(), stage.method)
+                break
+            address = self._serve(stage, transport, socket_dir)
+            os.environ[stage.address_env] = address
+            if stage is entry:
+                self.stub_method = stage.stub_method(channel_pool.get_pool().get(address))
+
+    def _serve(self, stage, transport, socket_dir):
+        server = grpc.server(futures.ThreadPoolExecutor(max_workers=4),
+                             options=channel_pool.DEFAULT_OPTIONS[:2],
+                             interceptors=stage_timing.interceptors(stage.label))
+        stage.add_to_server(server)
+        if transport == 'tcp':
+            port = server.add_insecure_port('localhost:0')
+            address = f'localhost:{port}'
+        else:
+            address = f"unix:{os.path.join(socket_dir, stage.key + '.sock')}"
+            server.add_insecure_port(address)
+        server.start()
+        self.servers.append(server)
+        return address
+
+    def call(self, request):
+        """One request through the entry stage; returns (its StageTiming rows in call order, elapsed)"""
+        start = time.perf_counter()
+        if self.handler is not None:
+            with stage_timing.measure(self.entry.label) as entry:
+                response = self.handler(request, None)
+            elapsed = time.perf_counter() - start
+            timings = list(response.timings) + entry
+        else:
+            response = self.stub_method(request, timeout=300)
+            elapsed = time.perf_counter() - start
+            timings = list(response.timings)
+        return pipeline_stages(timings, elapsed), elapsed
+
+    def stop(self):
+        for server in self.servers:
+            server.stop(None)
+
+
+def generate_document(size, seed):
+    """Mixed-case words with punctuation, from a vocabulary of a few thousand words"""
+    rng = random.Random(seed)
+    letters = 'abcdefghijklmnopqrstuvwxyz'
+    vocabulary = [''.join(rng.choice(letters) for _ in range(rng.randint(2, 10))) for _ in range(5000)]
+    words = []
+    length = 0
+    while length < size:
+        word = rng.choice(vocabulary)
+        if rng.random() < 0.1:
+            word = word.capitalize()
+        if rng.random() < 0.05:
+            word += rng.choice('.,;!?')
+        words.append(word)
+        length += len(word) + 1
+    return ' '.join(words).encode('ascii')[:size]
+
+
+def load_inputs(paths, min_size, generate, seed):
+    inputs = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            data = f.read()
+        if data:
+            copies = max(1, -(-min_size // len(data)))
+            inputs.append((os.path.basename(path), data * copies))
+    for size in generate:
+        inputs.append((f"generated {size_label(size)}", generate_document(size, seed)))
+    return inputs
+
+
+def parse_size(text):
+    text = text.strip().upper()
+    for unit, factor in (('KB', 1024), ('MB', MB), ('B', 1)):
+        if text.endswith(unit):
+            return int(float(text[:-len(unit)]) * factor)
+    return int(text)
+
+
+def size_label(size):
+    if size >= MB:
+        return f"{size / MB:g}MB"
+    return f"{size / 1024:g}KB"
+
+
+def build_request(stage, document, request_id):
+    """The request `stage` receives in the pipeline for `document`"""
+    if stage.key == 'input':
+        return pipeline_pb2.TextRequest(payload=document, request_id=request_id)
+    if stage.key == 'clean':
+        return pipeline_pb2.CleanRequest(payload=document, request_id=request_id)
+    cleaned = load_app('service2-preprocess').normalizer.normalize_bytes(document)
+    if stage.key == 'analyze':
+        return pipeline_pb2.AnalysisRequest(payload=cleaned, request_id=request_id)
+    counts = Counter(cleaned.split())
+    return pipeline_pb2.ReportRequest(
+        request_id=request_id,
+        word_frequencies=[pipeline_pb2.WordFrequency(word=w.decode(), count=c) for w, c in counts.most_common(10)],
+        total_words=sum(counts.values()),
+        unique_words=len(counts),
+        cleaned_length=len(cleaned),
+    )
+
+
+def measure(pipeline, request, repeat, warmup):
+    """Median of the entry stage's own times over `repeat` calls"""
+    for _ in range(warmup):
+        pipeline.call(request)
+    rows = []
+    elapsed = []
+    for _ in range(repeat):
+        stages, seconds = pipeline.call(request)
+        rows.append(stages[0])
+        elapsed.append(seconds)
+    result = {
+        component: statistics.median(row[component] for row in rows)
+        for component in ('deserialize', 'compute', 'serialize', 'downstream', 'total')
+    }
+    result['self'] = statistics.median(row['total'] - row['downstream'] for row in rows)
+    result['elapsed'] = statistics.median(elapsed)
+    return result
+
+
+def peak_memory(pipeline, request):
+    """Peak bytes allocated by Python while one request runs (entry and the stages below it)"""
+    tracemalloc.reset_peak()
+    before, _ = tracemalloc.get_traced_memory()
+    pipeline.call(request)
+    _, peak = tracemalloc.get_traced_memory()
+    return max(0, peak - before)
+
+
+def run(args):
+    stages = [stage for stage in STAGES if stage.key in args.stages.split(',')]
+    paths = args.paths or sorted(glob.glob(DEFAULT_DATASETS))
+    generate = [parse_size(s) for s in args.generate.split(',') if s.strip()]
+    inputs = load_inputs(paths, int(args.min_size * MB), generate, args.seed)
+    if not inputs:
+        print("⚠️  No inputs: pass corpus files or --generate sizes")
+        return None
+
+    analysis = load_app('service3-analysis')
+    if analysis.word_counter.worker_count() > 1:
+        # Start the counting processes before any gRPC threads exist
+        analysis.word_counter.warm_up()
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix='stage_benchmark_') as socket_dir:
+        for stage in stages:
+            pipeline = Pipeline(stage, args.transport, socket_dir)
+            try:
+                for name, document in inputs:
+                    request = build_request(stage, document, f"bench-{stage.key}")
+                    size = request.ByteSize()
+                    row = measure(pipeline, request, args.repeat, args.warmup)
+                    row.update(stage=stage.key, method=stage.method, input=name, bytes=size,
+                               mb_per_s=size / MB / row['self'] if row['self'] > 0 else 0,
+                               docs_per_s=1 / row['self'] if row['self'] > 0 else 0)
+                    if args.memory:
+                        tracemalloc.start()
+                        try:
+                            row['peak_alloc_mb'] = peak_memory(pipeline, request) / MB
+                        finally:
+                            tracemalloc.stop()
+                    results.append(row)
+            finally:
+                pipeline.stop()
+    return results
+
+
+def print_results(title, rows):
+    print(f"\n{title}")
+    print(f"  {'Stage':<24} {'Input':<24} {'MB':>7} {'self ms':>9} {'deser':>7} {'compute':>9} "
+          f"{'ser':>7} {'MB/s':>8} {'docs/s':>8} {'peak MB':>8}")
+    for r in rows:
+        peak = f"{r['peak_alloc_mb']:8.1f}" if 'peak_alloc_mb' in r else f"{'-':>8}"
+        print(f"  {r['stage'] + ' (' + r['method'] + ')':<24} {r['input'][:24]:<24} {r['bytes'] / MB:7.2f} "
+              f"{r['self'] * 1000:9.2f} {r['deserialize'] * 1000:7.2f} {r['compute'] * 1000:9.2f} "
+              f"{r['serialize'] * 1000:7.2f} {r['mb_per_s']:8.1f} {r['docs_per_s']:8.1f} {peak}")
+    print("  (median per request; self = the stage's own time, without the stages below it;"
+          " MB of the stage's request)")
+
+
+def compare(paths):
+    results = []
+    for path in paths:
+        with open(path) as f:
+            results.append(json.load(f))
+    for result in results:
+        print_results(f"🧪 {result['label']} ({result['transport']})", result['rows'])
+
+    base = results[0]
+    for other in results[1:]:
+        print(f"\n💡 {other['label']} vs {base['label']} (self-time MB/s ratio):")
+        before = {(r['stage'], r['input']): r for r in base['rows']}
+        for row in other['rows']:
+            match = before.get((row['stage'], row['input']))
+            if match and match['mb_per_s']:
+                print(f"  • {row['stage']:<8} {row['input'][:24]:<24} {row['mb_per_s'] / match['mb_per_s']:5.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('paths', nargs='*', help='corpus files (default: datasets/*)')
+    parser.add_argument('--stages', default=','.join(stage.key for stage in STAGES),
+                        help='comma-separated stages to benchmark (default: %(default)s)')
+    parser.add_argument('--transport', choices=('direct', 'unix', 'tcp'), default='unix')
+    parser.add_argument('--min-size', type=float, default=1, help='MB each corpus is repeated up to')
+    parser.add_argument('--generate', default='4KB,256KB,4MB',
+                        help='comma-separated sizes of generated documents ("" for none)')
+    parser.add_argument('--repeat', type=int, default=10, help='timed calls per stage and input')
+    parser.add_argument('--warmup', type=int, default=2, help='untimed calls first')
+    parser.add_argument('--memory', action='store_true', help='also record peak allocations (slower)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--label', default='stages')
+    parser.add_argument('--output-dir', default=os.path.join(ROOT, 'results'))
+    parser.add_argument('--compare', nargs='+', metavar='JSON')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(args.compare)
+        return 0
+
+    log.configure('stage_benchmark', 'local')
+    print("\n" + "=" * 80)
+    print(f"🔬 STAGE MICROBENCHMARK ({args.transport} transport, median of {args.repeat})")
+    print("=" * 80)
+    rows = run(args)
+    if rows is None:
+        return 1
+    print_results(f"🧪 {args.label} ({args.transport})", rows)
+    # Peak resident memory of the whole process, every stage included
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"\nProcess max RSS: {max_rss:.0f} MB")
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    path = os.path.join(args.output_dir, f"stages_{args.label}.json")
+    with open(path, 'w') as f:
+        json.dump({'label': args.label, 'transport': args.transport, 'max_rss_mb': max_rss, 'rows': rows},
+                  f, indent=2)
+    print(f"Saved results to {path}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
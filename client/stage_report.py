@@ -0,0 +1,107 @@
+"""
+Per-stage latency report built from the StageTiming entries of responses.
+
+Every stage appends its timing to the response (see common/stage_timing.py),
+so a TextResponse lists the whole chain, innermost stage first. The time a
+caller spent waiting on the next stage that the stage itself does not account
+for is the hop: network, transport framing and HTTP/2 flow control between
+the two processes.
+"""
+
+from collections import defaultdict
+
+from server_mode_benchmark import percentile
+
+COMPONENTS = ('queue_wait', 'deserialize', 'compute', 'serialize', 'hop')
+BAR_WIDTH = 40
+
+
+def pipeline_stages(timings, elapsed):
+    """Stage rows in call order for one response; `elapsed` is the client's end-to-end time"""
+    stages = []
+    caller_downstream = elapsed
+    for timing in reversed(timings):
+        stages.append({
+            'stage': timing.stage,
+            'queue_wait': timing.queue_wait,
+            'deserialize': timing.deserialize,
+            'compute': timing.compute,
+            'downstream': timing.downstream,
+            'serialize': timing.serialize,
+            'total': timing.total,
+            'hop': max(0.0, caller_downstream - timing.total),
+        })
+        caller_downstream = timing.downstream
+    return stages
+
+
+def tier(stage):
+    """'Service 2-b' -> 'Service 2'; load balancers already name their tier"""
+    if stage.startswith('Service '):
+        return stage.rsplit('-', 1)[0]
+    return stage
+
+
+def print_waterfall(stages, elapsed, title="Stage waterfall"):
+    """Nested bars for one request, assuming each stage computes before it calls the next"""
+    if not stages:
+        print("\n⏱  No stage timings in the response (servers predate stage timing?)")
+        return
+    scale = BAR_WIDTH / elapsed if elapsed > 0 else 0
+    print(f"\n⏱  {title} ({elapsed * 1000:.1f} ms end to end)")
+    print(f"  {'Stage':24s} {'hop':>7s} {'queue':>7s} {'deser':>7s} {'compute':>8s} {'ser':>7s} {'total':>8s}")
+    start = 0.0
+    for stage in stages:
+        start += stage['hop'] / 2
+        bar = (' ' * int(start * scale)
+               + '░' * max(0, int(stage['queue_wait'] * scale))
+               + '█' * max(1, int((stage['deserialize'] + stage['compute'] + stage['serialize']) * scale))
+               + '─' * int(stage['downstream'] * scale))
+        print(f"  {stage['stage'][:24]:24s} {stage['hop'] * 1000:7.1f} {stage['queue_wait'] * 1000:7.1f} "
+              f"{stage['deserialize'] * 1000:7.1f} {stage['compute'] * 1000:8.1f} "
+              f"{stage['serialize'] * 1000:7.1f} {stage['total'] * 1000:8.1f}  |{bar[:BAR_WIDTH]}")
+        start += stage['queue_wait'] + stage['deserialize'] + stage['compute']
+    print("  (ms; ░ queue wait, █ own work, ─ waiting on the next stage)")
+
+
+def stage_percentiles(pipelines):
+    """Per-tier p50/p95/p99 of every component (ms) over many requests' stage lists"""
+    samples = defaultdict(lambda: defaultdict(list))
+    order = []
+    for stages in pipelines:
+        for stage in stages:
+            name = tier(stage['stage'])
+            if name not in samples:
+                order.append(name)
+            for component in COMPONENTS:
+                samples[name][component].append(stage[component] * 1000)
+            samples[name]['self'].append((stage['total'] - stage['downstream']) * 1000)
+
+    summary = {}
+    for name in order:
+        summary[name] = {}
+        for component, values in samples[name].items():
+            values.sort()
+            summary[name][component] = {
+                'p50': percentile(values, 50),
+                'p95': percentile(values, 95),
+                'p99': percentile(values, 99),
+            }
+        summary[name]['count'] = len(samples[name]['self'])
+    return summary
+
+
+def print_stage_percentiles(pipelines, title="Per-stage latency percentiles"):
+    summary = stage_percentiles(pipelines)
+    if not summary:
+        return summary
+    print(f"\n📶 {title} (ms, p50 / p95 / p99)")
+    print(f"  {'Stage':24s} {'n':>5s} {'hop':>20s} {'queue':>20s} {'compute':>20s} {'self':>20s}")
+    for name, row in summary.items():
+        cells = ' '.join(
+            f"{row[c]['p50']:6.1f}/{row[c]['p95']:6.1f}/{row[c]['p99']:6.1f}"
+            for c in ('hop', 'queue_wait', 'compute', 'self')
+        )
+        print(f"  {name[:24]:24s} {row['count']:5d} {cells}")
+    print("  (self = the stage's own time: queue wait, parsing, compute and encoding)")
+    return summary
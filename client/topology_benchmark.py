@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Benchmark comparing the proxied and direct pipeline topologies.
+
+proxied  client → LB1 → S1 → LB2 → S2 → LB3 → S3 → LB4 → S4 (eight hops)
+direct   every hop lists all instances of the next stage and balances
+         across them with gRPC's round_robin policy (four hops)
+
+Small requests are used by default so the per-hop overhead is not hidden by
+the word count, and each one is unique so Service 1's result cache does not
+skip the rest of the pipeline. Run it once per topology with --label, then
+--compare the saved JSON files:
+
+    python topology_benchmark.py --label proxied
+    SERVICE1_ADDRESS=service1a:8051,service1b:8055,... python topology_benchmark.py --label direct
+    python topology_benchmark.py --compare results/topology_proxied.json results/topology_direct.json
+"""
+
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, '/app')
+from server_mode_benchmark import run_load, print_table
+
+
+def compare(paths):
+    results = []
+    for path in paths:
+        with open(path) as f:
+            results.append(json.load(f))
+    for result in results:
+        print_table(f"🧪 {result['label']} ({result['address']})", result['runs'])
+
+    if len(results) == 2:
+        base, other = results
+        print(f"\n💡 {other['label']} vs {base['label']} (throughput ratio, p50 ratio, p99 ratio):")
+        for a, b in zip(base['runs'], other['runs']):
+            ratio = b['throughput_rps'] / a['throughput_rps'] if a['throughput_rps'] else 0
+            p50 = b['p50_ms'] / a['p50_ms'] if a['p50_ms'] else 0
+            p99 = b['p99_ms'] / a['p99_ms'] if a['p99_ms'] else 0
+            print(f"  • concurrency {a['concurrency']:4d}: {ratio:5.2f}x throughput, "
+                  f"{p50:5.2f}x p50, {p99:5.2f}x p99")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--address', default=os.getenv('SERVICE1_ADDRESS', 'service1-loadbalancer:8061'))
+    parser.add_argument('--label', default=os.getenv('TOPOLOGY', 'proxied'))
+    parser.add_argument('--concurrency', default='1,8,32',
+                        help='comma-separated in-flight request counts')
+    parser.add_argument('--requests', type=int, default=300, help='requests per concurrency level')
+    parser.add_argument('--text-size', type=int, default=4 * 1024, help='characters per request')
+    parser.add_argument('--output-dir', default='/app/results')
+    parser.add_argument('--compare', nargs='+', metavar='JSON')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(args.compare)
+        return
+
+    print("\n" + "=" * 80)
+    print(f"🚀 TOPOLOGY BENCHMARK ({args.label}: {args.address})")
+    print("=" * 80)
+
+    runs = []
+    for concurrency in [int(c) for c in args.concurrency.split(',')]:
+        print(f"Running {args.requests} requests at concurrency {concurrency}...")
+        runs.append(run_load(args.address, concurrency, args.requests, args.text_size, unique_payloads=True))
+
+    print_table(f"🧪 {args.label} ({args.address})", runs)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    path = os.path.join(args.output_dir, f"topology_{args.label}.json")
+    with open(path, 'w') as f:
+        json.dump({'label': args.label, 'address': args.address, 'runs': runs}, f, indent=2)
+    print(f"\nSaved results to {path}")
+
+
+if __name__ == '__main__':
+    main()
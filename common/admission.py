@@ -0,0 +1,211 @@
+"""
+Admission control: shed load with RESOURCE_EXHAUSTED instead of queueing it.
+
+Without limits, requests wait in the thread pool's queue until their
+deadline passes and latency grows without bound under overload. Every
+server now bounds two things and rejects anything over them at once, so the
+caller (usually a load balancer) can send it to another instance:
+
+    MAX_CONCURRENT_RPCS   RPCs running or waiting for a worker thread,
+                          enforced by gRPC (maximum_concurrent_rpcs); see
+                          server_mode.max_concurrent_rpcs()
+    MAX_INFLIGHT_BYTES    request bytes held by running RPCs (0: no limit).
+                          A request is always admitted when nothing else is
+                          in flight, so one document up to the message size
+                          limit still fits.
+
+Client-streaming requests are admitted on their first frame; later frames
+count towards the budget as they arrive but are never rejected mid-stream.
+Health checks are never shed here.
+
+    server = grpc.server(executor, options=server_options,
+                         maximum_concurrent_rpcs=server_mode.max_concurrent_rpcs(),
+                         interceptors=admission.interceptors('Service 1-a'))
+    server = grpc.aio.server(..., interceptors=admission.aio_interceptors('Service 1-a'))
+"""
+
+import os
+import threading
+
+import grpc
+
+import log
+
+EXEMPT_PREFIX = '/grpc.health.v1.Health/'
+
+
+def max_inflight_bytes():
+    return int(os.getenv('MAX_INFLIGHT_BYTES', str(256 * 1024 * 1024)))
+
+
+def message_size(message):
+    """Size of a request: raw bytes in the load balancers, a protobuf message elsewhere"""
+    if message is None:
+        return 0
+    if isinstance(message, (bytes, bytearray, memoryview)):
+        return len(message)
+    return message.ByteSize()
+
+
+class ByteBudget:
+    """Request bytes currently held by running RPCs"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.in_flight = 0
+        self.admitted = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def try_acquire(self, size):
+        with self._lock:
+            if self.limit > 0 and self.in_flight and self.in_flight + size > self.limit:
+                self.rejected += 1
+                return False
+            self.in_flight += size
+            self.admitted += 1
+            return True
+
+    def add(self, size):
+        """Count bytes of an already admitted stream"""
+        with self._lock:
+            self.in_flight += size
+
+    def release(self, size):
+        with self._lock:
+            self.in_flight -= size
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'limit': self.limit,
+                'in_flight': self.in_flight,
+                'admitted': self.admitted,
+                'rejected': self.rejected,
+            }
+
+
+class _Admission:
+    def __init__(self, name, budget):
+        self.name = name
+        self.budget = budget
+
+    def _details(self, size):
+        return (f"{self.name} is over its in-flight byte budget "
+                f"({self.budget.in_flight:,} + {size:,} > {self.budget.limit:,} bytes)")
+
+    def _shed(self, size):
+        details = self._details(size)
+        log.get(self.name).warning(f"⛔ Shedding request: {details}")
+        return details
+
+    def _wrap(self, handler_call_details, handler):
+        if handler is None or self.budget.limit <= 0 or handler_call_details.method.startswith(EXEMPT_PREFIX):
+            return handler
+        if handler.response_streaming:
+            return handler
+        if handler.request_streaming:
+            return grpc.stream_unary_rpc_method_handler(
+                self._admit_stream(handler.stream_unary),
+                request_deserializer=handler.request_deserializer,
+                response_serializer=handler.response_serializer,
+            )
+        return grpc.unary_unary_rpc_method_handler(
+            self._admit_unary(handler.unary_unary),
+            request_deserializer=handler.request_deserializer,
+            response_serializer=handler.response_serializer,
+        )
+
+
+class AdmissionInterceptor(_Admission, grpc.ServerInterceptor):
+    """Byte-budget admission for threaded servers"""
+
+    def intercept_service(self, continuation, handler_call_details):
+        return self._wrap(handler_call_details, continuation(handler_call_details))
+
+    def _admit_unary(self, behavior):
+        def admitted(request, context):
+            size = message_size(request)
+            if not self.budget.try_acquire(size):
+                context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, self._shed(size))
+            try:
+                return behavior(request, context)
+            finally:
+                self.budget.release(size)
+        return admitted
+
+    def _admit_stream(self, behavior):
+        def admitted(request_iterator, context):
+            first_frame = next(request_iterator, None)
+            held = [message_size(first_frame)]
+            if not self.budget.try_acquire(held[0]):
+                context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, self._shed(held[0]))
+
+            def frames():
+                if first_frame is not None:
+                    yield first_frame
+                for frame in request_iterator:
+                    size = message_size(frame)
+                    self.budget.add(size)
+                    held[0] += size
+                    yield frame
+
+            try:
+                return behavior(frames(), context)
+            finally:
+                self.budget.release(held[0])
+        return admitted
+
+
+class AsyncAdmissionInterceptor(_Admission, grpc.aio.ServerInterceptor):
+    """Byte-budget admission for grpc.aio servers"""
+
+    async def intercept_service(self, continuation, handler_call_details):
+        return self._wrap(handler_call_details, await continuation(handler_call_details))
+
+    def _admit_unary(self, behavior):
+        async def admitted(request, context):
+            size = message_size(request)
+            if not self.budget.try_acquire(size):
+                await context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, self._shed(size))
+            try:
+                return await behavior(request, context)
+            finally:
+                self.budget.release(size)
+        return admitted
+
+    def _admit_stream(self, behavior):
+        async def admitted(request_iterator, context):
+            frames_in = request_iterator.__aiter__()
+            try:
+                first_frame = await frames_in.__anext__()
+            except StopAsyncIteration:
+                first_frame = None
+            held = [message_size(first_frame)]
+            if not self.budget.try_acquire(held[0]):
+                await context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, self._shed(held[0]))
+
+            async def frames():
+                if first_frame is not None:
+                    yield first_frame
+                async for frame in frames_in:
+                    size = message_size(frame)
+                    self.budget.add(size)
+                    held[0] += size
+                    yield frame
+
+            try:
+                return await behavior(frames(), context)
+            finally:
+                self.budget.release(held[0])
+        return admitted
+
+
+def interceptors(name, limit=None):
+    """Server interceptors for a threaded server; `name` prefixes log lines"""
+    return [AdmissionInterceptor(name, ByteBudget(max_inflight_bytes() if limit is None else limit))]
+
+
+def aio_interceptors(name, limit=None):
+    """grpc.aio variant of interceptors()"""
+    return [AsyncAdmissionInterceptor(name, ByteBudget(max_inflight_bytes() if limit is None else limit))]
@@ -0,0 +1,162 @@
+"""
+Backend selection policies for the load balancers.
+
+Every policy tracks what is in flight on each backend (requests and
+request bytes) under one lock, so the balancers' worker threads no longer
+race on a shared index. Pick a policy with LB_POLICY:
+
+    round_robin        next backend in turn (the original behaviour)
+    least_outstanding  backend with the fewest requests in flight
+    power_of_two       two random backends, the less loaded one wins
+    least_bytes        backend with the fewest request bytes in flight, so
+                       one 30MB document weighs more than many small ones
+
+Usage:
+
+    backend = balancer.pick(size, exclude=tried)
+    with balancer.track(backend, size):
+        ...call backend...
+"""
+
+import itertools
+import os
+import random
+import threading
+from contextlib import contextmanager
+
+
+class Balancer:
+    """Base policy: in-flight bookkeeping shared by every policy"""
+
+    name = 'base'
+
+    def __init__(self, backends):
+        self._lock = threading.Lock()
+        self.backends = []
+        self.outstanding = {}
+        self.bytes_in_flight = {}
+        self.picks = {}
+        self.set_backends(backends)
+
+    def set_backends(self, backends):
+        """Replace the backends in rotation
+
+        Counters are kept for backends that leave, so requests still in flight
+        on them are accounted for correctly when they finish.
+        """
+        with self._lock:
+            self.backends = list(backends)
+            for backend in self.backends:
+                self.outstanding.setdefault(backend, 0)
+                self.bytes_in_flight.setdefault(backend, 0)
+                self.picks.setdefault(backend, 0)
+
+    def pick(self, size=0, exclude=()):
+        """Choose a backend for a request of `size` bytes, skipping `exclude`"""
+        with self._lock:
+            candidates = [b for b in self.backends if b not in exclude]
+            if not candidates:
+                return None
+            backend = self._choose(candidates, size)
+            self.picks[backend] += 1
+            return backend
+
+    def _choose(self, candidates, size):
+        raise NotImplementedError
+
+    def begin(self, backend, size=0):
+        """Count a request as in flight on `backend` (for calls that outlive a block)"""
+        with self._lock:
+            self.outstanding[backend] += 1
+            self.bytes_in_flight[backend] += size
+
+    def end(self, backend, size=0):
+        with self._lock:
+            self.outstanding[backend] -= 1
+            self.bytes_in_flight[backend] -= size
+
+    @contextmanager
+    def track(self, backend, size=0):
+        """Count a request as in flight on `backend` for the duration of the block"""
+        self.begin(backend, size)
+        try:
+            yield
+        finally:
+            self.end(backend, size)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                backend: {
+                    'outstanding': self.outstanding[backend],
+                    'bytes_in_flight': self.bytes_in_flight[backend],
+                    'picks': self.picks[backend],
+                }
+                for backend in self.backends
+            }
+
+
+class RoundRobin(Balancer):
+    name = 'round_robin'
+
+    def __init__(self, backends):
+        super().__init__(backends)
+        self._counter = itertools.count()
+
+    def _choose(self, candidates, size):
+        # Walk the full list so excluded backends keep their place in the rotation
+        for _ in range(len(self.backends)):
+            backend = self.backends[next(self._counter) % len(self.backends)]
+            if backend in candidates:
+                return backend
+        return candidates[0]
+
+
+class LeastOutstanding(Balancer):
+    name = 'least_outstanding'
+
+    def __init__(self, backends):
+        super().__init__(backends)
+        self._counter = itertools.count()
+
+    def _choose(self, candidates, size):
+        # Rotate the starting point so ties do not always go to the first backend
+        offset = next(self._counter) % len(candidates)
+        rotated = candidates[offset:] + candidates[:offset]
+        return min(rotated, key=lambda b: self.outstanding[b])
+
+
+class PowerOfTwo(Balancer):
+    name = 'power_of_two'
+
+    def _choose(self, candidates, size):
+        if len(candidates) == 1:
+            return candidates[0]
+        first, second = random.sample(candidates, 2)
+        return first if self.outstanding[first] <= self.outstanding[second] else second
+
+
+class LeastBytes(Balancer):
+    name = 'least_bytes'
+
+    def __init__(self, backends):
+        super().__init__(backends)
+        self._counter = itertools.count()
+
+    def _choose(self, candidates, size):
+        offset = next(self._counter) % len(candidates)
+        rotated = candidates[offset:] + candidates[:offset]
+        return min(rotated, key=lambda b: (self.bytes_in_flight[b], self.outstanding[b]))
+
+
+POLICIES = {cls.name: cls for cls in (RoundRobin, LeastOutstanding, PowerOfTwo, LeastBytes)}
+
+
+def make_balancer(backends, policy=None):
+    """Build the policy named by `policy` (default: LB_POLICY, else round_robin)"""
+    if policy is None:
+        policy = os.getenv('LB_POLICY', 'round_robin')
+    try:
+        return POLICIES[policy.lower()](backends)
+    except KeyError:
+        raise ValueError(f"Unknown LB_POLICY '{policy}', expected one of {sorted(POLICIES)}")
@@ -0,0 +1,47 @@
+"""
+Budgets that cap extra load (hedges, retries) as a share of real requests.
+
+Every request adds `percent`/100 of a token, up to `burst` tokens; each
+extra attempt spends a whole token. With percent=10, at most about one
+extra attempt goes out per ten requests however bad things get, while a
+short burst of up to `burst` extra attempts is still allowed after a quiet
+period.
+"""
+
+import threading
+
+
+class RequestBudget:
+    def __init__(self, percent, burst=10):
+        self.ratio = percent / 100.0
+        self.burst = float(burst)
+        self._tokens = float(burst)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.spent = 0
+        self.denied = 0
+
+    def on_request(self):
+        """Credit the budget for one real request"""
+        with self._lock:
+            self.requests += 1
+            self._tokens = min(self.burst, self._tokens + self.ratio)
+
+    def try_spend(self):
+        """Take one token for an extra attempt; False if the budget is used up"""
+        with self._lock:
+            if self._tokens >= 1.0:
+                self._tokens -= 1.0
+                self.spent += 1
+                return True
+            self.denied += 1
+            return False
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'spent': self.spent,
+                'denied': self.denied,
+                'tokens': self._tokens,
+            }
@@ -0,0 +1,232 @@
+"""
+Shared pool of long-lived gRPC channels.
+
+Every hop used to open a fresh channel per request, paying for a TCP and
+HTTP/2 handshake each time. The pool keeps a small set of channels per
+target alive between requests so connections (and their flow-control
+windows) are reused.
+
+A target can also name every instance of a stage, for client-side load
+balancing without a proxy hop: either a comma-separated list
+('service2a:8052,service2b:8056') or a 'dns:///' name with several
+records. Such channels use gRPC's round_robin policy across the instances
+and retry UNAVAILABLE-style failures themselves (RETRY_* settings, as in
+the load balancers), since no load balancer is there to fail over.
+"""
+
+import asyncio
+import itertools
+import json
+import os
+import socket
+import threading
+import time
+
+import grpc
+
+MAX_MESSAGE_LENGTH = 100 * 1024 * 1024
+
+DEFAULT_OPTIONS = [
+    ('grpc.max_send_message_length', MAX_MESSAGE_LENGTH),
+    ('grpc.max_receive_message_length', MAX_MESSAGE_LENGTH),
+    ('grpc.keepalive_time_ms', 30000),
+    ('grpc.keepalive_timeout_ms', 10000),
+    ('grpc.keepalive_permit_without_calls', 1),
+    ('grpc.http2.max_pings_without_data', 0),
+    # Without a local subchannel pool, channels with identical arguments
+    # share one connection, which defeats having several per target.
+    ('grpc.use_local_subchannel_pool', 1),
+]
+
+
+def is_balanced(target):
+    """True for targets that name several instances of a stage"""
+    return ',' in target or target.startswith('dns:')
+
+
+def resolve_target(target):
+    """'service2a:8052,service2b:8056' -> 'ipv4:10.0.0.5:8052,10.0.0.6:8056'
+
+    gRPC only accepts address lists as IP literals, so the host names are
+    resolved here, again whenever the channel is rebuilt. Other targets are
+    returned unchanged.
+    """
+    if ',' not in target or target.startswith(('ipv4:', 'ipv6:')):
+        return target
+    addresses = {socket.AF_INET: [], socket.AF_INET6: []}
+    for entry in target.split(','):
+        host, port = entry.strip().rsplit(':', 1)
+        for family, _, _, _, sockaddr in socket.getaddrinfo(host, port, type=socket.SOCK_STREAM):
+            address = f'[{sockaddr[0]}]:{port}' if family == socket.AF_INET6 else f'{sockaddr[0]}:{port}'
+            if family in addresses and address not in addresses[family]:
+                addresses[family].append(address)
+    # One scheme per target, so a list is either all IPv4 or all IPv6
+    if addresses[socket.AF_INET]:
+        return 'ipv4:' + ','.join(addresses[socket.AF_INET])
+    return 'ipv6:' + ','.join(addresses[socket.AF_INET6])
+
+
+def balanced_options():
+    """Channel options for is_balanced() targets: round_robin plus gRPC's own retries"""
+    codes = [c.strip().upper() for c in os.getenv('RETRY_CODES', 'UNAVAILABLE,RESOURCE_EXHAUSTED,ABORTED').split(',')
+             if c.strip()]
+    service_config = {
+        'loadBalancingConfig': [{'round_robin': {}}],
+        'methodConfig': [{
+            'name': [{}],
+            'retryPolicy': {
+                # gRPC accepts 2-5 attempts
+                'maxAttempts': min(5, max(2, int(os.getenv('RETRY_MAX_ATTEMPTS', '3')))),
+                'initialBackoff': f"{float(os.getenv('RETRY_INITIAL_BACKOFF', '0.05'))}s",
+                'maxBackoff': f"{float(os.getenv('RETRY_MAX_BACKOFF', '1'))}s",
+                'backoffMultiplier': float(os.getenv('RETRY_BACKOFF_MULTIPLIER', '2')),
+                'retryableStatusCodes': codes,
+            },
+        }],
+        # gRPC's retry budget: failures cost a token, successes earn back tokenRatio
+        'retryThrottling': {
+            'maxTokens': 10,
+            'tokenRatio': float(os.getenv('RETRY_BUDGET_PERCENT', '20')) / 100,
+        },
+    }
+    return [('grpc.service_config', json.dumps(service_config))]
+
+
+class _PooledChannel:
+    def __init__(self, channel):
+        self.channel = channel
+        self.last_used = time.monotonic()
+
+
+class ChannelPool:
+    """Keeps `channels_per_target` channels per backend and hands them out round-robin."""
+
+    def __init__(self, channels_per_target=None, idle_timeout=None, options=None):
+        if channels_per_target is None:
+            channels_per_target = int(os.getenv('GRPC_CHANNELS_PER_TARGET', '2'))
+        if idle_timeout is None:
+            idle_timeout = float(os.getenv('GRPC_CHANNEL_IDLE_TIMEOUT', '300'))
+        self.channels_per_target = max(1, channels_per_target)
+        self.idle_timeout = idle_timeout
+        self.options = list(DEFAULT_OPTIONS if options is None else options)
+        self._lock = threading.Lock()
+        self._channels = {}   # target -> list of _PooledChannel (None until first use)
+        self._counters = {}   # target -> round-robin counter
+        self._last_sweep = time.monotonic()
+
+    def get(self, target):
+        """Return a live channel to `target`, creating or replacing it if needed."""
+        self._maybe_evict_idle()
+        with self._lock:
+            slots = self._channels.get(target)
+            if slots is None:
+                slots = [None] * self.channels_per_target
+                self._channels[target] = slots
+                self._counters[target] = itertools.count()
+            index = next(self._counters[target]) % self.channels_per_target
+            pooled = slots[index]
+            if pooled is None:
+                pooled = _PooledChannel(self._new_channel(target, index))
+                slots[index] = pooled
+            pooled.last_used = time.monotonic()
+            return pooled.channel
+
+    def _channel_args(self, target, index):
+        # A distinct argument per slot keeps each slot on its own connection.
+        options = self.options + [('grpc.channel_pool_slot', index)]
+        if is_balanced(target):
+            options += balanced_options()
+        return resolve_target(target), options
+
+    def _new_channel(self, target, index):
+        address, options = self._channel_args(target, index)
+        return grpc.insecure_channel(address, options=options)
+
+    def invalidate(self, target, channel=None):
+        """Drop channels to `target` so the next `get` reconnects.
+
+        With `channel` given only that slot is replaced; otherwise every
+        channel to the target is closed.
+        """
+        to_close = []
+        with self._lock:
+            slots = self._channels.get(target)
+            if not slots:
+                return
+            for i, pooled in enumerate(slots):
+                if pooled is not None and (channel is None or pooled.channel is channel):
+                    to_close.append(pooled.channel)
+                    slots[i] = None
+        for ch in to_close:
+            self._close_channel(ch)
+
+    def _maybe_evict_idle(self):
+        if self.idle_timeout <= 0:
+            return
+        now = time.monotonic()
+        # Sweep at most a few times per idle period; `get` is on the hot path.
+        if now - self._last_sweep < self.idle_timeout / 4:
+            return
+        to_close = []
+        with self._lock:
+            self._last_sweep = now
+            for slots in self._channels.values():
+                for i, pooled in enumerate(slots):
+                    if pooled is not None and now - pooled.last_used > self.idle_timeout:
+                        to_close.append(pooled.channel)
+                        slots[i] = None
+        for ch in to_close:
+            self._close_channel(ch)
+
+    def _close_channel(self, channel):
+        channel.close()
+
+    def close(self):
+        with self._lock:
+            channels = [p.channel for slots in self._channels.values() for p in slots if p is not None]
+            self._channels.clear()
+            self._counters.clear()
+        for ch in channels:
+            self._close_channel(ch)
+
+
+class AioChannelPool(ChannelPool):
+    """Same pool for grpc.aio servers; channels belong to the running event loop."""
+
+    def _new_channel(self, target, index):
+        address, options = self._channel_args(target, index)
+        return grpc.aio.insecure_channel(address, options=options)
+
+    def _close_channel(self, channel):
+        # aio channels close asynchronously; don't block the caller on it
+        asyncio.get_running_loop().create_task(channel.close())
+
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Process-wide pool shared by every servicer and client in the process."""
+    global _default_pool
+    if _default_pool is None:
+        with _default_pool_lock:
+            if _default_pool is None:
+                _default_pool = ChannelPool()
+    return _default_pool
+
+
+_default_aio_pool = None
+
+
+def get_aio_pool():
+    """Process-wide aio pool; only use it from the server's event loop."""
+    global _default_aio_pool
+    if _default_aio_pool is None:
+        _default_aio_pool = AioChannelPool()
+    return _default_aio_pool
+
+
+def is_connection_error(error):
+    """True when an RpcError means the channel itself should be rebuilt."""
+    return isinstance(error, grpc.RpcError) and error.code() == grpc.StatusCode.UNAVAILABLE
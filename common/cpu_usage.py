@@ -0,0 +1,34 @@
+"""
+CPU time used by this container, from its cgroup.
+
+Unlike time.process_time() this includes worker processes (Service 3's
+parallel word counting), so it is what benchmarks compare across instances.
+Run as a script it prints the seconds, for use through `docker exec`:
+
+    docker exec grpc-service3a python cpu_usage.py
+"""
+
+CGROUP_V2_STAT = '/sys/fs/cgroup/cpu.stat'
+CGROUP_V1_USAGE = '/sys/fs/cgroup/cpuacct/cpuacct.usage'
+
+
+def cgroup_cpu_seconds():
+    """Total CPU seconds of the container's cgroup; None when not in a container"""
+    try:
+        with open(CGROUP_V2_STAT) as f:
+            for line in f:
+                key, value = line.split()
+                if key == 'usage_usec':
+                    return int(value) / 1e6
+    except OSError:
+        pass
+    try:
+        with open(CGROUP_V1_USAGE) as f:
+            return int(f.read()) / 1e9
+    except OSError:
+        return None
+
+
+if __name__ == '__main__':
+    seconds = cgroup_cpu_seconds()
+    print('unknown' if seconds is None else f"{seconds:.3f}")
@@ -0,0 +1,98 @@
+"""
+Deadline propagation and cancellation between hops.
+
+Instead of a fixed timeout per hop, each downstream call gets what is left
+of the caller's deadline (context.time_remaining()) minus DEADLINE_MARGIN
+seconds kept for the hop's own work, capped at the hop's old fixed timeout.
+A caller that gives up after 10s therefore never leaves Service 4 working
+for 300s.
+
+Threaded servers also cancel the downstream call when the incoming RPC
+ends early (the client cancelled or its deadline passed), so the rest of
+the chain stops working on a result nobody will read; call_downstream()
+does both. grpc.aio servers get cancellation for free: the handler task is
+cancelled, and the call it is awaiting with it.
+
+    response = deadline.call_downstream(context, stub.CleanText, request, 300)
+    response = await stub.CleanText(request, timeout=deadline.downstream_timeout(context, 300))
+"""
+
+import os
+
+import grpc
+
+MIN_TIMEOUT = 0.001
+
+# Statuses passed back upstream as-is; anything else becomes INTERNAL.
+# RESOURCE_EXHAUSTED is an instance shedding load (admission.py): overload
+# reaches the caller as backpressure rather than as a failure.
+PROPAGATED_CODES = (
+    grpc.StatusCode.DEADLINE_EXCEEDED,
+    grpc.StatusCode.CANCELLED,
+    grpc.StatusCode.RESOURCE_EXHAUSTED,
+)
+
+
+class DeadlineExceeded(grpc.RpcError):
+    """Raised instead of starting a downstream call when no time is left"""
+
+    def code(self):
+        return grpc.StatusCode.DEADLINE_EXCEEDED
+
+    def details(self):
+        return "Deadline exceeded before calling downstream"
+
+
+def margin():
+    """Seconds of the caller's deadline kept back for local work"""
+    return float(os.getenv('DEADLINE_MARGIN', '0.05'))
+
+
+def downstream_timeout(context, default):
+    """Timeout for a downstream call made while serving `context` (None: `default`)
+
+    Raises DeadlineExceeded if the caller's deadline leaves no time for it.
+    """
+    if context is None:
+        return default
+    remaining = context.time_remaining()
+    # No deadline: None under grpc.aio, a huge number under threaded servers
+    if remaining is None:
+        return default
+    timeout = min(default, remaining - margin())
+    if timeout < MIN_TIMEOUT:
+        raise DeadlineExceeded()
+    return timeout
+
+
+def expired(context):
+    """True once the incoming RPC was cancelled or has no time left for a downstream call"""
+    if context is None:
+        return False
+    is_active = getattr(context, 'is_active', None)
+    if is_active is not None and not is_active():
+        return True
+    remaining = context.time_remaining()
+    return remaining is not None and remaining - margin() < MIN_TIMEOUT
+
+
+def cancel_with(context, future):
+    """Cancel `future` (a downstream call) when the incoming RPC terminates"""
+    if context is not None and not context.add_callback(future.cancel):
+        future.cancel()
+
+
+def call_downstream(context, multicallable, request, default_timeout, **kwargs):
+    """Blocking call that inherits the caller's deadline and is cancelled with it
+
+    `request` may be a message or, for client-streaming methods, an iterator.
+    """
+    future = multicallable.future(request, timeout=downstream_timeout(context, default_timeout), **kwargs)
+    cancel_with(context, future)
+    return future.result()
+
+
+def upstream_code(error, default=grpc.StatusCode.INTERNAL):
+    """Status to report upstream for a failed downstream call"""
+    code = error.code() if isinstance(error, grpc.RpcError) else None
+    return code if code in PROPAGATED_CODES else default
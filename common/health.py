@@ -0,0 +1,46 @@
+"""
+Standard gRPC health checking (grpc.health.v1) for every server.
+
+Each process reports SERVING for the services it implements and for the
+server as a whole (""), so the load balancers, and any other gRPC tooling,
+can probe instances with the standard Health/Check call:
+
+    health.add_health_servicer(server, 'pipeline.TextInputService')
+    await health.add_aio_health_servicer(server, 'pipeline.TextInputService')   # grpc.aio
+"""
+
+from grpc_health.v1 import health as grpc_health
+from grpc_health.v1 import health_pb2
+from grpc_health.v1 import health_pb2_grpc
+
+SERVING = health_pb2.HealthCheckResponse.SERVING
+NOT_SERVING = health_pb2.HealthCheckResponse.NOT_SERVING
+
+
+def add_health_servicer(server, *service_names):
+    """Register a health servicer reporting SERVING for `service_names`"""
+    servicer = grpc_health.HealthServicer()
+    for name in (grpc_health.OVERALL_HEALTH,) + service_names:
+        servicer.set(name, SERVING)
+    health_pb2_grpc.add_HealthServicer_to_server(servicer, server)
+    return servicer
+
+
+async def add_aio_health_servicer(server, *service_names):
+    """grpc.aio variant of add_health_servicer()"""
+    servicer = grpc_health.aio.HealthServicer()
+    for name in (grpc_health.OVERALL_HEALTH,) + service_names:
+        await servicer.set(name, SERVING)
+    health_pb2_grpc.add_HealthServicer_to_server(servicer, server)
+    return servicer
+
+
+def check_future(channel, service='', timeout=1.0):
+    """Start a Health/Check call on `channel`; resolve it with is_serving()"""
+    stub = health_pb2_grpc.HealthStub(channel)
+    return stub.Check.future(health_pb2.HealthCheckRequest(service=service), timeout=timeout)
+
+
+def is_serving(future):
+    """True if a check_future() call answered SERVING; raises grpc.RpcError on failure"""
+    return future.result().status == SERVING
@@ -0,0 +1,178 @@
+"""
+Hedged unary calls: if the first attempt is slower than usual, race a
+duplicate against it and keep whichever answers first.
+
+The hedge delay is the HEDGE_PERCENTILE (e.g. 95) of recent successful
+latencies, measured per MB of payload (payloads under 64KB count as 64KB)
+and scaled to the request's size, so a 30MB document is not hedged just for
+being bigger than the last one. Hedging starts once HEDGE_MIN_SAMPLES
+latencies have been seen. Hedges are capped by a budget of
+HEDGE_BUDGET_PERCENT of requests (see budget.py). The losing attempt is
+cancelled. HEDGE_PERCENTILE=0 (the default) turns hedging off.
+
+    hedger = hedging.Hedger()
+    response = hedging.call_hedged(start, hedger, size)              # threads
+    response = await hedging.call_hedged_aio(start, hedger, size)    # grpc.aio
+
+`start(hedge)` begins one attempt and returns a grpc future (threads) or an
+awaitable (aio), or None when there is nowhere to send a hedge.
+"""
+
+import asyncio
+import collections
+import os
+import queue
+import threading
+import time
+
+import grpc
+
+import budget
+
+MB = 1024 * 1024
+MIN_NORMALIZED_SIZE = 64 * 1024
+
+
+class Hedger:
+    """Recent latency distribution, hedge delay and hedge budget for one destination"""
+
+    def __init__(self, percentile=None, budget_percent=None, window=None, min_samples=None):
+        if percentile is None:
+            percentile = float(os.getenv('HEDGE_PERCENTILE', '0'))
+        if budget_percent is None:
+            budget_percent = float(os.getenv('HEDGE_BUDGET_PERCENT', '10'))
+        self.percentile = percentile
+        self.min_samples = min_samples or int(os.getenv('HEDGE_MIN_SAMPLES', '10'))
+        self.min_delay = float(os.getenv('HEDGE_MIN_DELAY', '0.005'))
+        self.budget = budget.RequestBudget(budget_percent)
+        self._samples = collections.deque(maxlen=window or int(os.getenv('HEDGE_WINDOW', '200')))
+        self._lock = threading.Lock()
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    @property
+    def enabled(self):
+        return self.percentile > 0
+
+    def delay(self, size):
+        """Seconds to wait before hedging a request of `size` bytes (None: do not hedge)
+
+        Also credits the hedge budget, so call it once per request.
+        """
+        if not self.enabled:
+            return None
+        self.budget.on_request()
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, int(len(ordered) * self.percentile / 100))
+        return max(self.min_delay, ordered[index] * max(size, MIN_NORMALIZED_SIZE) / MB)
+
+    def record(self, size, elapsed):
+        """Add the latency of a successful attempt"""
+        if self.enabled:
+            with self._lock:
+                self._samples.append(elapsed / max(size, MIN_NORMALIZED_SIZE) * MB)
+
+    def allow(self):
+        """Spend budget on one hedge"""
+        return self.budget.try_spend()
+
+    def snapshot(self):
+        return {'hedges': self.hedges, 'hedge_wins': self.hedge_wins, 'budget': self.budget.snapshot()}
+
+
+def call_hedged(start, hedger, size):
+    """Run a unary call with at most one hedge; returns the first successful response
+
+    Raises the last grpc.RpcError if every attempt fails.
+    """
+    finished = queue.Queue()
+    attempts = []
+
+    def launch(hedge):
+        future = start(hedge)
+        if future is None:
+            return False
+        started = time.perf_counter()
+        attempts.append(future)
+        future.add_done_callback(lambda f: finished.put((f, time.perf_counter() - started)))
+        return True
+
+    launch(False)
+    wait = hedger.delay(size)
+    pending = 1
+    last_error = None
+    try:
+        while pending:
+            try:
+                future, elapsed = finished.get(timeout=wait)
+            except queue.Empty:
+                wait = None
+                if hedger.allow() and launch(True):
+                    hedger.hedges += 1
+                    pending += 1
+                continue
+            pending -= 1
+            try:
+                response = future.result()
+            except grpc.RpcError as e:
+                last_error = e
+                continue
+            hedger.record(size, elapsed)
+            if future is not attempts[0]:
+                hedger.hedge_wins += 1
+            return response
+        raise last_error
+    finally:
+        for future in attempts:
+            if not future.done():
+                future.cancel()
+
+
+async def call_hedged_aio(start, hedger, size):
+    """grpc.aio variant of call_hedged()"""
+    attempts = []
+
+    def launch(hedge):
+        call = start(hedge)
+        if call is None:
+            return None
+        started = time.perf_counter()
+
+        async def timed():
+            return await call, time.perf_counter() - started
+
+        task = asyncio.ensure_future(timed())
+        attempts.append(task)
+        return task
+
+    pending = {launch(False)}
+    wait = hedger.delay(size)
+    last_error = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, timeout=wait, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                wait = None
+                task = launch(True) if hedger.allow() else None
+                if task is not None:
+                    hedger.hedges += 1
+                    pending.add(task)
+                continue
+            for task in done:
+                try:
+                    response, elapsed = task.result()
+                except grpc.RpcError as e:
+                    last_error = e
+                    continue
+                hedger.record(size, elapsed)
+                if task is not attempts[0]:
+                    hedger.hedge_wins += 1
+                return response
+        raise last_error
+    finally:
+        for task in attempts:
+            if not task.done():
+                task.cancel()
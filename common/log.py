@@ -0,0 +1,175 @@
+"""
+Structured, leveled logging shared by every service and load balancer.
+
+Each print() on the request path was a synchronous write to the shared
+stdout, so the worker threads took turns writing 8-12 lines per request.
+Records now go into a bounded queue and one writer thread prints them.
+The step-by-step lines of a request are DEBUG; each stage logs one INFO line
+per request.
+
+    LOG_LEVEL        DEBUG (every step), INFO (default), WARNING, ERROR
+    LOG_SAMPLE_RATE  fraction of requests whose DEBUG/INFO lines are kept
+                     (default 1). The choice hashes the request ID, so every
+                     stage keeps the same requests. Warnings and errors are
+                     always kept.
+    LOG_FORMAT       text (default) or json (one object per line with ts,
+                     level, stage, instance, request_id and msg)
+    LOG_QUEUE_SIZE   records waiting for the writer thread (default 10000).
+                     When it is full, records are dropped and counted rather
+                     than blocking a handler. 0 writes from the calling thread.
+
+    log.configure('service1', instance_id)
+    logger = log.get(f"Service 1-{instance_id}")
+    log.bind_request(request.request_id)   # at the start of each handler
+    logger.debug(f"Cleaned length: {len(cleaned)}")
+"""
+
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+import zlib
+
+LOGGER_NAME = 'pipeline'
+
+# (request_id, sampled) of the request the current thread or task is serving
+_request = contextvars.ContextVar('log_request', default=('', True))
+
+_fields = {'stage': '', 'instance': ''}
+_listener = None
+
+
+def level():
+    return getattr(logging, os.getenv('LOG_LEVEL', 'INFO').upper(), logging.INFO)
+
+
+def sample_rate():
+    return float(os.getenv('LOG_SAMPLE_RATE', '1'))
+
+
+def sampled(request_id, rate=None):
+    """Whether a request's DEBUG/INFO lines are kept; the same answer in every stage"""
+    rate = sample_rate() if rate is None else rate
+    if rate >= 1:
+        return True
+    if rate <= 0:
+        return False
+    if not request_id:
+        return random.random() < rate
+    return zlib.crc32(request_id.encode('utf-8')) / 2 ** 32 < rate
+
+
+def bind_request(request_id):
+    """Tag this thread's or task's following records with `request_id` and apply sampling"""
+    _request.set((request_id, sampled(request_id)))
+
+
+class StageLogger(logging.LoggerAdapter):
+    """Adds stage, instance, label and the bound request ID to every record"""
+
+    def process(self, msg, kwargs):
+        request_id, _ = _request.get()
+        kwargs['extra'] = {**_fields, **self.extra, 'request_id': request_id, **kwargs.get('extra', {})}
+        return msg, kwargs
+
+    def isEnabledFor(self, level):
+        if level < logging.WARNING and not _request.get()[1]:
+            return False
+        return self.logger.isEnabledFor(level)
+
+
+def get(label):
+    """Logger whose text lines start with [label], e.g. 'Service 1-a'"""
+    return StageLogger(logging.getLogger(LOGGER_NAME), {'label': label})
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record):
+        request_id = getattr(record, 'request_id', '')
+        line = (f"{self.formatTime(record)} {record.levelname:<7} [{getattr(record, 'label', record.name)}] "
+                f"{f'({request_id}) ' if request_id else ''}{record.getMessage()}")
+        if record.exc_info:
+            line += '\n' + self.formatException(record.exc_info)
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 6),
+            'level': record.levelname,
+            'stage': getattr(record, 'stage', ''),
+            'instance': getattr(record, 'instance', ''),
+            'request_id': getattr(record, 'request_id', ''),
+            'label': getattr(record, 'label', record.name),
+            'msg': record.getMessage(),
+        }
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that never blocks: records beyond the queue's bound are dropped"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._reported = 0
+        self._lock = threading.Lock()
+
+    def prepare(self, record):
+        # The listener runs in this process, so the record is queued as is and
+        # formatted once by the writer thread instead of also on the caller's
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return
+        if self.dropped > self._reported:
+            with self._lock:
+                missed, self._reported = self.dropped - self._reported, self.dropped
+            notice = logging.makeLogRecord({
+                'name': LOGGER_NAME, 'levelno': logging.WARNING, 'levelname': 'WARNING',
+                'msg': f"Dropped {missed} log records: the log queue was full",
+                'label': getattr(record, 'label', LOGGER_NAME), **_fields,
+            })
+            try:
+                self.queue.put_nowait(notice)
+            except queue.Full:
+                pass
+
+
+def configure(stage, instance):
+    """Set up the process's log output once; call first thing in serve()"""
+    global _listener
+    logger = logging.getLogger(LOGGER_NAME)
+    if logger.handlers:
+        return
+    _fields.update(stage=stage, instance=instance)
+
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JsonFormatter() if os.getenv('LOG_FORMAT', 'text') == 'json' else TextFormatter())
+    queue_size = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+    if queue_size > 0:
+        handler = DroppingQueueHandler(queue.Queue(queue_size))
+        _listener = logging.handlers.QueueListener(handler.queue, output)
+        _listener.start()
+        # Flush what is still queued when the process exits
+        atexit.register(_listener.stop)
+    else:
+        handler = output
+
+    logger.addHandler(handler)
+    logger.setLevel(level())
+    logger.propagate = False
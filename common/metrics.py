@@ -0,0 +1,214 @@
+"""
+Prometheus metrics endpoint shared by every service and load balancer.
+
+Each process serves /metrics over HTTP on METRICS_PORT (default: its gRPC
+PORT + 1000, so 8051 -> 9051; 0 disables it). Exposed metrics:
+
+    grpc_server_handled_total            RPCs finished, by method and status code
+    grpc_server_handling_seconds         arrival until the handler returned, by method
+    grpc_server_msg_received_bytes_total request bytes, by method
+    grpc_server_msg_sent_bytes_total     response bytes, by method
+    grpc_server_inflight_requests        RPCs whose handler is running
+    thread_pool_queue_depth              RPCs or tasks waiting for a worker, per pool
+    thread_pool_workers                  worker threads started, per pool
+    result_cache_*                       Service 1's result cache (result_cache.py)
+    lb_backend_*                         per-backend attempts, errors, latency and
+                                         load in the load balancers (discovery.py)
+
+An instance is saturated when its queue depth keeps growing while the
+in-flight count sits at MAX_CONCURRENT_RPCS; see admission.py.
+
+    metrics.start('Service 1-a')
+    executor = metrics.track_executor(futures.ThreadPoolExecutor(max_workers=10))
+    server = grpc.server(executor, interceptors=metrics.interceptors() + ...)
+"""
+
+import os
+import time
+
+import grpc
+from prometheus_client import Counter, Gauge, Histogram, REGISTRY, start_http_server
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+import log
+
+# 1ms (a cached answer) up to the 300s whole-pipeline timeout
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1, 2.5, 5, 10, 30, 60, 120, 300)
+
+_METHOD_LABELS = ('grpc_service', 'grpc_method')
+
+HANDLED = Counter('grpc_server_handled_total', 'RPCs finished on the server',
+                  _METHOD_LABELS + ('grpc_code',))
+HANDLING_SECONDS = Histogram('grpc_server_handling_seconds', 'Time from arrival until the handler returned',
+                             _METHOD_LABELS, buckets=LATENCY_BUCKETS)
+RECEIVED_BYTES = Counter('grpc_server_msg_received_bytes', 'Request message bytes received', _METHOD_LABELS)
+SENT_BYTES = Counter('grpc_server_msg_sent_bytes', 'Response message bytes sent', _METHOD_LABELS)
+INFLIGHT = Gauge('grpc_server_inflight_requests', 'RPCs whose handler is running', _METHOD_LABELS)
+
+QUEUE_DEPTH = Gauge('thread_pool_queue_depth', 'Tasks waiting for a worker thread', ('pool',))
+WORKERS = Gauge('thread_pool_workers', 'Worker threads started', ('pool',))
+
+BACKEND_REQUESTS = Counter('lb_backend_requests', 'Attempts a load balancer sent to a backend',
+                           ('route', 'backend'))
+BACKEND_ERRORS = Counter('lb_backend_errors', 'Attempts that failed because of the backend',
+                         ('route', 'backend'))
+BACKEND_SECONDS = Histogram('lb_backend_request_seconds', 'Duration of successful attempts',
+                            ('route', 'backend'), buckets=LATENCY_BUCKETS)
+
+
+def metrics_port():
+    """METRICS_PORT, else PORT + 1000; 0 when neither is set"""
+    port = os.getenv('METRICS_PORT')
+    if port is not None:
+        return int(port)
+    return int(os.getenv('PORT', '0')) + 1000 if os.getenv('PORT') else 0
+
+
+def start(name):
+    """Serve /metrics from a background thread; `name` prefixes the log line"""
+    port = metrics_port()
+    if port <= 0:
+        return None
+    start_http_server(port)
+    log.get(name).info(f"Metrics on :{port}/metrics")
+    return port
+
+
+def track_executor(executor, pool='grpc'):
+    """Export the queue depth and worker count of a ThreadPoolExecutor; returns it"""
+    QUEUE_DEPTH.labels(pool).set_function(lambda: executor._work_queue.qsize())
+    WORKERS.labels(pool).set_function(lambda: len(executor._threads))
+    return executor
+
+
+class _Callback:
+    """Collector that turns a stats snapshot into samples at scrape time"""
+
+    def __init__(self, family, name, documentation, labelnames, samples):
+        self.family = family
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.samples = samples
+
+    def describe(self):
+        # Nothing to check up front; samples() may not be ready at registration
+        return []
+
+    def collect(self):
+        metric = self.family(self.name, self.documentation, labels=self.labelnames)
+        for labels, value in self.samples():
+            metric.add_metric(labels, value)
+        yield metric
+
+
+def gauge_callback(name, documentation, samples, labelnames=()):
+    """Register a gauge read at scrape time; `samples()` yields (label values, value)"""
+    REGISTRY.register(_Callback(GaugeMetricFamily, name, documentation, list(labelnames), samples))
+
+
+def counter_callback(name, documentation, samples, labelnames=()):
+    """Like gauge_callback() for a monotonic count kept elsewhere (exposed as name_total)"""
+    REGISTRY.register(_Callback(CounterMetricFamily, name, documentation, list(labelnames), samples))
+
+
+def _method_labels(method):
+    """'/pipeline.TextInputService/ReceiveText' -> ('pipeline.TextInputService', 'ReceiveText')"""
+    parts = method.split('/')
+    return (parts[1], parts[2]) if len(parts) == 3 else ('', method)
+
+
+def _code_name(context, default):
+    code = context.code()
+    if code is None:
+        return default
+    if not isinstance(code, grpc.StatusCode):
+        # grpc.aio reports the raw integer status
+        code = next((c for c in grpc.StatusCode if c.value[0] == code), None)
+    return code.name if code is not None else default
+
+
+class _Metrics:
+    def _counted_deserializer(self, counter, deserializer):
+        def deserialize(data):
+            counter.inc(len(data))
+            return deserializer(data) if deserializer else data
+        return deserialize
+
+    def _counted_serializer(self, counter, serializer):
+        def serialize(response):
+            data = serializer(response) if serializer else response
+            counter.inc(len(data))
+            return data
+        return serialize
+
+    def _finish(self, labels, arrived, context, default_code):
+        INFLIGHT.labels(*labels).dec()
+        HANDLING_SECONDS.labels(*labels).observe(time.perf_counter() - arrived)
+        HANDLED.labels(*labels, _code_name(context, default_code)).inc()
+
+    def _wrap(self, handler_call_details, handler):
+        if handler is None or handler.response_streaming:
+            return handler
+        labels = _method_labels(handler_call_details.method)
+        arrived = time.perf_counter()
+        kwargs = {
+            'request_deserializer': self._counted_deserializer(RECEIVED_BYTES.labels(*labels),
+                                                               handler.request_deserializer),
+            'response_serializer': self._counted_serializer(SENT_BYTES.labels(*labels),
+                                                            handler.response_serializer),
+        }
+        if handler.request_streaming:
+            return grpc.stream_unary_rpc_method_handler(
+                self._observed(labels, arrived, handler.stream_unary), **kwargs)
+        return grpc.unary_unary_rpc_method_handler(
+            self._observed(labels, arrived, handler.unary_unary), **kwargs)
+
+
+class MetricsInterceptor(_Metrics, grpc.ServerInterceptor):
+    """RPC metrics for threaded servers; intercept_service runs before the call is queued"""
+
+    def intercept_service(self, continuation, handler_call_details):
+        return self._wrap(handler_call_details, continuation(handler_call_details))
+
+    def _observed(self, labels, arrived, behavior):
+        def observed(request, context):
+            INFLIGHT.labels(*labels).inc()
+            code = 'UNKNOWN'
+            try:
+                response = behavior(request, context)
+                code = 'OK'
+                return response
+            finally:
+                self._finish(labels, arrived, context, code)
+        return observed
+
+
+class AsyncMetricsInterceptor(_Metrics, grpc.aio.ServerInterceptor):
+    """RPC metrics for grpc.aio servers"""
+
+    async def intercept_service(self, continuation, handler_call_details):
+        return self._wrap(handler_call_details, await continuation(handler_call_details))
+
+    def _observed(self, labels, arrived, behavior):
+        async def observed(request, context):
+            INFLIGHT.labels(*labels).inc()
+            code = 'UNKNOWN'
+            try:
+                response = await behavior(request, context)
+                code = 'OK'
+                return response
+            finally:
+                self._finish(labels, arrived, context, code)
+        return observed
+
+
+def interceptors():
+    """Server interceptors for a threaded server; put them first to see every RPC"""
+    return [MetricsInterceptor()]
+
+
+def aio_interceptors():
+    """grpc.aio variant of interceptors()"""
+    return [AsyncMetricsInterceptor()]
@@ -0,0 +1,41 @@
+"""
+Server mode selection shared by every service and load balancer.
+
+SERVER_MODE=thread (default) runs the classic grpc.server with a thread pool.
+SERVER_MODE=aio runs a grpc.aio server whose handlers await downstream calls,
+so waiting on the next stage does not hold a thread, and CPU-heavy work runs
+on a small executor (CPU_WORKERS) so it does not stall the loop. In both
+modes MAX_CONCURRENT_RPCS bounds the RPCs an instance accepts; see
+admission.py.
+"""
+
+import asyncio
+import os
+from concurrent import futures
+
+_cpu_executor = None
+
+
+def is_aio():
+    return os.getenv('SERVER_MODE', 'thread').lower() == 'aio'
+
+
+def max_concurrent_rpcs():
+    """RPCs a server runs or queues before rejecting with RESOURCE_EXHAUSTED; 0 disables it."""
+    limit = int(os.getenv('MAX_CONCURRENT_RPCS', '100'))
+    return limit if limit > 0 else None
+
+
+def cpu_executor():
+    global _cpu_executor
+    if _cpu_executor is None:
+        _cpu_executor = futures.ThreadPoolExecutor(
+            max_workers=int(os.getenv('CPU_WORKERS', '4')),
+            thread_name_prefix='cpu'
+        )
+    return _cpu_executor
+
+
+async def run_cpu(fn, *args):
+    """Run a CPU-bound function off the event loop."""
+    return await asyncio.get_running_loop().run_in_executor(cpu_executor(), fn, *args)
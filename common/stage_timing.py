@@ -0,0 +1,192 @@
+"""
+Per-stage latency breakdown returned to the client.
+
+Every response message keeps a `repeated StageTiming timings = 15` field.
+Each server and load balancer adds one entry for its own part of a request,
+so the client sees where the time went along the whole chain:
+
+    queue_wait    arrival until a worker picked the call up
+    deserialize   parsing the request message(s)
+    compute       the handler, minus parsing and the downstream call
+    downstream    waiting for the next stage (which lists its own entry)
+    serialize     encoding the response
+    total         arrival until the response was encoded
+
+The entry is appended to the response after it has been serialized: the
+protobuf wire format merges concatenated repeated fields, so serialize time
+is part of the same message, and the load balancers, which forward raw bytes,
+report their hop without parsing the response. Stages move the entries of the
+response they got from downstream into their own with adopt(), and time the
+call with `with stage_timing.downstream():`.
+
+For client-streaming calls frames are parsed while the handler runs, so time
+spent waiting for the next frame counts as compute; a stage that relays
+frames to the next one as they arrive counts that work as downstream.
+
+    server = grpc.server(executor,
+                         interceptors=stage_timing.interceptors('Service 1-a')
+                         + admission.interceptors('Service 1-a'))
+"""
+
+import contextvars
+import time
+from contextlib import contextmanager
+
+import grpc
+
+import pipeline_pb2
+
+EXEMPT_PREFIX = '/grpc.health.v1.Health/'
+
+# Set while a handler runs so downstream() can find the call's record
+_current = contextvars.ContextVar('stage_timing', default=None)
+
+
+class _Record:
+    """Timestamps of one call, shared by its deserializer, handler and serializer"""
+
+    __slots__ = ('arrived', 'picked_up', 'deserialize', 'downstream', 'handled')
+
+    def __init__(self):
+        self.arrived = time.perf_counter()
+        self.picked_up = None
+        self.deserialize = 0.0
+        self.downstream = 0.0
+        self.handled = None
+
+    def pick_up(self, now):
+        if self.picked_up is None:
+            self.picked_up = now
+
+    def entry(self, stage, serialize, now):
+        picked_up = self.picked_up if self.picked_up is not None else self.arrived
+        handled = self.handled if self.handled is not None else now
+        return pipeline_pb2.StageTiming(
+            stage=stage,
+            queue_wait=picked_up - self.arrived,
+            deserialize=self.deserialize,
+            compute=max(0.0, handled - picked_up - self.deserialize - self.downstream),
+            downstream=self.downstream,
+            serialize=serialize,
+            total=now - self.arrived,
+        )
+
+
+@contextmanager
+def downstream():
+    """Count the enclosed block as time spent waiting for the next stage"""
+    record = _current.get()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if record is not None:
+            record.downstream += time.perf_counter() - start
+
+
+@contextmanager
+def measure(name):
+    """Time a handler called without a server, e.g. by a benchmark; the yielded
+    list holds the stage's entry once the block exits"""
+    record = _Record()
+    record.pick_up(record.arrived)
+    token = _current.set(record)
+    entries = []
+    try:
+        yield entries
+    finally:
+        now = time.perf_counter()
+        record.handled = now
+        _current.reset(token)
+        entries.append(record.entry(name, 0.0, now))
+
+
+def adopt(response, downstream_response):
+    """Move the timings of the next stage's response into `response`"""
+    response.timings.extend(downstream_response.timings)
+    del downstream_response.timings[:]
+    return response
+
+
+class _StageTiming:
+    def __init__(self, name):
+        self.name = name
+
+    def _deserializer(self, record, deserializer):
+        def deserialize(data):
+            start = time.perf_counter()
+            record.pick_up(start)
+            message = deserializer(data) if deserializer else data
+            record.deserialize += time.perf_counter() - start
+            return message
+        return deserialize
+
+    def _serializer(self, record, serializer):
+        def serialize(response):
+            start = time.perf_counter()
+            data = serializer(response) if serializer else response
+            now = time.perf_counter()
+            entry = record.entry(self.name, now - start, now)
+            # Any response type works as the carrier: they all use field 15
+            return data + pipeline_pb2.ReportResponse(timings=[entry]).SerializeToString()
+        return serialize
+
+    def _wrap(self, handler_call_details, handler):
+        if handler is None or handler_call_details.method.startswith(EXEMPT_PREFIX):
+            return handler
+        if handler.response_streaming:
+            return handler
+        record = _Record()
+        kwargs = {
+            'request_deserializer': self._deserializer(record, handler.request_deserializer),
+            'response_serializer': self._serializer(record, handler.response_serializer),
+        }
+        if handler.request_streaming:
+            return grpc.stream_unary_rpc_method_handler(self._timed(record, handler.stream_unary), **kwargs)
+        return grpc.unary_unary_rpc_method_handler(self._timed(record, handler.unary_unary), **kwargs)
+
+
+class StageTimingInterceptor(_StageTiming, grpc.ServerInterceptor):
+    """Stage timings for threaded servers; intercept_service runs before the call is queued"""
+
+    def intercept_service(self, continuation, handler_call_details):
+        return self._wrap(handler_call_details, continuation(handler_call_details))
+
+    def _timed(self, record, behavior):
+        def timed(request, context):
+            record.pick_up(time.perf_counter())
+            token = _current.set(record)
+            try:
+                return behavior(request, context)
+            finally:
+                record.handled = time.perf_counter()
+                _current.reset(token)
+        return timed
+
+
+class AsyncStageTimingInterceptor(_StageTiming, grpc.aio.ServerInterceptor):
+    """Stage timings for grpc.aio servers"""
+
+    async def intercept_service(self, continuation, handler_call_details):
+        return self._wrap(handler_call_details, await continuation(handler_call_details))
+
+    def _timed(self, record, behavior):
+        async def timed(request, context):
+            record.pick_up(time.perf_counter())
+            token = _current.set(record)
+            try:
+                return await behavior(request, context)
+            finally:
+                record.handled = time.perf_counter()
+                _current.reset(token)
+        return timed
+
+
+def interceptors(name):
+    """Server interceptors for a threaded server; `name` labels the stage's entries"""
+    return [StageTimingInterceptor(name)]
+
+
+def aio_interceptors(name):
+    """grpc.aio variant of interceptors()"""
+    return [AsyncStageTimingInterceptor(name)]
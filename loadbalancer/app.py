@@ -0,0 +1,459 @@
+"""
+Generic load balancer for every tier of the pipeline.
+
+Methods are served through a gRPC generic handler, so request and response
+messages are forwarded as raw bytes and never deserialized. The route table
+(LB_ROUTES_FILE, routes.json by default) maps each route name to a service
+in pipeline.proto and the backends that implement it; LB_ROUTES picks the
+routes this process serves (comma-separated, default: all of them). Every
+method of a routed service is forwarded, with its cardinality taken from the
+pipeline.proto descriptors. Backends are re-discovered and health checked in
+the background (see discovery.py). Unary calls that run past the route's
+recent latency percentile can be hedged to a second backend (see
+common/hedging.py). Forwarded calls inherit the caller's deadline and are
+cancelled with it, and a request is not failed over once its deadline has
+passed (see common/deadline.py). Which failures are retried on another
+backend, how often and after what backoff is set by retry.py. Each response
+gets the balancer's own stage timing appended (see common/stage_timing.py).
+"""
+
+import grpc
+from concurrent import futures
+import asyncio
+import functools
+import os
+import sys
+import time
+
+sys.path.insert(0, '/app')
+import pipeline_pb2
+import admission
+import channel_pool
+import deadline
+import discovery
+import health
+import hedging
+import log
+import metrics
+import server_mode
+import stage_timing
+
+# Used when the caller sent no deadline; otherwise its remaining time is passed on
+BACKEND_TIMEOUT = 300
+
+# The LB holds every in-flight request of its tier, so it gets its own byte
+# budget (default: none) and leaves shedding to the backends
+LB_MAX_INFLIGHT_BYTES = int(os.getenv('LB_MAX_INFLIGHT_BYTES', '0'))
+
+# Set by gRPC itself on the outgoing call, so they are not copied over
+_RESERVED_METADATA = ('user-agent', 'te', 'content-type')
+
+
+def method_table():
+    """Map '/package.Service/Method' to (client_streaming, server_streaming)"""
+    methods = {}
+    for service in pipeline_pb2.DESCRIPTOR.services_by_name.values():
+        for method in service.methods:
+            methods[f'/{service.full_name}/{method.name}'] = (method.client_streaming, method.server_streaming)
+    return methods
+
+
+def forward_metadata(context):
+    """Caller metadata to pass on to the backend"""
+    return tuple(
+        (key, value) for key, value in context.invocation_metadata()
+        if key not in _RESERVED_METADATA and not key.startswith(('grpc-', ':'))
+    )
+
+
+class LoadBalancerProxy(grpc.GenericRpcHandler):
+    def __init__(self, routes):
+        self.routes = {route.service: route for route in routes}
+        self.methods = method_table()
+        self.channel_pool = channel_pool.get_pool()
+        for route in routes:
+            route.log.info(f"{route.service} → {len(route.discovered)} instances ({route.balancer.name} policy): "
+                           f"{', '.join(route.discovered) or 'none'}")
+
+    def service(self, handler_call_details):
+        method = handler_call_details.method
+        route = self.routes.get(method.split('/')[1] if method.count('/') == 2 else None)
+        if route is None or method not in self.methods:
+            return None
+        client_streaming, server_streaming = self.methods[method]
+        if server_streaming:
+            # pipeline.proto has no server-streaming methods; they are left unimplemented
+            return None
+        if client_streaming:
+            return grpc.stream_unary_rpc_method_handler(functools.partial(self.forward_stream, route, method))
+        # partial() keeps the aio subclass's coroutine handlers recognisable as coroutines
+        return grpc.unary_unary_rpc_method_handler(functools.partial(self.forward_unary, route, method))
+
+    def _retry_delay(self, route, error, attempts, context):
+        """Seconds to back off before trying another backend, or None to give up"""
+        remaining = context.time_remaining()
+        if remaining is not None:
+            remaining -= deadline.margin()
+        delay, reason = route.retry.next_delay(error, attempts, remaining)
+        if delay is None:
+            route.log.warning(f"↯ Not retrying: {reason}")
+        return delay
+
+    def _failure(self, route, context, error, error_msg):
+        """Status and details for a request that is given up on"""
+        if deadline.expired(context):
+            code = grpc.StatusCode.DEADLINE_EXCEEDED
+        elif isinstance(error, grpc.RpcError) and (
+            not route.retry.retryable(error) or error.code() == grpc.StatusCode.RESOURCE_EXHAUSTED
+        ):
+            # The caller gets the backend's own answer, e.g. INVALID_ARGUMENT, or
+            # RESOURCE_EXHAUSTED when every instance tried was shedding load
+            code = error.code()
+        else:
+            code = grpc.StatusCode.UNAVAILABLE
+        if isinstance(error, grpc.RpcError):
+            error_msg = f"{error_msg}: {error.details()}"
+        route.log.warning(f"💥 {error_msg}")
+        return code, error_msg
+
+    def _record_error(self, route, backend, error, pool, size, elapsed):
+        # A call the caller cancelled or ran out of time for says nothing about the
+        # backend, and one it shed means busy rather than broken
+        if deadline.upstream_code(error, None) is None:
+            route.record_result(backend, size, elapsed, False)
+        if isinstance(error, grpc.RpcError):
+            if channel_pool.is_connection_error(error):
+                pool.invalidate(backend)
+            route.log.warning(f"✗ Error from {backend}: {error.details()}")
+        else:
+            route.log.warning(f"✗ Unexpected error from {backend}: {str(error)}")
+
+    def _attempt_starter(self, route, method, request, size, context, backend, tried):
+        """start(hedge) callback for the hedging helpers: the first attempt goes to
+        `backend`, a hedge to the next backend the policy picks"""
+        def start(hedge):
+            target = backend
+            if hedge:
+                target = route.pick(size, tried)
+                if target is None:
+                    return None
+                route.log.info(f"⏱ {backend} is slow, hedging to {target}")
+            return self._start_unary(route, method, target, request, size, context)
+        return start
+
+    def _start_unary(self, route, method, backend, request, size, context):
+        """Start one forwarded call as a future; its outcome is recorded when it finishes"""
+        route.balancer.begin(backend, size)
+        start = time.perf_counter()
+        try:
+            call = self.channel_pool.get(backend).unary_unary(method)
+            future = call.future(request, timeout=deadline.downstream_timeout(context, BACKEND_TIMEOUT),
+                                 metadata=forward_metadata(context))
+        except Exception:
+            route.balancer.end(backend, size)
+            raise
+        deadline.cancel_with(context, future)
+
+        def finished(f):
+            route.balancer.end(backend, size)
+            if f.cancelled():
+                # The other attempt of a hedged pair won
+                return
+            elapsed = time.perf_counter() - start
+            error = f.exception()
+            if error is None:
+                route.record_result(backend, size, elapsed, True)
+                route.log.debug(f"✓ Success from {backend}")
+            else:
+                self._record_error(route, backend, error, self.channel_pool, size, elapsed)
+
+        future.add_done_callback(finished)
+        return future
+
+    def forward_unary(self, route, method, request, context):
+        attempts = 0
+        size = len(request)
+        # Requests are forwarded unparsed, so sampling cannot follow the request ID here
+        log.bind_request('')
+        route.log.debug(f"Routing {method} ({size} bytes)")
+        route.retry.on_request()
+
+        tried = set()
+        last_error = None
+        while not deadline.expired(context):
+            backend = route.pick(size, tried)
+            if backend is None:
+                break
+            route.log.debug(f"→ Sending to {backend}")
+
+            try:
+                with stage_timing.downstream():
+                    return hedging.call_hedged(
+                        self._attempt_starter(route, method, request, size, context, backend, tried),
+                        route.hedger, size
+                    )
+            except grpc.RpcError as e:
+                # Already recorded by the attempt that failed
+                last_error = e
+            except Exception as e:
+                self._record_error(route, backend, e, self.channel_pool, size, 0.0)
+                last_error = e
+            attempts += 1
+
+            delay = self._retry_delay(route, last_error, attempts, context)
+            if delay is None:
+                break
+            time.sleep(delay)
+
+        context.abort(*self._failure(
+            route, context, last_error, f"Request to {route.name} failed after {attempts} attempts"
+        ))
+
+    def forward_stream(self, route, method, request_iterator, context):
+        attempts = 0
+        log.bind_request('')
+
+        # The first frame is buffered so the stream can still fail over to another
+        # instance if the first one rejects it; once later frames have been
+        # forwarded they cannot be replayed.
+        first_frame = next(request_iterator, None)
+        # Whole-stream size, for the per-MB latency the outlier detector tracks
+        state = {'consumed': False, 'bytes': 0}
+
+        def frames():
+            if first_frame is not None:
+                state['bytes'] += len(first_frame)
+                yield first_frame
+            for frame in request_iterator:
+                state['consumed'] = True
+                state['bytes'] += len(frame)
+                yield frame
+
+        # Only the first frame's size is known up front
+        size = len(first_frame) if first_frame is not None else 0
+        metadata = forward_metadata(context)
+        route.log.debug(f"Routing streaming {method}")
+        route.retry.on_request()
+
+        tried = set()
+        last_error = None
+        while not deadline.expired(context):
+            backend = route.pick(size, tried)
+            if backend is None:
+                break
+            route.log.debug(f"→ Streaming to {backend}")
+
+            start = time.perf_counter()
+            state['bytes'] = 0
+            try:
+                call = self.channel_pool.get(backend).stream_unary(method)
+                with route.balancer.track(backend, size), stage_timing.downstream():
+                    response = deadline.call_downstream(context, call, frames(), BACKEND_TIMEOUT, metadata=metadata)
+                route.record_result(backend, state['bytes'], time.perf_counter() - start, True)
+                route.log.debug(f"✓ Success from {backend}")
+                return response
+            except Exception as e:
+                self._record_error(route, backend, e, self.channel_pool, state['bytes'], time.perf_counter() - start)
+                last_error = e
+                attempts += 1
+                if state['consumed']:
+                    break
+
+            delay = self._retry_delay(route, last_error, attempts, context)
+            if delay is None:
+                break
+            time.sleep(delay)
+
+        context.abort(*self._failure(
+            route, context, last_error, f"Streaming request failed on {route.name} after {attempts} attempts"
+        ))
+
+
+class AsyncLoadBalancerProxy(LoadBalancerProxy):
+    """grpc.aio variant: awaits the chosen backend instead of holding a worker thread"""
+
+    def __init__(self, routes):
+        super().__init__(routes)
+        self.aio_channel_pool = channel_pool.get_aio_pool()
+
+    def _start_unary(self, route, method, backend, request, size, context):
+        return self._attempt_unary(route, method, backend, request, size, context)
+
+    async def _attempt_unary(self, route, method, backend, request, size, context):
+        route.balancer.begin(backend, size)
+        start = time.perf_counter()
+        try:
+            call = self.aio_channel_pool.get(backend).unary_unary(method)
+            response = await call(request, timeout=deadline.downstream_timeout(context, BACKEND_TIMEOUT),
+                                  metadata=forward_metadata(context))
+        except asyncio.CancelledError:
+            # The other attempt of a hedged pair won
+            raise
+        except grpc.RpcError as e:
+            self._record_error(route, backend, e, self.aio_channel_pool, size, time.perf_counter() - start)
+            raise
+        finally:
+            route.balancer.end(backend, size)
+        route.record_result(backend, size, time.perf_counter() - start, True)
+        route.log.debug(f"✓ Success from {backend}")
+        return response
+
+    async def forward_unary(self, route, method, request, context):
+        attempts = 0
+        size = len(request)
+        # Requests are forwarded unparsed, so sampling cannot follow the request ID here
+        log.bind_request('')
+        route.log.debug(f"Routing {method} ({size} bytes)")
+        route.retry.on_request()
+
+        tried = set()
+        last_error = None
+        while not deadline.expired(context):
+            backend = route.pick(size, tried)
+            if backend is None:
+                break
+            route.log.debug(f"→ Sending to {backend}")
+
+            try:
+                with stage_timing.downstream():
+                    return await hedging.call_hedged_aio(
+                        self._attempt_starter(route, method, request, size, context, backend, tried),
+                        route.hedger, size
+                    )
+            except grpc.RpcError as e:
+                # Already recorded by the attempt that failed
+                last_error = e
+            except Exception as e:
+                self._record_error(route, backend, e, self.aio_channel_pool, size, 0.0)
+                last_error = e
+            attempts += 1
+
+            delay = self._retry_delay(route, last_error, attempts, context)
+            if delay is None:
+                break
+            await asyncio.sleep(delay)
+
+        await context.abort(*self._failure(
+            route, context, last_error, f"Request to {route.name} failed after {attempts} attempts"
+        ))
+
+    async def forward_stream(self, route, method, request_iterator, context):
+        attempts = 0
+        log.bind_request('')
+
+        # Same failover rule as the threaded proxy: only the buffered first
+        # frame can be replayed to another backend.
+        frames_in = request_iterator.__aiter__()
+        try:
+            first_frame = await frames_in.__anext__()
+        except StopAsyncIteration:
+            first_frame = None
+        # Whole-stream size, for the per-MB latency the outlier detector tracks
+        state = {'consumed': False, 'bytes': 0}
+
+        async def frames():
+            if first_frame is not None:
+                state['bytes'] += len(first_frame)
+                yield first_frame
+            async for frame in frames_in:
+                state['consumed'] = True
+                state['bytes'] += len(frame)
+                yield frame
+
+        # Only the first frame's size is known up front
+        size = len(first_frame) if first_frame is not None else 0
+        metadata = forward_metadata(context)
+        route.log.debug(f"Routing streaming {method}")
+        route.retry.on_request()
+
+        tried = set()
+        last_error = None
+        while not deadline.expired(context):
+            backend = route.pick(size, tried)
+            if backend is None:
+                break
+            route.log.debug(f"→ Streaming to {backend}")
+
+            start = time.perf_counter()
+            state['bytes'] = 0
+            try:
+                call = self.aio_channel_pool.get(backend).stream_unary(method)
+                with route.balancer.track(backend, size), stage_timing.downstream():
+                    response = await call(frames(), timeout=deadline.downstream_timeout(context, BACKEND_TIMEOUT),
+                                          metadata=metadata)
+                route.record_result(backend, state['bytes'], time.perf_counter() - start, True)
+                route.log.debug(f"✓ Success from {backend}")
+                return response
+            except Exception as e:
+                self._record_error(route, backend, e, self.aio_channel_pool, state['bytes'], time.perf_counter() - start)
+                last_error = e
+                attempts += 1
+                if state['consumed']:
+                    break
+
+            delay = self._retry_delay(route, last_error, attempts, context)
+            if delay is None:
+                break
+            await asyncio.sleep(delay)
+
+        await context.abort(*self._failure(
+            route, context, last_error, f"Streaming request failed on {route.name} after {attempts} attempts"
+        ))
+
+
+def serve():
+    port = os.getenv('PORT', '8061')
+    routes = discovery.load_routes()
+    route_names = ', '.join(route.name for route in routes)
+    log.configure('loadbalancer', route_names)
+
+    # One probe round before serving, so dead backends never see user traffic
+    monitor = discovery.BackendMonitor(routes)
+    if discovery.health_check_interval() > 0:
+        monitor.probe()
+    monitor.start()
+    discovery.export_metrics(routes)
+    metrics.start(f"Load Balancer {route_names}")
+
+    server_options = [
+        ('grpc.max_send_message_length', 100 * 1024 * 1024),
+        ('grpc.max_receive_message_length', 100 * 1024 * 1024),
+    ]
+
+    if server_mode.is_aio():
+        asyncio.run(serve_aio(port, server_options, routes, route_names))
+        return
+
+    server = grpc.server(
+        metrics.track_executor(futures.ThreadPoolExecutor(max_workers=20)), options=server_options,
+        maximum_concurrent_rpcs=server_mode.max_concurrent_rpcs(),
+        interceptors=(metrics.interceptors()
+                      + stage_timing.interceptors(f"Load Balancer {route_names}")
+                      + admission.interceptors(f"Load Balancer {route_names}", LB_MAX_INFLIGHT_BYTES))
+    )
+    server.add_generic_rpc_handlers((LoadBalancerProxy(routes),))
+    health.add_health_servicer(server, *(route.service for route in routes))
+    server.add_insecure_port(f'[::]:{port}')
+    server.start()
+    log.get(f"Load Balancer {route_names}").info(f"Started on port {port} for {route_names} (100MB limit)")
+    server.wait_for_termination()
+
+
+async def serve_aio(port, server_options, routes, route_names):
+    server = grpc.aio.server(
+        options=server_options,
+        maximum_concurrent_rpcs=server_mode.max_concurrent_rpcs(),
+        interceptors=(metrics.aio_interceptors()
+                      + stage_timing.aio_interceptors(f"Load Balancer {route_names}")
+                      + admission.aio_interceptors(f"Load Balancer {route_names}", LB_MAX_INFLIGHT_BYTES))
+    )
+    server.add_generic_rpc_handlers((AsyncLoadBalancerProxy(routes),))
+    await health.add_aio_health_servicer(server, *(route.service for route in routes))
+    server.add_insecure_port(f'[::]:{port}')
+    await server.start()
+    log.get(f"Load Balancer {route_names}").info(f"Started on port {port} for {route_names} (aio mode, max {server_mode.max_concurrent_rpcs()} concurrent RPCs)")
+    await server.wait_for_termination()
+
+
+if __name__ == '__main__':
+    serve()
@@ -0,0 +1,299 @@
+"""
+Backend discovery and active health checking for the load balancer.
+
+A route's backends come either from a static "backends" list or from a
+"dns" target ("host:port") whose A/AAAA records are re-resolved, so
+instances added behind one DNS name are picked up. The route table file is
+re-read whenever it changes. Both are checked every DISCOVERY_INTERVAL
+seconds, so backends can be added or removed without a restart.
+
+Every HEALTH_CHECK_INTERVAL seconds each backend gets a grpc.health.v1
+Check call for the route's service. A backend that fails a probe leaves
+the rotation until it passes one again, so a dead instance is skipped
+without a user request timing out against it first. Refused connections and
+NOT_SERVING answers eject at once; probe timeouts and RESOURCE_EXHAUSTED
+only after HEALTH_CHECK_FAILURES in a row, since a busy instance can be slow
+to answer, or shed the probe, while it counts a large document. If every backend of a route is out, the
+route keeps sending to all of them rather than to none.
+"""
+
+import grpc
+import json
+import os
+import socket
+import threading
+import time
+
+import balancing
+import channel_pool
+import health
+import hedging
+import log
+import metrics
+import outlier
+import pipeline_pb2
+import retry
+
+DEFAULT_ROUTES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'routes.json')
+
+
+def discovery_interval():
+    return float(os.getenv('DISCOVERY_INTERVAL', '5'))
+
+
+def health_check_interval():
+    """Seconds between probe rounds; 0 disables active health checking"""
+    return float(os.getenv('HEALTH_CHECK_INTERVAL', '2'))
+
+
+def health_check_timeout():
+    return float(os.getenv('HEALTH_CHECK_TIMEOUT', '1'))
+
+
+def health_check_failures():
+    """Consecutive probe timeouts before a backend is taken out of rotation"""
+    return int(os.getenv('HEALTH_CHECK_FAILURES', '3'))
+
+
+def resolve(target):
+    """Resolve 'host:port' to a sorted list of 'address:port' backends"""
+    host, port = target.rsplit(':', 1)
+    addresses = set()
+    for family, _, _, _, sockaddr in socket.getaddrinfo(host, port, type=socket.SOCK_STREAM):
+        address = sockaddr[0]
+        addresses.add(f'[{address}]:{port}' if family == socket.AF_INET6 else f'{address}:{port}')
+    return sorted(addresses)
+
+
+class Route:
+    """One service in the route table and the balancer over its live backends"""
+
+    def __init__(self, name, service, entry):
+        self.name = name
+        self.service = service
+        self.log = log.get(f"Load Balancer {name}")
+        self.static_backends = []
+        self.dns = None
+        self.discovered = []
+        self.unhealthy = set()
+        self.failures = {}
+        self.balancer = balancing.make_balancer([], entry.get('policy'))
+        self.outliers = outlier.OutlierDetector(name)
+        self.hedger = hedging.Hedger()
+        self.retry = retry.RetryPolicy(name)
+        self.configure(entry)
+
+    @property
+    def backends(self):
+        """Backends currently in rotation"""
+        return self.balancer.backends
+
+    def configure(self, entry):
+        """Apply a route table entry (static backends or a DNS target)"""
+        self.static_backends = list(entry.get('backends', ()))
+        self.dns = entry.get('dns')
+        self.discover()
+
+    def discover(self):
+        """Refresh the backend list; returns True if it changed"""
+        if self.dns:
+            try:
+                backends = resolve(self.dns)
+            except OSError as e:
+                # Keep the last good answer through a DNS hiccup
+                self.log.warning(f"✗ Could not resolve {self.dns}: {e}")
+                return False
+        else:
+            backends = self.static_backends
+        if backends == self.discovered:
+            return False
+        added = [b for b in backends if b not in self.discovered]
+        removed = [b for b in self.discovered if b not in backends]
+        self.discovered = list(backends)
+        self.unhealthy &= set(backends)
+        self.outliers.retain(backends)
+        self._rebalance()
+        self.log.info(f"Backends: {', '.join(self.discovered) or 'none'}"
+                      f" (+{len(added)} -{len(removed)})")
+        return True
+
+    def record_probe(self, backend, healthy, eject_now=True):
+        """Record a probe result; returns True if the backend entered or left the rotation"""
+        if healthy:
+            self.failures.pop(backend, None)
+            if backend not in self.unhealthy:
+                return False
+            self.unhealthy.discard(backend)
+        else:
+            self.failures[backend] = self.failures.get(backend, 0) + 1
+            if backend in self.unhealthy:
+                return False
+            if not eject_now and self.failures[backend] < health_check_failures():
+                return False
+            self.unhealthy.add(backend)
+        self._rebalance()
+        return True
+
+    def pick(self, size, tried):
+        """Choose a backend not yet tried, avoiding ejected ones while others remain"""
+        ejected = self.outliers.blocked()
+        backend = self.balancer.pick(size, exclude=tried | ejected)
+        if backend is None and ejected:
+            backend = self.balancer.pick(size, exclude=tried)
+        if backend is not None:
+            tried.add(backend)
+            self.outliers.started(backend)
+            metrics.BACKEND_REQUESTS.labels(self.name, backend).inc()
+        return backend
+
+    def record_result(self, backend, size, elapsed, ok):
+        """Report a finished call to the outlier detector and the metrics endpoint"""
+        if ok:
+            metrics.BACKEND_SECONDS.labels(self.name, backend).observe(elapsed)
+        else:
+            metrics.BACKEND_ERRORS.labels(self.name, backend).inc()
+        self.outliers.record(backend, size, elapsed, ok, len(self.discovered))
+
+    def _rebalance(self):
+        rotation = [b for b in self.discovered if b not in self.unhealthy]
+        self.balancer.set_backends(rotation or self.discovered)
+
+
+def export_metrics(routes):
+    """Publish each backend's current load and state as lb_backend_* gauges"""
+    routes = list(routes)
+
+    def balancer_samples(key):
+        def samples():
+            for route in routes:
+                for backend, load in route.balancer.snapshot().items():
+                    yield (route.name, backend), load[key]
+        return samples
+
+    def in_rotation():
+        for route in routes:
+            for backend in route.discovered:
+                yield (route.name, backend), 0 if backend in route.unhealthy else 1
+
+    def ejected():
+        for route in routes:
+            for backend, state in route.outliers.snapshot().items():
+                yield (route.name, backend), 0 if state['state'] == outlier.CLOSED else 1
+
+    labels = ('route', 'backend')
+    metrics.gauge_callback('lb_backend_outstanding_requests', 'Requests in flight on the backend',
+                           balancer_samples('outstanding'), labels)
+    metrics.gauge_callback('lb_backend_inflight_bytes', 'Request bytes in flight on the backend',
+                           balancer_samples('bytes_in_flight'), labels)
+    metrics.gauge_callback('lb_backend_healthy', '1 while the backend passes health checks',
+                           in_rotation, labels)
+    metrics.gauge_callback('lb_backend_ejected', '1 while outlier detection keeps the backend out',
+                           ejected, labels)
+
+
+def load_table(path):
+    with open(path) as f:
+        return json.load(f)['routes']
+
+
+def load_routes(path=None, names=None):
+    """Read the route table; `names` restricts it to the listed routes (default: LB_ROUTES)"""
+    path = path or routes_file()
+    if names is None:
+        names = [name.strip() for name in os.getenv('LB_ROUTES', '').split(',') if name.strip()]
+    table = load_table(path)
+
+    services = {s.full_name for s in pipeline_pb2.DESCRIPTOR.services_by_name.values()}
+    routes = []
+    for name in names or table:
+        if name not in table:
+            raise ValueError(f"Route '{name}' is not in {path}, expected one of {sorted(table)}")
+        entry = table[name]
+        if entry['service'] not in services:
+            raise ValueError(f"Route '{name}' names unknown service '{entry['service']}'")
+        if not entry.get('backends') and not entry.get('dns'):
+            raise ValueError(f"Route '{name}' needs 'backends' or 'dns'")
+        routes.append(Route(name, entry['service'], entry))
+    return routes
+
+
+def routes_file():
+    return os.getenv('LB_ROUTES_FILE', DEFAULT_ROUTES_FILE)
+
+
+class BackendMonitor(threading.Thread):
+    """Background thread that re-discovers backends and probes their health"""
+
+    def __init__(self, routes, pool=None, path=None):
+        super().__init__(name='backend-monitor', daemon=True)
+        self.routes = list(routes)
+        self.pool = pool or channel_pool.get_pool()
+        self.path = path or routes_file()
+        self._mtime = self._file_mtime()
+        self._stopped = threading.Event()
+
+    def _file_mtime(self):
+        try:
+            return os.stat(self.path).st_mtime
+        except OSError:
+            return None
+
+    def reload(self):
+        """Re-read the route table if it changed, then re-resolve DNS routes"""
+        mtime = self._file_mtime()
+        if mtime is not None and mtime != self._mtime:
+            self._mtime = mtime
+            try:
+                table = load_table(self.path)
+            except (OSError, ValueError, KeyError) as e:
+                log.get("Load Balancer").warning(f"✗ Keeping current routes, could not reload {self.path}: {e}")
+                table = {}
+            for route in self.routes:
+                if route.name in table:
+                    route.configure(table[route.name])
+        for route in self.routes:
+            if route.dns:
+                route.discover()
+
+    def probe(self):
+        """Send one round of health checks to every discovered backend"""
+        timeout = health_check_timeout()
+        checks = [
+            (route, backend, health.check_future(self.pool.get(backend), route.service, timeout))
+            for route in self.routes
+            for backend in route.discovered
+        ]
+        for route, backend, future in checks:
+            eject_now = True
+            try:
+                healthy = health.is_serving(future)
+                reason = 'not serving'
+            except grpc.RpcError as e:
+                healthy = False
+                reason = e.details()
+                # A slow or load-shedding instance is busy, not necessarily dead
+                eject_now = e.code() not in (grpc.StatusCode.DEADLINE_EXCEEDED, grpc.StatusCode.RESOURCE_EXHAUSTED)
+                if channel_pool.is_connection_error(e):
+                    self.pool.invalidate(backend)
+            if route.record_probe(backend, healthy, eject_now):
+                if healthy:
+                    route.log.info(f"✓ {backend} passed health check, back in rotation")
+                else:
+                    route.log.warning(f"✗ {backend} failed health check ({reason}), out of rotation")
+
+    def run(self):
+        probe_every = health_check_interval()
+        reload_every = discovery_interval()
+        tick = probe_every if probe_every > 0 else reload_every
+        if tick <= 0:
+            return
+        next_reload = time.monotonic() + reload_every
+        while not self._stopped.wait(tick):
+            if reload_every > 0 and time.monotonic() >= next_reload:
+                next_reload = time.monotonic() + reload_every
+                self.reload()
+            if probe_every > 0:
+                self.probe()
+
+    def stop(self):
+        self._stopped.set()
@@ -0,0 +1,185 @@
+"""
+Outlier ejection and circuit breaking for the load balancer.
+
+Each backend keeps two moving averages (EWMA, weight OUTLIER_EWMA_ALPHA)
+fed by real traffic:
+
+    latency     seconds per MB of request payload (payloads under 64KB
+                count as 64KB, so tiny requests do not dominate)
+    error rate  1 for a failed call, 0 for a successful one
+
+Once a backend has OUTLIER_MIN_REQUESTS samples, it is ejected when its
+error rate passes OUTLIER_ERROR_RATE or its latency is more than
+OUTLIER_LATENCY_FACTOR times the median of the other backends. At most
+OUTLIER_MAX_EJECTION_PERCENT of a route's backends are out at once.
+
+An ejected backend's breaker is OPEN: it gets no traffic for
+OUTLIER_EJECTION_TIME seconds, multiplied by how many times in a row it has
+been ejected (up to 5x). It then goes HALF_OPEN and receives one probe
+request at a time. A probe that succeeds at a normal latency closes the
+breaker; a failed or slow one opens it again for longer.
+"""
+
+import os
+import statistics
+import threading
+import time
+
+import log
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+MB = 1024 * 1024
+MIN_NORMALIZED_SIZE = 64 * 1024
+MAX_EJECTION_MULTIPLIER = 5
+
+
+class BackendState:
+    def __init__(self):
+        self.state = CLOSED
+        self.samples = 0
+        self.latency = 0.0          # EWMA of seconds per MB
+        self.error_rate = 0.0       # EWMA of failures
+        self.ejections = 0          # consecutive ejections, reset when the breaker closes
+        self.open_until = 0.0
+        self.probe_in_flight = False
+
+
+class OutlierDetector:
+    """Per-route breaker state for every backend"""
+
+    def __init__(self, route_name=''):
+        self.route_name = route_name
+        self.log = log.get(f"Load Balancer {route_name}")
+        self.alpha = float(os.getenv('OUTLIER_EWMA_ALPHA', '0.3'))
+        self.min_requests = int(os.getenv('OUTLIER_MIN_REQUESTS', '5'))
+        self.latency_factor = float(os.getenv('OUTLIER_LATENCY_FACTOR', '2.0'))
+        self.error_threshold = float(os.getenv('OUTLIER_ERROR_RATE', '0.5'))
+        self.ejection_time = float(os.getenv('OUTLIER_EJECTION_TIME', '10'))
+        self.max_ejection_percent = float(os.getenv('OUTLIER_MAX_EJECTION_PERCENT', '50'))
+        self._lock = threading.Lock()
+        self._backends = {}
+
+    @property
+    def enabled(self):
+        return self.ejection_time > 0
+
+    def _state(self, backend):
+        state = self._backends.get(backend)
+        if state is None:
+            state = self._backends[backend] = BackendState()
+        return state
+
+    def blocked(self):
+        """Backends that must not be picked right now"""
+        if not self.enabled:
+            return set()
+        now = time.monotonic()
+        blocked = set()
+        with self._lock:
+            for backend, state in self._backends.items():
+                if state.state == OPEN and now >= state.open_until:
+                    state.state = HALF_OPEN
+                    state.probe_in_flight = False
+                    self.log.info(f"◐ {backend} half-open, sending a probe request")
+                if state.state == OPEN or (state.state == HALF_OPEN and state.probe_in_flight):
+                    blocked.add(backend)
+        return blocked
+
+    def started(self, backend):
+        """Note that a request was sent; a half-open backend takes one at a time"""
+        with self._lock:
+            state = self._backends.get(backend)
+            if state is not None and state.state == HALF_OPEN:
+                state.probe_in_flight = True
+
+    def record(self, backend, size, elapsed, ok, backend_count):
+        """Feed one finished call into the averages and update the breaker"""
+        if not self.enabled:
+            return
+        per_mb = elapsed / max(size, MIN_NORMALIZED_SIZE) * MB
+        with self._lock:
+            state = self._state(backend)
+            if state.state == HALF_OPEN:
+                self._finish_probe(backend, state, per_mb, ok)
+                return
+            if state.state == OPEN:
+                # A request that was already in flight when the breaker opened
+                return
+
+            state.samples += 1
+            if state.samples == 1:
+                state.latency = per_mb
+            else:
+                state.latency += self.alpha * (per_mb - state.latency)
+            state.error_rate += self.alpha * ((0.0 if ok else 1.0) - state.error_rate)
+
+            if state.samples < self.min_requests:
+                return
+            reason = self._outlier_reason(backend, state)
+            if reason and self._may_eject(backend_count):
+                self._eject(backend, state, reason)
+
+    def _peer_median(self, backend):
+        peers = [
+            s.latency for b, s in self._backends.items()
+            if b != backend and s.state == CLOSED and s.samples >= self.min_requests
+        ]
+        return statistics.median(peers) if peers else None
+
+    def _outlier_reason(self, backend, state):
+        if state.error_rate > self.error_threshold:
+            return f"error rate {state.error_rate:.0%}"
+        median = self._peer_median(backend)
+        if median and state.latency > self.latency_factor * median:
+            return f"latency {state.latency:.3f}s/MB vs median {median:.3f}s/MB"
+        return None
+
+    def _may_eject(self, backend_count):
+        ejected = sum(1 for s in self._backends.values() if s.state != CLOSED)
+        allowed = max(1, int(backend_count * self.max_ejection_percent / 100))
+        return ejected < allowed
+
+    def _eject(self, backend, state, reason):
+        state.ejections += 1
+        duration = self.ejection_time * min(state.ejections, MAX_EJECTION_MULTIPLIER)
+        state.state = OPEN
+        state.open_until = time.monotonic() + duration
+        state.probe_in_flight = False
+        self.log.warning(f"⚡ {backend} ejected for {duration:g}s ({reason})")
+
+    def _finish_probe(self, backend, state, per_mb, ok):
+        state.probe_in_flight = False
+        median = self._peer_median(backend)
+        slow = median is not None and per_mb > self.latency_factor * median
+        if ok and not slow:
+            state.state = CLOSED
+            state.ejections = 0
+            # Start over from the probe, not from the averages that got it ejected
+            state.samples = 1
+            state.latency = per_mb
+            state.error_rate = 0.0
+            self.log.info(f"✓ {backend} probe succeeded, breaker closed")
+        else:
+            self._eject(backend, state, "probe failed" if not ok else f"probe slow ({per_mb:.3f}s/MB)")
+
+    def retain(self, backends):
+        """Forget backends that are no longer discovered"""
+        with self._lock:
+            for backend in set(self._backends) - set(backends):
+                del self._backends[backend]
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                backend: {
+                    'state': s.state,
+                    'samples': s.samples,
+                    'latency_s_per_mb': s.latency,
+                    'error_rate': s.error_rate,
+                    'ejections': s.ejections,
+                }
+                for backend, s in self._backends.items()
+            }
@@ -0,0 +1,96 @@
+"""
+Status-aware retry policy for the load balancer.
+
+A failed attempt is only retried on another backend when all of these hold:
+
+    status      its code is in RETRY_CODES (errors raised before the call
+                reached a backend always qualify); DEADLINE_EXCEEDED or
+                INVALID_ARGUMENT would fail the same way elsewhere, so they
+                are returned to the caller at once
+    cap         the request has made fewer than RETRY_MAX_ATTEMPTS attempts
+    budget      retries stay within RETRY_BUDGET_PERCENT of the route's
+                requests (see common/budget.py), so a brown-out cannot turn
+                into a retry storm that resends every large payload
+    deadline    the backoff still leaves time before the caller's deadline
+
+Retries back off exponentially with full jitter: the n-th retry waits a
+random time up to RETRY_INITIAL_BACKOFF * RETRY_BACKOFF_MULTIPLIER**(n-1),
+capped at RETRY_MAX_BACKOFF seconds. RESOURCE_EXHAUSTED is the exception: an
+instance shedding load (see common/admission.py) answers at once, so the
+request goes to another instance without waiting.
+"""
+
+import os
+import random
+
+import grpc
+
+import budget
+
+DEFAULT_RETRY_CODES = 'UNAVAILABLE,RESOURCE_EXHAUSTED,ABORTED'
+
+# Retried without backoff: the instance is busy, not the cluster
+IMMEDIATE_CODES = {grpc.StatusCode.RESOURCE_EXHAUSTED}
+
+
+def parse_codes(value):
+    """'UNAVAILABLE, aborted' -> {StatusCode.UNAVAILABLE, StatusCode.ABORTED}"""
+    codes = set()
+    for name in value.split(','):
+        name = name.strip().upper()
+        if not name:
+            continue
+        if name not in grpc.StatusCode.__members__:
+            raise ValueError(f"Unknown status code '{name}' in RETRY_CODES")
+        codes.add(grpc.StatusCode[name])
+    return codes
+
+
+class RetryPolicy:
+    """Which failures of one route are retried, how often and after how long"""
+
+    def __init__(self, route_name=''):
+        self.route_name = route_name
+        self.codes = parse_codes(os.getenv('RETRY_CODES', DEFAULT_RETRY_CODES))
+        self.max_attempts = int(os.getenv('RETRY_MAX_ATTEMPTS', '3'))
+        self.initial_backoff = float(os.getenv('RETRY_INITIAL_BACKOFF', '0.05'))
+        self.max_backoff = float(os.getenv('RETRY_MAX_BACKOFF', '1'))
+        self.multiplier = float(os.getenv('RETRY_BACKOFF_MULTIPLIER', '2'))
+        self.budget = budget.RequestBudget(float(os.getenv('RETRY_BUDGET_PERCENT', '20')))
+
+    def on_request(self):
+        """Credit the retry budget; call once per request"""
+        self.budget.on_request()
+
+    def retryable(self, error):
+        if not isinstance(error, grpc.RpcError):
+            return True
+        return error.code() in self.codes
+
+    def backoff(self, retry):
+        """Jittered delay before the `retry`-th retry (1 for the first)"""
+        ceiling = min(self.max_backoff, self.initial_backoff * self.multiplier ** (retry - 1))
+        return random.uniform(0, ceiling)
+
+    def next_delay(self, error, attempts, remaining=None):
+        """Backoff before retrying after `attempts` failed attempts
+
+        Returns (delay, None) to retry, or (None, reason) to give up.
+        `remaining` is the caller's time left in seconds (None: no deadline).
+        """
+        if not self.retryable(error):
+            return None, f"{error.code().name} is not retryable"
+        if attempts >= self.max_attempts:
+            return None, f"reached {self.max_attempts} attempts"
+        if isinstance(error, grpc.RpcError) and error.code() in IMMEDIATE_CODES:
+            delay = 0.0
+        else:
+            delay = self.backoff(attempts)
+        if remaining is not None and delay >= remaining:
+            return None, "no time left before the deadline"
+        if not self.budget.try_spend():
+            return None, "retry budget exhausted"
+        return delay, None
+
+    def snapshot(self):
+        return {'budget': self.budget.snapshot()}
@@ -1,5 +1,6 @@
 import grpc
 from concurrent import futures
+import asyncio
 import time
 import os
 import sys
@@ -7,74 +8,231 @@ import sys
 sys.path.insert(0, '/app')
 import pipeline_pb2
 import pipeline_pb2_grpc
+import admission
+import health
+import log
+import metrics
+import channel_pool
+import deadline
+import result_cache
+import server_mode
+import stage_timing
 
 class TextInputServiceServicer(pipeline_pb2_grpc.TextInputServiceServicer):
     def __init__(self):
         self.service2_address = os.getenv('SERVICE2_ADDRESS', 'service2-loadbalancer:8062')
         self.instance_id = os.getenv('INSTANCE_ID', 'unknown')
-        print(f"[Service 1-{self.instance_id}] Initialized. Will forward to Service 2 at {self.service2_address}")
+        self.channel_pool = channel_pool.get_pool()
+        self.result_cache = result_cache.ResultCache()
+        self.log = log.get(f"Service 1-{self.instance_id}")
+        self.log.info(f"Initialized. Will forward to Service 2 at {self.service2_address}")
+        if self.result_cache.enabled:
+            self.result_cache.export_metrics()
+            self.log.info(f"Result cache: {self.result_cache.max_bytes:,} bytes, "
+                          f"TTL {self.result_cache.ttl or 'none'}")
 
     def ReceiveText(self, request, context):
-        print(f"\n[Service 1-{self.instance_id}] ===== Received Text Request =====")
-        print(f"[Service 1-{self.instance_id}] Request ID: {request.request_id}")
-        print(f"[Service 1-{self.instance_id}] Text length: {len(request.text)} characters")
-        print(f"[Service 1-{self.instance_id}] Instance: {self.instance_id}")
+        self._log_request(request)
         
         start_time = time.time()
         
         try:
-            print(f"[Service 1-{self.instance_id}] Forwarding to Service 2 (Preprocessing) at {self.service2_address}")
+            # A repeated document skips the chain entirely
+            cache_key = self.result_cache.key(request)
+            cached = self._cached_response(cache_key, start_time)
+            if cached is not None:
+                return cached
             
-            # ADDED: Larger message options
-            options = [
-                ('grpc.max_send_message_length', 100 * 1024 * 1024),
-                ('grpc.max_receive_message_length', 100 * 1024 * 1024),
-            ]
+            self.log.debug(f"Forwarding to Service 2 (Preprocessing) at {self.service2_address}")
             
-            with grpc.insecure_channel(self.service2_address, options=options) as channel:
-                stub = pipeline_pb2_grpc.PreprocessServiceStub(channel)
-                clean_request = pipeline_pb2.CleanRequest(
-                    text=request.text,
-                    request_id=request.request_id
-                )
-                clean_response = stub.CleanText(clean_request, timeout=300)  # Longer timeout
+            # Pooled channel: reuses the connection to Service 2 across requests
+            channel = self.channel_pool.get(self.service2_address)
+            stub = pipeline_pb2_grpc.PreprocessServiceStub(channel)
+            with stage_timing.downstream():
+                clean_response = deadline.call_downstream(context, stub.CleanText, self._build_clean_request(request), 300)
             
-            print(f"[Service 1-{self.instance_id}] Received response from Service 2")
+            response = self._build_text_response(clean_response, start_time, "processed")
+            self.result_cache.put(cache_key, response.SerializeToString())
+            return response
             
-            word_count = len(clean_response.cleaned_text.split())
-            elapsed_time = time.time() - start_time
+        except grpc.RpcError as e:
+            if channel_pool.is_connection_error(e):
+                self.channel_pool.invalidate(self.service2_address)
+            return self._rpc_error_response(e, context)
+        except Exception as e:
+            return self._error_response(e, context)
+
+    def StreamText(self, request_iterator, context):
+        log.bind_request('')
+        self.log.debug("Received streaming text request")
+        
+        start_time = time.time()
+        
+        def clean_frames():
+            # Relay frames to Service 2 as they arrive instead of buffering the document
+            for frame in request_iterator:
+                yield self._clean_frame(frame)
+        
+        try:
+            self.log.debug(f"Streaming to Service 2 (Preprocessing) at {self.service2_address}")
             
-            print(f"[Service 1-{self.instance_id}] Total processing time: {elapsed_time:.3f}s")
-            print(f"[Service 1-{self.instance_id}] Word count: {word_count}")
+            channel = self.channel_pool.get(self.service2_address)
+            stub = pipeline_pb2_grpc.PreprocessServiceStub(channel)
+            with stage_timing.downstream():
+                clean_response = deadline.call_downstream(context, stub.StreamClean, clean_frames(), 300)
             
-            return pipeline_pb2.TextResponse(
-                status="success",
-                message=f"Text processed successfully through pipeline in {elapsed_time:.3f}s",
-                word_count=word_count
-            )
+            return self._build_text_response(clean_response, start_time, "streamed")
             
         except grpc.RpcError as e:
-            print(f"[Service 1-{self.instance_id}] ERROR calling Service 2: {e.code()}: {e.details()}")
-            context.set_code(grpc.StatusCode.INTERNAL)
-            context.set_details(f"Failed to call preprocessing service: {e.details()}")
-            return pipeline_pb2.TextResponse(
-                status="error",
-                message=f"Pipeline failed: {e.details()}",
-                word_count=0
-            )
+            if channel_pool.is_connection_error(e):
+                self.channel_pool.invalidate(self.service2_address)
+            return self._rpc_error_response(e, context)
         except Exception as e:
-            print(f"[Service 1-{self.instance_id}] ERROR: {str(e)}")
-            context.set_code(grpc.StatusCode.INTERNAL)
-            context.set_details(str(e))
-            return pipeline_pb2.TextResponse(
-                status="error",
-                message=f"Internal error: {str(e)}",
-                word_count=0
-            )
+            return self._error_response(e, context)
+
+    def _log_request(self, request):
+        log.bind_request(request.request_id)
+        if request.payload:
+            self.log.debug(f"Received text request: payload of {len(request.payload)} bytes")
+        else:
+            self.log.debug(f"Received text request: {len(request.text)} characters")
+
+    def _cached_response(self, cache_key, start_time):
+        serialized = self.result_cache.get(cache_key)
+        if serialized is None:
+            return None
+        response = pipeline_pb2.TextResponse.FromString(serialized)
+        # The rest of the pipeline did not run this time
+        del response.timings[:]
+        elapsed_time = time.time() - start_time
+        response.message = f"Text served from cache in {elapsed_time:.3f}s"
+        stats = self.result_cache.stats()
+        self.log.info(f"Served from cache in {elapsed_time:.3f}s ({stats['hits']} hits, "
+                      f"{stats['misses']} misses, {stats['entries']} entries)")
+        return response
+
+    def _build_clean_request(self, request):
+        # Summary mode: Service 2 returns counts only, not the cleaned text
+        # The payload is handed on as-is; Service 1 never decodes it
+        return pipeline_pb2.CleanRequest(
+            text=request.text,
+            payload=request.payload,
+            request_id=request.request_id,
+            response_mode=pipeline_pb2.RESPONSE_MODE_SUMMARY,
+            include_word_counts=request.include_word_counts
+        )
+
+    def _clean_frame(self, frame):
+        return pipeline_pb2.CleanRequest(
+            text=frame.text,
+            payload=frame.payload,
+            request_id=frame.request_id,
+            include_word_counts=frame.include_word_counts
+        )
+
+    def _build_text_response(self, clean_response, start_time, verb):
+        word_count = clean_response.word_count
+        elapsed_time = time.time() - start_time
+        
+        self.log.info(f"Processed in {elapsed_time:.3f}s: {word_count} words")
+        
+        response = pipeline_pb2.TextResponse(
+            status="success",
+            message=f"Text {verb} successfully through pipeline in {elapsed_time:.3f}s",
+            word_count=word_count,
+            analysis=clean_response.analysis
+        )
+        return stage_timing.adopt(response, clean_response)
+
+    def _rpc_error_response(self, e, context):
+        self.log.error(f"Error calling Service 2: {e.code()}: {e.details()}")
+        context.set_code(deadline.upstream_code(e))
+        context.set_details(f"Failed to call preprocessing service: {e.details()}")
+        return pipeline_pb2.TextResponse(
+            status="error",
+            message=f"Pipeline failed: {e.details()}",
+            word_count=0
+        )
+
+    def _error_response(self, e, context):
+        self.log.exception(f"Error: {str(e)}")
+        context.set_code(grpc.StatusCode.INTERNAL)
+        context.set_details(str(e))
+        return pipeline_pb2.TextResponse(
+            status="error",
+            message=f"Internal error: {str(e)}",
+            word_count=0
+        )
+
+
+class AsyncTextInputServiceServicer(TextInputServiceServicer):
+    """grpc.aio variant: awaits Service 2 instead of blocking a worker thread"""
+
+    def __init__(self):
+        super().__init__()
+        self.aio_channel_pool = channel_pool.get_aio_pool()
+
+    async def ReceiveText(self, request, context):
+        self._log_request(request)
+        
+        start_time = time.time()
+        
+        try:
+            # Hashing a large document is CPU work; keep it off the event loop
+            cache_key = await server_mode.run_cpu(self.result_cache.key, request)
+            cached = self._cached_response(cache_key, start_time)
+            if cached is not None:
+                return cached
+            
+            self.log.debug(f"Forwarding to Service 2 (Preprocessing) at {self.service2_address}")
+            
+            stub = pipeline_pb2_grpc.PreprocessServiceStub(self.aio_channel_pool.get(self.service2_address))
+            with stage_timing.downstream():
+                clean_response = await stub.CleanText(self._build_clean_request(request),
+                                                      timeout=deadline.downstream_timeout(context, 300))
+            
+            response = self._build_text_response(clean_response, start_time, "processed")
+            self.result_cache.put(cache_key, response.SerializeToString())
+            return response
+            
+        except grpc.RpcError as e:
+            if channel_pool.is_connection_error(e):
+                self.aio_channel_pool.invalidate(self.service2_address)
+            return self._rpc_error_response(e, context)
+        except Exception as e:
+            return self._error_response(e, context)
+
+    async def StreamText(self, request_iterator, context):
+        log.bind_request('')
+        self.log.debug("Received streaming text request")
+        
+        start_time = time.time()
+        
+        async def clean_frames():
+            async for frame in request_iterator:
+                yield self._clean_frame(frame)
+        
+        try:
+            self.log.debug(f"Streaming to Service 2 (Preprocessing) at {self.service2_address}")
+            
+            stub = pipeline_pb2_grpc.PreprocessServiceStub(self.aio_channel_pool.get(self.service2_address))
+            with stage_timing.downstream():
+                clean_response = await stub.StreamClean(clean_frames(), timeout=deadline.downstream_timeout(context, 300))
+            
+            return self._build_text_response(clean_response, start_time, "streamed")
+            
+        except grpc.RpcError as e:
+            if channel_pool.is_connection_error(e):
+                self.aio_channel_pool.invalidate(self.service2_address)
+            return self._rpc_error_response(e, context)
+        except Exception as e:
+            return self._error_response(e, context)
 
 def serve():
     port = os.getenv('PORT', '8051')
     instance_id = os.getenv('INSTANCE_ID', 'default')
+    log.configure('service1', instance_id)
+    logger = log.get(f"Service 1-{instance_id}")
     
     # ADDED: Server options for larger messages
     server_options = [
@@ -82,13 +240,44 @@ def serve():
         ('grpc.max_receive_message_length', 100 * 1024 * 1024),
     ]
     
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10), options=server_options)
+    metrics.start(f"Service 1-{instance_id}")
+    
+    if server_mode.is_aio():
+        asyncio.run(serve_aio(port, instance_id, server_options))
+        return
+    
+    server = grpc.server(
+        metrics.track_executor(futures.ThreadPoolExecutor(max_workers=10)), options=server_options,
+        maximum_concurrent_rpcs=server_mode.max_concurrent_rpcs(),
+        interceptors=(metrics.interceptors()
+                      + stage_timing.interceptors(f"Service 1-{instance_id}")
+                      + admission.interceptors(f"Service 1-{instance_id}"))
+    )
     pipeline_pb2_grpc.add_TextInputServiceServicer_to_server(TextInputServiceServicer(), server)
+    health.add_health_servicer(server, 'pipeline.TextInputService')
     server.add_insecure_port(f'[::]:{port}')
     server.start()
-    print(f"[Service 1-{instance_id} - Text Input Service] Started on port {port} (100MB limit)")
-    print(f"[Service 1-{instance_id}] Waiting for requests...")
+    logger.info(f"Text Input Service started on port {port} (100MB limit)")
+    logger.info("Waiting for requests...")
     server.wait_for_termination()
 
+async def serve_aio(port, instance_id, server_options):
+    logger = log.get(f"Service 1-{instance_id}")
+    metrics.track_executor(server_mode.cpu_executor(), 'cpu')
+    server = grpc.aio.server(
+        options=server_options,
+        maximum_concurrent_rpcs=server_mode.max_concurrent_rpcs(),
+        interceptors=(metrics.aio_interceptors()
+                      + stage_timing.aio_interceptors(f"Service 1-{instance_id}")
+                      + admission.aio_interceptors(f"Service 1-{instance_id}"))
+    )
+    pipeline_pb2_grpc.add_TextInputServiceServicer_to_server(AsyncTextInputServiceServicer(), server)
+    await health.add_aio_health_servicer(server, 'pipeline.TextInputService')
+    server.add_insecure_port(f'[::]:{port}')
+    await server.start()
+    logger.info(f"Text Input Service started on port {port} (aio mode, max {server_mode.max_concurrent_rpcs()} concurrent RPCs)")
+    logger.info("Waiting for requests...")
+    await server.wait_for_termination()
+
 if __name__ == '__main__':
     serve()
\ No newline at end of file
@@ -1,87 +1,333 @@
 import grpc
+import logging
 from concurrent import futures
+import asyncio
 import time
 import os
 import sys
-import re
 
 # Add proto directory to path
 sys.path.insert(0, '/app')
 
 import pipeline_pb2
 import pipeline_pb2_grpc
+import admission
+import health
+import log
+import metrics
+import channel_pool
+import deadline
+import normalizer
+import server_mode
+import stage_timing
+
+def clean_text(text):
+    """Lowercase, drop special characters and collapse whitespace"""
+    # One translate pass plus a space squeeze instead of lower() + regex + split/join
+    return normalizer.normalize(text)
+
+
+def request_body(request):
+    """The request's text: the bytes payload when set, otherwise the string field"""
+    return request.payload or request.text
+
+
+def clean_body(body):
+    return normalizer.normalize_bytes(body) if isinstance(body, bytes) else clean_text(body)
+
+
+def body_length(body):
+    return normalizer.char_length(body) if isinstance(body, bytes) else len(body)
+
+
+class FrameCleaner:
+    """Cleans a streamed document frame by frame.
+
+    A word cut off at a frame boundary is held back and prepended to the next
+    frame, so every cleaned frame holds whole words. Joining the cleaned
+    frames with single spaces gives the same text as clean_text().
+    """
+
+    def __init__(self):
+        self.carry = b''
+        self.utf8_tail = b''
+        self.frames = 0
+        self.original_length = 0
+        self.cleaned_length = 0
+
+    def feed(self, text):
+        """Clean one frame (str or UTF-8 bytes); returns its whole words as bytes (b'' if none)"""
+        data = text if isinstance(text, bytes) else text.encode('utf-8', 'surrogatepass')
+        self.frames += 1
+        self.original_length += normalizer.char_length(data)
+        # Hold back a character split across frames so it is translated whole
+        if self.utf8_tail:
+            data = self.utf8_tail + data
+        data, self.utf8_tail = normalizer.split_utf8_tail(data)
+        cleaned = self.carry + normalizer.translate(data)
+        text = normalizer.collapse_spaces(cleaned)
+        if text and cleaned[-1:] != b' ':
+            text, _, self.carry = text.rpartition(b' ')
+        else:
+            self.carry = b''
+        return self._emit(text)
+
+    def flush(self):
+        """Return the word held back from the last frame"""
+        text, self.carry = self.carry, b''
+        return self._emit(text)
+
+    def _emit(self, text):
+        if text:
+            # Frames are joined with a single space, matching the unary output
+            self.cleaned_length += len(text) + (1 if self.cleaned_length else 0)
+        return text
+
 
 class PreprocessServiceServicer(pipeline_pb2_grpc.PreprocessServiceServicer):
     def __init__(self):
         self.service3_address = os.getenv('SERVICE3_ADDRESS', 'service3-loadbalancer:8063')
         self.instance_id = os.getenv('INSTANCE_ID', 'unknown')
-        print(f"[Service 2-{self.instance_id}] Initialized. Will forward to Service 3 at {self.service3_address}")
+        self.channel_pool = channel_pool.get_pool()
+        # Only echo the cleaned text back when a caller asks for it
+        default_mode = os.getenv('CLEAN_RESPONSE_MODE', 'summary').lower()
+        self.default_response_mode = (
+            pipeline_pb2.RESPONSE_MODE_FULL if default_mode == 'full' else pipeline_pb2.RESPONSE_MODE_SUMMARY
+        )
+        self.log = log.get(f"Service 2-{self.instance_id}")
+        self.log.info(f"Initialized. Will forward to Service 3 at {self.service3_address}")
 
     def CleanText(self, request, context):
-        print(f"\n[Service 2-{self.instance_id}] ===== Received Clean Request =====")
-        print(f"[Service 2-{self.instance_id}] Request ID: {request.request_id}")
-        print(f"[Service 2-{self.instance_id}] Text length: {len(request.text)} characters")
-        print(f"[Service 2-{self.instance_id}] Instance: {self.instance_id}")
+        self._log_request(request)
         
         start_time = time.time()
         
         try:
             # Clean the text
-            print(f"[Service 2-{self.instance_id}] Cleaning text...")
-            original_length = len(request.text)
+            self.log.debug("Cleaning text...")
+            cleaned = clean_body(request_body(request))
             
-            # Convert to lowercase
-            cleaned = request.text.lower()
+            analysis_request = self._build_analysis_request(request, cleaned)
             
-            # Remove special characters but keep spaces and basic punctuation
-            cleaned = re.sub(r'[^a-z0-9\s\']', ' ', cleaned)
+            # Pooled channel: reuses the connection to Service 3 across requests
+            channel = self.channel_pool.get(self.service3_address)
+            stub = pipeline_pb2_grpc.AnalysisServiceStub(channel)
+            with stage_timing.downstream():
+                analysis_response = deadline.call_downstream(context, stub.AnalyzeText, analysis_request, 300)
             
-            # Remove extra whitespace
-            cleaned = ' '.join(cleaned.split())
+            return self._build_clean_response(request, cleaned, analysis_response, start_time)
             
-            cleaned_length = len(cleaned)
-            
-            print(f"[Service 2-{self.instance_id}] Original length: {original_length}")
-            print(f"[Service 2-{self.instance_id}] Cleaned length: {cleaned_length}")
-            print(f"[Service 2-{self.instance_id}] Cleaned preview: {cleaned[:100]}...")
+        except grpc.RpcError as e:
+            self.log.error(f"Error calling Service 3: {e.code()}: {e.details()}")
+            if channel_pool.is_connection_error(e):
+                self.channel_pool.invalidate(self.service3_address)
+            context.set_code(deadline.upstream_code(e))
+            context.set_details(f"Failed to call analysis service: {e.details()}")
+            raise
+        except Exception as e:
+            self.log.exception(f"Error: {str(e)}")
+            context.set_code(grpc.StatusCode.INTERNAL)
+            context.set_details(str(e))
+            raise
+
+    def StreamClean(self, request_iterator, context):
+        log.bind_request('')
+        self.log.debug("Received streaming clean request")
+        
+        start_time = time.time()
+        cleaner = FrameCleaner()
+        stats = {'request_id': '', 'include_word_counts': False}
+        
+        def cleaned_frames():
+            # Clean each frame as it arrives so transfer overlaps with compute
+            for frame in request_iterator:
+                self._note_first_frame(stats, frame)
+                text = cleaner.feed(request_body(frame))
+                if text:
+                    yield self._analysis_frame(stats, text)
+            text = cleaner.flush()
+            if text:
+                yield self._analysis_frame(stats, text)
+        
+        try:
+            self.log.debug(f"Streaming cleaned frames to Service 3 at {self.service3_address}")
             
-            # Forward to Service 3 (Analysis)
-            print(f"[Service 2-{self.instance_id}] Forwarding to Service 3 (Analysis) at {self.service3_address}")
+            channel = self.channel_pool.get(self.service3_address)
+            stub = pipeline_pb2_grpc.AnalysisServiceStub(channel)
+            with stage_timing.downstream():
+                analysis_response = deadline.call_downstream(context, stub.StreamAnalyze, cleaned_frames(), 300)
             
-            # ADDED: Larger message options
-            options = [
-                ('grpc.max_send_message_length', 100 * 1024 * 1024),
-                ('grpc.max_receive_message_length', 100 * 1024 * 1024),
-            ]
+            return self._build_stream_response(cleaner, analysis_response, start_time)
             
-            with grpc.insecure_channel(self.service3_address, options=options) as channel:
-                stub = pipeline_pb2_grpc.AnalysisServiceStub(channel)
-                analysis_request = pipeline_pb2.AnalysisRequest(
-                    text=cleaned,
-                    request_id=request.request_id
-                )
-                analysis_response = stub.AnalyzeText(analysis_request, timeout=300)  # Longer timeout
+        except grpc.RpcError as e:
+            self.log.error(f"Error calling Service 3: {e.code()}: {e.details()}")
+            if channel_pool.is_connection_error(e):
+                self.channel_pool.invalidate(self.service3_address)
+            context.set_code(deadline.upstream_code(e))
+            context.set_details(f"Failed to call analysis service: {e.details()}")
+            raise
+        except Exception as e:
+            self.log.exception(f"Error: {str(e)}")
+            context.set_code(grpc.StatusCode.INTERNAL)
+            context.set_details(str(e))
+            raise
+
+    def _log_request(self, request):
+        log.bind_request(request.request_id)
+        if request.payload:
+            self.log.debug(f"Received clean request: payload of {len(request.payload)} bytes")
+        else:
+            self.log.debug(f"Received clean request: {len(request.text)} characters")
+
+    def _build_analysis_request(self, request, cleaned):
+        if self.log.isEnabledFor(logging.DEBUG):
+            preview = cleaned[:100]
+            if isinstance(preview, bytes):
+                preview = preview.decode('ascii')
+            self.log.debug(f"Original length: {body_length(request_body(request))}")
+            self.log.debug(f"Cleaned length: {len(cleaned)}")
+            self.log.debug(f"Cleaned preview: {preview}...")
+        
+        # Forward to Service 3 (Analysis)
+        self.log.debug(f"Forwarding to Service 3 (Analysis) at {self.service3_address}")
+        
+        return self._analysis_message(cleaned, request.request_id, request.include_word_counts)
+
+    def _analysis_message(self, cleaned, request_id, include_word_counts):
+        # Bytes stay bytes: Service 3 counts them without decoding
+        if isinstance(cleaned, bytes):
+            return pipeline_pb2.AnalysisRequest(
+                payload=cleaned,
+                request_id=request_id,
+                include_word_counts=include_word_counts
+            )
+        return pipeline_pb2.AnalysisRequest(
+            text=cleaned,
+            request_id=request_id,
+            include_word_counts=include_word_counts
+        )
+
+    def _build_clean_response(self, request, cleaned, analysis_response, start_time):
+        elapsed_time = time.time() - start_time
+        self.log.info(f"Processed in {elapsed_time:.3f}s: {analysis_response.total_words} words, "
+                      f"{analysis_response.unique_words} unique")
+        
+        response_mode = request.response_mode or self.default_response_mode
+        
+        response = pipeline_pb2.CleanResponse(
+            original_length=body_length(request_body(request)),
+            cleaned_length=len(cleaned),
+            word_count=analysis_response.total_words,
+            analysis=analysis_response
+        )
+        if response_mode == pipeline_pb2.RESPONSE_MODE_FULL:
+            if isinstance(cleaned, bytes):
+                response.cleaned_payload = cleaned
+            else:
+                response.cleaned_text = cleaned
+        return stage_timing.adopt(response, response.analysis)
+
+    def _note_first_frame(self, stats, frame):
+        if not stats['request_id'] and frame.request_id:
+            stats['request_id'] = frame.request_id
+            log.bind_request(frame.request_id)
+            self.log.debug(f"Request ID: {frame.request_id}")
+        stats['include_word_counts'] = stats['include_word_counts'] or frame.include_word_counts
+
+    def _analysis_frame(self, stats, text):
+        return self._analysis_message(text, stats['request_id'], stats['include_word_counts'])
+
+    def _build_stream_response(self, cleaner, analysis_response, start_time):
+        self.log.debug(f"Frames cleaned: {cleaner.frames}, original length {cleaner.original_length}, "
+                       f"cleaned length {cleaner.cleaned_length}")
+        
+        elapsed_time = time.time() - start_time
+        self.log.info(f"Processed stream in {elapsed_time:.3f}s: {analysis_response.total_words} words")
+        
+        response = pipeline_pb2.CleanResponse(
+            original_length=cleaner.original_length,
+            cleaned_length=cleaner.cleaned_length,
+            word_count=analysis_response.total_words,
+            analysis=analysis_response
+        )
+        return stage_timing.adopt(response, response.analysis)
+
+
+class AsyncPreprocessServiceServicer(PreprocessServiceServicer):
+    """grpc.aio variant: cleaning runs on the CPU executor and Service 3 is awaited"""
+
+    def __init__(self):
+        super().__init__()
+        self.aio_channel_pool = channel_pool.get_aio_pool()
+
+    async def CleanText(self, request, context):
+        self._log_request(request)
+        
+        start_time = time.time()
+        
+        try:
+            self.log.debug("Cleaning text...")
+            cleaned = await server_mode.run_cpu(clean_body, request_body(request))
             
-            print(f"[Service 2-{self.instance_id}] Received response from Service 3")
-            print(f"[Service 2-{self.instance_id}] Total words analyzed: {analysis_response.total_words}")
-            print(f"[Service 2-{self.instance_id}] Unique words: {analysis_response.unique_words}")
+            analysis_request = self._build_analysis_request(request, cleaned)
             
-            elapsed_time = time.time() - start_time
-            print(f"[Service 2-{self.instance_id}] Processing time: {elapsed_time:.3f}s")
+            stub = pipeline_pb2_grpc.AnalysisServiceStub(self.aio_channel_pool.get(self.service3_address))
+            with stage_timing.downstream():
+                analysis_response = await stub.AnalyzeText(analysis_request,
+                                                           timeout=deadline.downstream_timeout(context, 300))
             
-            return pipeline_pb2.CleanResponse(
-                cleaned_text=cleaned,
-                original_length=original_length,
-                cleaned_length=cleaned_length
-            )
+            return self._build_clean_response(request, cleaned, analysis_response, start_time)
             
         except grpc.RpcError as e:
-            print(f"[Service 2-{self.instance_id}] ERROR calling Service 3: {e.code()}: {e.details()}")
+            self.log.error(f"Error calling Service 3: {e.code()}: {e.details()}")
+            if channel_pool.is_connection_error(e):
+                self.aio_channel_pool.invalidate(self.service3_address)
+            context.set_code(deadline.upstream_code(e))
+            context.set_details(f"Failed to call analysis service: {e.details()}")
+            raise
+        except Exception as e:
+            self.log.exception(f"Error: {str(e)}")
             context.set_code(grpc.StatusCode.INTERNAL)
+            context.set_details(str(e))
+            raise
+
+    async def StreamClean(self, request_iterator, context):
+        log.bind_request('')
+        self.log.debug("Received streaming clean request")
+        
+        start_time = time.time()
+        cleaner = FrameCleaner()
+        stats = {'request_id': '', 'include_word_counts': False}
+        
+        async def cleaned_frames():
+            async for frame in request_iterator:
+                self._note_first_frame(stats, frame)
+                text = await server_mode.run_cpu(cleaner.feed, request_body(frame))
+                if text:
+                    yield self._analysis_frame(stats, text)
+            text = cleaner.flush()
+            if text:
+                yield self._analysis_frame(stats, text)
+        
+        try:
+            self.log.debug(f"Streaming cleaned frames to Service 3 at {self.service3_address}")
+            
+            stub = pipeline_pb2_grpc.AnalysisServiceStub(self.aio_channel_pool.get(self.service3_address))
+            with stage_timing.downstream():
+                analysis_response = await stub.StreamAnalyze(cleaned_frames(),
+                                                              timeout=deadline.downstream_timeout(context, 300))
+            
+            return self._build_stream_response(cleaner, analysis_response, start_time)
+            
+        except grpc.RpcError as e:
+            self.log.error(f"Error calling Service 3: {e.code()}: {e.details()}")
+            if channel_pool.is_connection_error(e):
+                self.aio_channel_pool.invalidate(self.service3_address)
+            context.set_code(deadline.upstream_code(e))
             context.set_details(f"Failed to call analysis service: {e.details()}")
             raise
         except Exception as e:
-            print(f"[Service 2-{self.instance_id}] ERROR: {str(e)}")
+            self.log.exception(f"Error: {str(e)}")
             context.set_code(grpc.StatusCode.INTERNAL)
             context.set_details(str(e))
             raise
@@ -89,6 +335,8 @@ class PreprocessServiceServicer(pipeline_pb2_grpc.PreprocessServiceServicer):
 def serve():
     port = os.getenv('PORT', '8052')
     instance_id = os.getenv('INSTANCE_ID', 'default')
+    log.configure('service2', instance_id)
+    logger = log.get(f"Service 2-{instance_id}")
     
     # ADDED: Server options for larger messages
     server_options = [
@@ -96,15 +344,46 @@ def serve():
         ('grpc.max_receive_message_length', 100 * 1024 * 1024),
     ]
     
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10), options=server_options)
+    metrics.start(f"Service 2-{instance_id}")
+    
+    if server_mode.is_aio():
+        asyncio.run(serve_aio(port, instance_id, server_options))
+        return
+    
+    server = grpc.server(
+        metrics.track_executor(futures.ThreadPoolExecutor(max_workers=10)), options=server_options,
+        maximum_concurrent_rpcs=server_mode.max_concurrent_rpcs(),
+        interceptors=(metrics.interceptors()
+                      + stage_timing.interceptors(f"Service 2-{instance_id}")
+                      + admission.interceptors(f"Service 2-{instance_id}"))
+    )
     pipeline_pb2_grpc.add_PreprocessServiceServicer_to_server(
         PreprocessServiceServicer(), server
     )
+    health.add_health_servicer(server, 'pipeline.PreprocessService')
     server.add_insecure_port(f'[::]:{port}')
     server.start()
-    print(f"[Service 2-{instance_id} - Preprocessing Service] Started on port {port} (100MB limit)")
-    print(f"[Service 2-{instance_id}] Waiting for requests...")
+    logger.info(f"Preprocessing Service started on port {port} (100MB limit)")
+    logger.info("Waiting for requests...")
     server.wait_for_termination()
 
+async def serve_aio(port, instance_id, server_options):
+    logger = log.get(f"Service 2-{instance_id}")
+    metrics.track_executor(server_mode.cpu_executor(), 'cpu')
+    server = grpc.aio.server(
+        options=server_options,
+        maximum_concurrent_rpcs=server_mode.max_concurrent_rpcs(),
+        interceptors=(metrics.aio_interceptors()
+                      + stage_timing.aio_interceptors(f"Service 2-{instance_id}")
+                      + admission.aio_interceptors(f"Service 2-{instance_id}"))
+    )
+    pipeline_pb2_grpc.add_PreprocessServiceServicer_to_server(AsyncPreprocessServiceServicer(), server)
+    await health.add_aio_health_servicer(server, 'pipeline.PreprocessService')
+    server.add_insecure_port(f'[::]:{port}')
+    await server.start()
+    logger.info(f"Preprocessing Service started on port {port} (aio mode, max {server_mode.max_concurrent_rpcs()} concurrent RPCs)")
+    logger.info("Waiting for requests...")
+    await server.wait_for_termination()
+
 if __name__ == '__main__':
     serve()
\ No newline at end of file
@@ -0,0 +1,91 @@
+"""
+Single-pass text normalizer used by Service 2.
+
+The original cleaner lowercased the text, ran a regex over it and then
+collapsed whitespace with split/join: three full passes, each with its own
+copy of the document, plus one object per word. Here lowercasing and
+character filtering are a single bytes.translate over a 256-entry table
+built once at import. Afterwards the only separator left is the space byte,
+so whitespace is collapsed with a few C-level replace passes instead of
+splitting into words. The output is identical to legacy_normalize() for
+every input.
+"""
+
+import re
+
+# Characters that survive cleaning; everything else becomes a word separator
+KEPT = "abcdefghijklmnopqrstuvwxyz0123456789'"
+
+_LEGACY_PATTERN = re.compile(r"[^a-z0-9\s']")
+
+# A-Z map to a-z, kept bytes map to themselves, every other byte (including
+# each byte of a multi-byte UTF-8 sequence) becomes a space.
+TABLE = bytes(
+    byte + 32 if 65 <= byte <= 90 else byte if chr(byte) in KEPT else 32
+    for byte in range(256)
+)
+
+# The only non-ASCII characters whose lowercase form contains a kept
+# character: KELVIN SIGN lowers to 'k' and LATIN CAPITAL LETTER I WITH DOT
+# ABOVE to 'i' + COMBINING DOT ABOVE. normalizer_benchmark.py --verify checks
+# this against every code point.
+SPECIAL_CASES = (
+    ('\u212a'.encode('utf-8'), b'k'),
+    ('\u0130'.encode('utf-8'), b'i '),
+)
+
+_UTF8_CONTINUATION = bytes(range(0x80, 0xc0))
+
+
+def legacy_normalize(text):
+    """Reference implementation: lower(), regex filter, whitespace collapse"""
+    return ' '.join(_LEGACY_PATTERN.sub(' ', text.lower()).split())
+
+
+def translate(data):
+    """Lowercase and filter UTF-8 bytes in one pass; separators become spaces"""
+    if not data.isascii():
+        for sequence, replacement in SPECIAL_CASES:
+            if sequence in data:
+                data = data.replace(sequence, replacement)
+    return data.translate(TABLE)
+
+
+def collapse_spaces(data):
+    """Squeeze runs of spaces in translated bytes and strip the ends"""
+    # Each pass halves every run, so this takes log2(longest run) passes
+    while b'  ' in data:
+        data = data.replace(b'  ', b' ')
+    return data.strip(b' ')
+
+
+def normalize_bytes(data):
+    """Normalize UTF-8 bytes without decoding them; returns ASCII bytes"""
+    return collapse_spaces(translate(data))
+
+
+def normalize(text):
+    """Normalize a str; same result as legacy_normalize()"""
+    # Encoding is a near-memcpy for ASCII text and far cheaper than lower() + regex
+    return normalize_bytes(text.encode('utf-8', 'surrogatepass')).decode('ascii')
+
+
+def char_length(data):
+    """Number of characters in UTF-8 `data`, counted without decoding it"""
+    if data.isascii():
+        return len(data)
+    return len(data.translate(None, _UTF8_CONTINUATION))
+
+
+def split_utf8_tail(data):
+    """Split a multi-byte sequence cut off at the end of `data` from the rest"""
+    for back in range(1, min(4, len(data)) + 1):
+        byte = data[-back]
+        if byte < 0x80:
+            break
+        if byte >= 0xc0:
+            needed = 2 if byte < 0xe0 else 3 if byte < 0xf0 else 4
+            if needed > back:
+                return data[:-back], data[-back:]
+            break
+    return data, b''
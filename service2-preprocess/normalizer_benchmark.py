@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark for the Service 2 normalizer on the datasets/ corpora.
+
+Compares the old three-pass cleaner (lower + regex + split/join) with the
+single-pass normalizer on str input and on bytes payloads, checks that all
+three produce identical output, and reports throughput in MB/s of UTF-8
+input. The sample corpora are small, so each one is repeated up to
+--min-size MB before timing.
+
+    python service2-preprocess/normalizer_benchmark.py
+    python service2-preprocess/normalizer_benchmark.py --verify datasets/*
+"""
+
+import argparse
+import glob
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import normalizer
+
+DEFAULT_DATASETS = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'datasets', '*')
+
+
+def verify_code_points():
+    """Check every code point, alone and between words, against the legacy cleaner"""
+    mismatches = []
+    for cp in range(0x110000):
+        char = chr(cp)
+        for text in (char, f"Ab{char}cD {char}"):
+            expected = normalizer.legacy_normalize(text)
+            if normalizer.normalize(text) != expected:
+                mismatches.append(cp)
+                break
+    return mismatches
+
+
+def best_time(fn, arg, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(arg)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def load_corpora(paths, min_size):
+    corpora = []
+    for path in paths:
+        with open(path, 'r', encoding='utf-8') as f:
+            text = f.read()
+        if text:
+            corpora.append((os.path.basename(path), text))
+    if len(corpora) > 1:
+        corpora.append(('all corpora', '\n'.join(text for _, text in corpora)))
+
+    scaled = []
+    for name, text in corpora:
+        size = len(text.encode('utf-8'))
+        copies = max(1, -(-min_size // size))
+        scaled.append((name, text * copies))
+    return scaled
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('paths', nargs='*', help='corpus files (default: datasets/*)')
+    parser.add_argument('--min-size', type=float, default=8, help='MB each corpus is repeated up to')
+    parser.add_argument('--repeat', type=int, default=5, help='timed runs per case (best is reported)')
+    parser.add_argument('--verify', action='store_true', help='also check every Unicode code point')
+    args = parser.parse_args()
+
+    paths = args.paths or sorted(glob.glob(DEFAULT_DATASETS))
+    if not paths:
+        print("⚠️  No corpus files found")
+        return 1
+
+    if args.verify:
+        print("🔍 Checking all code points against the legacy cleaner...")
+        mismatches = verify_code_points()
+        if mismatches:
+            print(f"✗ {len(mismatches)} mismatches, first: {[hex(cp) for cp in mismatches[:10]]}")
+            return 1
+        print("✓ Identical output for every code point")
+
+    corpora = load_corpora(paths, int(args.min_size * 1024 * 1024))
+
+    print("\n" + "=" * 80)
+    print("🧹 NORMALIZER MICROBENCHMARK (MB/s of UTF-8 input, best of {})".format(args.repeat))
+    print("=" * 80)
+    print(f"{'Corpus':<22} {'Size MB':>8} {'legacy':>9} {'str':>9} {'bytes':>9} {'str x':>7} {'bytes x':>8}")
+
+    failed = False
+    for name, text in corpora:
+        payload = text.encode('utf-8')
+        expected = normalizer.legacy_normalize(text)
+        exact = (normalizer.normalize(text) == expected
+                 and normalizer.normalize_bytes(payload) == expected.encode('ascii'))
+        failed = failed or not exact
+
+        megabytes = len(payload) / (1024 * 1024)
+        legacy = megabytes / best_time(normalizer.legacy_normalize, text, args.repeat)
+        single = megabytes / best_time(normalizer.normalize, text, args.repeat)
+        raw = megabytes / best_time(normalizer.normalize_bytes, payload, args.repeat)
+        print(f"{name:<22} {megabytes:8.1f} {legacy:9.1f} {single:9.1f} {raw:9.1f} "
+              f"{single / legacy:6.2f}x {raw / legacy:7.2f}x{'' if exact else '  ✗ OUTPUT DIFFERS'}")
+
+    print("\nlegacy = lower() + regex + split/join, str = normalizer.normalize(), "
+          "bytes = normalizer.normalize_bytes() on the payload")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
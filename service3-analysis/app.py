@@ -1,5 +1,6 @@
 import grpc
 from concurrent import futures
+import asyncio
 import time
 import os
 import sys
@@ -10,99 +11,321 @@ sys.path.insert(0, '/app')
 
 import pipeline_pb2
 import pipeline_pb2_grpc
+import admission
+import health
+import log
+import metrics
+import channel_pool
+import deadline
+import server_mode
+import stage_timing
+import word_counter
+
+
+def request_body(request):
+    """The request's text: the bytes payload when set, otherwise the string field"""
+    return request.payload or request.text
 
 
 class AnalysisServiceServicer(pipeline_pb2_grpc.AnalysisServiceServicer):
     def __init__(self):
         self.service4_address = os.getenv('SERVICE4_ADDRESS', 'service4-loadbalancer:8064')
         self.instance_id = os.getenv('INSTANCE_ID', 'unknown')
-        print(f"[Service 3-{self.instance_id}] Initialized. Will forward to Service 4 at {self.service4_address}")
+        self.channel_pool = channel_pool.get_pool()
+        self.log = log.get(f"Service 3-{self.instance_id}")
+        self.log.info(f"Initialized. Will forward to Service 4 at {self.service4_address}")
 
     def AnalyzeText(self, request, context):
-        print(f"\n[Service 3-{self.instance_id}] ===== Received Analysis Request =====")
-        print(f"[Service 3-{self.instance_id}] Request ID: {request.request_id}")
-        print(f"[Service 3-{self.instance_id}] Text length: {len(request.text)} characters")
-        print(f"[Service 3-{self.instance_id}] Instance: {self.instance_id}")
+        log.bind_request(request.request_id)
+        self.log.debug(f"Received analysis request: {len(request_body(request))} characters")
         
         start_time = time.time()
         
         try:
             # Analyze the text
-            print(f"[Service 3-{self.instance_id}] Analyzing text...")
-            
-            # Tokenize
-            words = request.text.split()
-            total_words = len(words)
+            self.log.debug("Analyzing text...")
             
-            # Count word frequencies
-            word_counts = Counter(words)
-            unique_words = len(word_counts)
+            # Tokenize and count word frequencies
+            word_counts, total_words = word_counter.count_words(request_body(request))
             
-            # Get top 10 most common words
-            top_words = word_counts.most_common(10)
+            return self._report_and_respond(
+                request.request_id, word_counts, total_words, len(request_body(request)), start_time,
+                request.include_word_counts, context
+            )
             
-            print(f"[Service 3-{self.instance_id}] Total words: {total_words}")
-            print(f"[Service 3-{self.instance_id}] Unique words: {unique_words}")
-            print(f"[Service 3-{self.instance_id}] Top 5 words: {top_words[:5]}")
+        except grpc.RpcError as e:
+            self.log.error(f"Error calling Service 4: {e.code()}: {e.details()}")
+            if channel_pool.is_connection_error(e):
+                self.channel_pool.invalidate(self.service4_address)
+            context.set_code(deadline.upstream_code(e))
+            context.set_details(f"Failed to call report service: {e.details()}")
+            raise
+        except Exception as e:
+            self.log.exception(f"Error: {str(e)}")
+            context.set_code(grpc.StatusCode.INTERNAL)
+            context.set_details(str(e))
+            raise
+
+    def StreamAnalyze(self, request_iterator, context):
+        log.bind_request('')
+        self.log.debug("Received streaming analysis request")
+        
+        start_time = time.time()
+        
+        try:
+            request_id = ''
+            include_word_counts = False
+            word_counts = Counter()
+            total_words = 0
+            cleaned_length = 0
+            frames = 0
+            payload_frames = False
             
-            # Prepare word frequencies for response
-            word_frequencies = [
-                pipeline_pb2.WordFrequency(word=word, count=count)
-                for word, count in top_words
-            ]
+            # Count incrementally; frames hold whole words, so no token spans two frames
+            for frame in request_iterator:
+                if not request_id and frame.request_id:
+                    request_id = frame.request_id
+                    log.bind_request(request_id)
+                    self.log.debug(f"Request ID: {request_id}")
+                include_word_counts = include_word_counts or frame.include_word_counts
+                text = request_body(frame)
+                payload_frames = payload_frames or bool(frame.payload)
+                frame_words = word_counter.count_frame(word_counts, text)
+                total_words += frame_words
+                if frame_words:
+                    # Frames are joined with a single space upstream
+                    cleaned_length += len(text) + (1 if cleaned_length else 0)
+                frames += 1
             
-            # Forward to Service 4 (Report)
-            print(f"[Service 3-{self.instance_id}] Forwarding to Service 4 (Report) at {self.service4_address}")
+            self.log.debug(f"Received {frames} frames, {cleaned_length} characters")
+            if payload_frames:
+                word_counts = word_counter.decode_counts(word_counts)
             
-            with grpc.insecure_channel(self.service4_address) as channel:
-                stub = pipeline_pb2_grpc.ReportServiceStub(channel)
-                report_request = pipeline_pb2.ReportRequest(
-                    request_id=request.request_id,
-                    word_frequencies=word_frequencies,
-                    total_words=total_words,
-                    unique_words=unique_words,
-                    original_length=0,  # These would be passed through in a real system
-                    cleaned_length=len(request.text)
-                )
-                report_response = stub.GenerateReport(report_request, timeout=30)
+            return self._report_and_respond(
+                request_id, word_counts, total_words, cleaned_length, start_time,
+                include_word_counts, context
+            )
             
-            print(f"[Service 3-{self.instance_id}] Received response from Service 4")
-            print(f"[Service 3-{self.instance_id}] Report generated in {report_response.processing_time:.3f}s")
+        except grpc.RpcError as e:
+            self.log.error(f"Error calling Service 4: {e.code()}: {e.details()}")
+            if channel_pool.is_connection_error(e):
+                self.channel_pool.invalidate(self.service4_address)
+            context.set_code(deadline.upstream_code(e))
+            context.set_details(f"Failed to call report service: {e.details()}")
+            raise
+        except Exception as e:
+            self.log.exception(f"Error: {str(e)}")
+            context.set_code(grpc.StatusCode.INTERNAL)
+            context.set_details(str(e))
+            raise
+
+    def _report_and_respond(self, request_id, word_counts, total_words, cleaned_length, start_time,
+                            include_word_counts=False, context=None):
+        """Send the counted statistics to Service 4 and build the analysis response"""
+        report_request = self._build_report_request(request_id, word_counts, total_words, cleaned_length)
+        
+        # Pooled channel: reuses the connection to Service 4 across requests
+        channel = self.channel_pool.get(self.service4_address)
+        stub = pipeline_pb2_grpc.ReportServiceStub(channel)
+        with stage_timing.downstream():
+            report_response = deadline.call_downstream(context, stub.GenerateReport, report_request, 30)
+        
+        return self._build_response(report_request, report_response, word_counts, start_time, include_word_counts)
+
+    def _build_report_request(self, request_id, word_counts, total_words, cleaned_length):
+        unique_words = len(word_counts)
+        
+        # Get top 10 most common words
+        top_words = word_counts.most_common(10)
+        
+        self.log.debug(f"Total words: {total_words}, unique words: {unique_words}, top 5: {top_words[:5]}")
+        
+        # Prepare word frequencies for response
+        word_frequencies = [
+            pipeline_pb2.WordFrequency(word=word, count=count)
+            for word, count in top_words
+        ]
+        
+        # Forward to Service 4 (Report)
+        self.log.debug(f"Forwarding to Service 4 (Report) at {self.service4_address}")
+        
+        return pipeline_pb2.ReportRequest(
+            request_id=request_id,
+            word_frequencies=word_frequencies,
+            total_words=total_words,
+            unique_words=unique_words,
+            original_length=0,  # These would be passed through in a real system
+            cleaned_length=cleaned_length
+        )
+
+    def _build_response(self, report_request, report_response, word_counts, start_time, include_word_counts):
+        elapsed_time = time.time() - start_time
+        self.log.info(f"Processed in {elapsed_time:.3f}s: {report_request.total_words} words, "
+                      f"{report_request.unique_words} unique (report took {report_response.processing_time:.3f}s)")
+        
+        response = pipeline_pb2.AnalysisResponse(
+            top_words=report_request.word_frequencies,
+            total_words=report_request.total_words,
+            unique_words=report_request.unique_words
+        )
+        if include_word_counts:
+            # Full table so clients can merge exact statistics across chunks
+            response.word_counts.update(word_counts)
+        return stage_timing.adopt(response, report_response)
+
+
+class AsyncAnalysisServiceServicer(AnalysisServiceServicer):
+    """grpc.aio variant: counting runs on the CPU executor and Service 4 is awaited"""
+
+    def __init__(self):
+        super().__init__()
+        self.aio_channel_pool = channel_pool.get_aio_pool()
+
+    async def AnalyzeText(self, request, context):
+        log.bind_request(request.request_id)
+        self.log.debug(f"Received analysis request: {len(request_body(request))} characters")
+        
+        start_time = time.time()
+        
+        try:
+            self.log.debug("Analyzing text...")
             
-            elapsed_time = time.time() - start_time
-            print(f"[Service 3-{self.instance_id}] Processing time: {elapsed_time:.3f}s")
+            word_counts, total_words = await server_mode.run_cpu(word_counter.count_words, request_body(request))
             
-            return pipeline_pb2.AnalysisResponse(
-                top_words=word_frequencies,
-                total_words=total_words,
-                unique_words=unique_words
+            return await self._report_and_respond_async(
+                request.request_id, word_counts, total_words, len(request_body(request)), start_time,
+                request.include_word_counts, context
             )
             
         except grpc.RpcError as e:
-            print(f"[Service 3-{self.instance_id}] ERROR calling Service 4: {e.code()}: {e.details()}")
+            self.log.error(f"Error calling Service 4: {e.code()}: {e.details()}")
+            if channel_pool.is_connection_error(e):
+                self.aio_channel_pool.invalidate(self.service4_address)
+            context.set_code(deadline.upstream_code(e))
+            context.set_details(f"Failed to call report service: {e.details()}")
+            raise
+        except Exception as e:
+            self.log.exception(f"Error: {str(e)}")
             context.set_code(grpc.StatusCode.INTERNAL)
+            context.set_details(str(e))
+            raise
+
+    async def StreamAnalyze(self, request_iterator, context):
+        log.bind_request('')
+        self.log.debug("Received streaming analysis request")
+        
+        start_time = time.time()
+        
+        try:
+            request_id = ''
+            include_word_counts = False
+            word_counts = Counter()
+            total_words = 0
+            cleaned_length = 0
+            frames = 0
+            payload_frames = False
+            
+            async for frame in request_iterator:
+                if not request_id and frame.request_id:
+                    request_id = frame.request_id
+                    log.bind_request(request_id)
+                    self.log.debug(f"Request ID: {request_id}")
+                include_word_counts = include_word_counts or frame.include_word_counts
+                # Only this coroutine touches word_counts, so counting off-loop is safe
+                text = request_body(frame)
+                payload_frames = payload_frames or bool(frame.payload)
+                frame_words = await server_mode.run_cpu(word_counter.count_frame, word_counts, text)
+                total_words += frame_words
+                if frame_words:
+                    cleaned_length += len(text) + (1 if cleaned_length else 0)
+                frames += 1
+            
+            self.log.debug(f"Received {frames} frames, {cleaned_length} characters")
+            if payload_frames:
+                word_counts = word_counter.decode_counts(word_counts)
+            
+            return await self._report_and_respond_async(
+                request_id, word_counts, total_words, cleaned_length, start_time,
+                include_word_counts, context
+            )
+            
+        except grpc.RpcError as e:
+            self.log.error(f"Error calling Service 4: {e.code()}: {e.details()}")
+            if channel_pool.is_connection_error(e):
+                self.aio_channel_pool.invalidate(self.service4_address)
+            context.set_code(deadline.upstream_code(e))
             context.set_details(f"Failed to call report service: {e.details()}")
             raise
         except Exception as e:
-            print(f"[Service 3-{self.instance_id}] ERROR: {str(e)}")
+            self.log.exception(f"Error: {str(e)}")
             context.set_code(grpc.StatusCode.INTERNAL)
             context.set_details(str(e))
             raise
 
+    async def _report_and_respond_async(self, request_id, word_counts, total_words, cleaned_length, start_time,
+                                        include_word_counts=False, context=None):
+        report_request = self._build_report_request(request_id, word_counts, total_words, cleaned_length)
+        
+        stub = pipeline_pb2_grpc.ReportServiceStub(self.aio_channel_pool.get(self.service4_address))
+        with stage_timing.downstream():
+            report_response = await stub.GenerateReport(report_request,
+                                                        timeout=deadline.downstream_timeout(context, 30))
+        
+        return self._build_response(report_request, report_response, word_counts, start_time, include_word_counts)
+
 
 def serve():
     port = os.getenv('PORT', '8053')
     instance_id = os.getenv('INSTANCE_ID', 'default')
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
+    log.configure('service3', instance_id)
+    logger = log.get(f"Service 3-{instance_id}")
+    if word_counter.worker_count() > 1:
+        word_counter.warm_up()
+        logger.info(f"Counting pool ready: {word_counter.worker_count()} workers, "
+                    f"documents >= {word_counter.parallel_threshold():,} bytes counted in parallel")
+    
+    metrics.start(f"Service 3-{instance_id}")
+    
+    if server_mode.is_aio():
+        asyncio.run(serve_aio(port, instance_id, None))
+        return
+    
+    server = grpc.server(
+        metrics.track_executor(futures.ThreadPoolExecutor(max_workers=10)),
+        maximum_concurrent_rpcs=server_mode.max_concurrent_rpcs(),
+        interceptors=(metrics.interceptors()
+                      + stage_timing.interceptors(f"Service 3-{instance_id}")
+                      + admission.interceptors(f"Service 3-{instance_id}"))
+    )
     pipeline_pb2_grpc.add_AnalysisServiceServicer_to_server(
         AnalysisServiceServicer(), server
     )
+    health.add_health_servicer(server, 'pipeline.AnalysisService')
     server.add_insecure_port(f'[::]:{port}')
     server.start()
-    print(f"[Service 3-{instance_id} - Analysis Service] Started on port {port}")
-    print(f"[Service 3-{instance_id}] Waiting for requests...")
+    logger.info(f"Analysis Service started on port {port}")
+    logger.info("Waiting for requests...")
     server.wait_for_termination()
 
 
+async def serve_aio(port, instance_id, server_options):
+    logger = log.get(f"Service 3-{instance_id}")
+    metrics.track_executor(server_mode.cpu_executor(), 'cpu')
+    server = grpc.aio.server(
+        options=server_options,
+        maximum_concurrent_rpcs=server_mode.max_concurrent_rpcs(),
+        interceptors=(metrics.aio_interceptors()
+                      + stage_timing.aio_interceptors(f"Service 3-{instance_id}")
+                      + admission.aio_interceptors(f"Service 3-{instance_id}"))
+    )
+    pipeline_pb2_grpc.add_AnalysisServiceServicer_to_server(AsyncAnalysisServiceServicer(), server)
+    await health.add_aio_health_servicer(server, 'pipeline.AnalysisService')
+    server.add_insecure_port(f'[::]:{port}')
+    await server.start()
+    logger.info(f"Analysis Service started on port {port} (aio mode, max {server_mode.max_concurrent_rpcs()} concurrent RPCs)")
+    logger.info("Waiting for requests...")
+    await server.wait_for_termination()
+
+
 if __name__ == '__main__':
     serve()
\ No newline at end of file
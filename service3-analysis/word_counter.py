@@ -0,0 +1,159 @@
+"""
+Word counting engine for Service 3.
+
+Small documents are counted inline. Documents of at least
+PARALLEL_COUNT_THRESHOLD bytes are copied once into shared memory, cut into
+one shard per worker at whitespace boundaries, and counted by a pool of
+COUNT_WORKERS processes, so a single large request can use every core
+instead of one GIL-bound thread. The partial Counters are merged in the
+calling process.
+
+The pool uses the forkserver start method: workers are forked from a clean
+helper process rather than from the gRPC server, whose threads do not
+survive fork().
+"""
+
+import multiprocessing
+import os
+import re
+import threading
+from collections import Counter
+from concurrent import futures
+from multiprocessing import shared_memory
+
+# Whitespace for both str.split() and bytes.split(), so a cut never lands
+# inside a word under either tokenization
+_SHARD_BOUNDARY = re.compile(rb'[ \t\n\r\x0b\x0c]')
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def parallel_threshold():
+    """Smallest document (in bytes) counted in the process pool"""
+    return int(os.getenv('PARALLEL_COUNT_THRESHOLD', str(8 * 1024 * 1024)))
+
+
+def worker_count():
+    """Processes in the counting pool; 0 or 1 keeps every count inline"""
+    return int(os.getenv('COUNT_WORKERS', str(os.cpu_count() or 1)))
+
+
+def count_words(text):
+    """Tokenize on whitespace and count word frequencies (str or bytes payload)
+
+    Returns (Counter with str keys, total words).
+    """
+    workers = worker_count()
+    if workers > 1 and len(text) >= parallel_threshold():
+        word_counts, total = count_parallel(text, workers)
+    else:
+        words = text.split()
+        word_counts, total = Counter(words), len(words)
+    if isinstance(text, bytes):
+        word_counts = decode_counts(word_counts)
+    return word_counts, total
+
+
+def count_frame(word_counts, text):
+    """Add one frame's words to a running Counter; returns the frame's word count
+
+    Payload frames are counted under bytes keys; decode_counts() converts them
+    once the stream ends, so each distinct word is decoded only once.
+    """
+    words = text.split()
+    word_counts.update(words)
+    return len(words)
+
+
+def decode_counts(word_counts):
+    """Turn bytes keys into str, decoding each distinct word once"""
+    decoded = Counter()
+    for word, count in word_counts.items():
+        if isinstance(word, bytes):
+            word = word.decode('utf-8', 'replace')
+        decoded[word] += count
+    return decoded
+
+
+def shard_bounds(buffer, shards):
+    """Cut `buffer` into at most `shards` (start, end) ranges that end at whitespace"""
+    size = len(buffer)
+    bounds = []
+    start = 0
+    for i in range(1, shards):
+        cut = max(start, size * i // shards)
+        match = _SHARD_BOUNDARY.search(buffer, cut)
+        if match is None:
+            break
+        if match.start() > start:
+            bounds.append((start, match.start()))
+            start = match.start()
+    bounds.append((start, size))
+    return bounds
+
+
+def count_parallel(text, workers):
+    """Count `text` in the process pool; returns (Counter, total words)
+
+    Keys are bytes for bytes input and str for str input, matching what
+    text.split() would produce.
+    """
+    as_text = isinstance(text, str)
+    data = text.encode('utf-8', 'surrogatepass') if as_text else text
+
+    shm = shared_memory.SharedMemory(create=True, size=max(1, len(data)))
+    try:
+        shm.buf[:len(data)] = data
+        bounds = shard_bounds(shm.buf[:len(data)], workers)
+        pool = get_pool(workers)
+        partials = [
+            pool.submit(_count_shard, shm.name, start, end, as_text)
+            for start, end in bounds
+        ]
+        word_counts = Counter()
+        total = 0
+        for future in partials:
+            shard_counts, shard_total = future.result()
+            word_counts.update(shard_counts)
+            total += shard_total
+        return word_counts, total
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def _count_shard(shm_name, start, end, as_text):
+    """Worker: count one shard of the shared buffer"""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        chunk = bytes(shm.buf[start:end])
+    finally:
+        shm.close()
+    if as_text:
+        chunk = chunk.decode('utf-8', 'surrogatepass')
+    words = chunk.split()
+    return Counter(words), len(words)
+
+
+def get_pool(workers=None):
+    """Process-wide counting pool, started on first use"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                context = multiprocessing.get_context('forkserver')
+                context.set_forkserver_preload([__name__])
+                _pool = futures.ProcessPoolExecutor(
+                    max_workers=workers or worker_count(),
+                    mp_context=context
+                )
+    return _pool
+
+
+def warm_up():
+    """Start the pool's workers ahead of the first large request"""
+    workers = worker_count()
+    if workers > 1:
+        pool = get_pool(workers)
+        list(pool.map(abs, range(workers)))
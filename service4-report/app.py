@@ -1,5 +1,6 @@
 import grpc
 from concurrent import futures
+import asyncio
 import time
 import os
 import sys
@@ -9,24 +10,28 @@ sys.path.insert(0, '/app')
 
 import pipeline_pb2
 import pipeline_pb2_grpc
+import admission
+import health
+import log
+import metrics
+import server_mode
+import stage_timing
 
 class ReportServiceServicer(pipeline_pb2_grpc.ReportServiceServicer):
     def __init__(self):
         self.instance_id = os.getenv('INSTANCE_ID', 'unknown')
-        print(f"[Service 4-{self.instance_id}] Initialized. This is the final service in the pipeline.")
+        self.log = log.get(f"Service 4-{self.instance_id}")
+        self.log.info(f"Initialized. This is the final service in the pipeline.")
 
     def GenerateReport(self, request, context):
-        print(f"\n[Service 4-{self.instance_id}] ===== Received Report Request =====")
-        print(f"[Service 4-{self.instance_id}] Request ID: {request.request_id}")
-        print(f"[Service 4-{self.instance_id}] Total words: {request.total_words}")
-        print(f"[Service 4-{self.instance_id}] Unique words: {request.unique_words}")
-        print(f"[Service 4-{self.instance_id}] Instance: {self.instance_id}")
+        log.bind_request(request.request_id)
+        self.log.debug(f"Received report request: {request.total_words} words, {request.unique_words} unique")
         
         start_time = time.time()
         
         try:
             # Generate the report
-            print(f"[Service 4-{self.instance_id}] Generating report...")
+            self.log.debug("Generating report...")
             
             report_lines = []
             report_lines.append("=" * 60)
@@ -52,10 +57,8 @@ class ReportServiceServicer(pipeline_pb2_grpc.ReportServiceServicer):
             
             report = "\n".join(report_lines)
             
-            print(f"[Service 4-{self.instance_id}] Report generated successfully")
-            print(f"[Service 4-{self.instance_id}] Processing time: {processing_time:.3f}s")
-            print(f"\n[Service 4-{self.instance_id}] Generated Report Preview:")
-            print(report[:200] + "..." if len(report) > 200 else report)
+            self.log.info(f"Report generated in {processing_time:.3f}s")
+            self.log.debug("Generated report preview:\n" + (report[:200] + "..." if len(report) > 200 else report))
             
             return pipeline_pb2.ReportResponse(
                 report=report,
@@ -63,14 +66,22 @@ class ReportServiceServicer(pipeline_pb2_grpc.ReportServiceServicer):
             )
             
         except Exception as e:
-            print(f"[Service 4-{self.instance_id}] ERROR: {str(e)}")
+            self.log.exception(f"Error: {str(e)}")
             context.set_code(grpc.StatusCode.INTERNAL)
             context.set_details(str(e))
             raise
 
+class AsyncReportServiceServicer(ReportServiceServicer):
+    """grpc.aio variant; report generation is cheap, so it runs inline on the loop"""
+
+    async def GenerateReport(self, request, context):
+        return ReportServiceServicer.GenerateReport(self, request, context)
+
 def serve():
     port = os.getenv('PORT', '8054')
     instance_id = os.getenv('INSTANCE_ID', 'default')
+    log.configure('service4', instance_id)
+    logger = log.get(f"Service 4-{instance_id}")
     
     # ADDED: Server options for larger messages (even though reports are small)
     server_options = [
@@ -78,15 +89,46 @@ def serve():
         ('grpc.max_receive_message_length', 100 * 1024 * 1024),
     ]
     
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10), options=server_options)
+    metrics.start(f"Service 4-{instance_id}")
+    
+    if server_mode.is_aio():
+        asyncio.run(serve_aio(port, instance_id, server_options))
+        return
+    
+    server = grpc.server(
+        metrics.track_executor(futures.ThreadPoolExecutor(max_workers=10)), options=server_options,
+        maximum_concurrent_rpcs=server_mode.max_concurrent_rpcs(),
+        interceptors=(metrics.interceptors()
+                      + stage_timing.interceptors(f"Service 4-{instance_id}")
+                      + admission.interceptors(f"Service 4-{instance_id}"))
+    )
     pipeline_pb2_grpc.add_ReportServiceServicer_to_server(
         ReportServiceServicer(), server
     )
+    health.add_health_servicer(server, 'pipeline.ReportService')
     server.add_insecure_port(f'[::]:{port}')
     server.start()
-    print(f"[Service 4-{instance_id} - Report Service] Started on port {port} (100MB limit)")
-    print(f"[Service 4-{instance_id}] Waiting for requests...")
+    logger.info(f"Report Service started on port {port} (100MB limit)")
+    logger.info("Waiting for requests...")
     server.wait_for_termination()
 
+async def serve_aio(port, instance_id, server_options):
+    logger = log.get(f"Service 4-{instance_id}")
+    metrics.track_executor(server_mode.cpu_executor(), 'cpu')
+    server = grpc.aio.server(
+        options=server_options,
+        maximum_concurrent_rpcs=server_mode.max_concurrent_rpcs(),
+        interceptors=(metrics.aio_interceptors()
+                      + stage_timing.aio_interceptors(f"Service 4-{instance_id}")
+                      + admission.aio_interceptors(f"Service 4-{instance_id}"))
+    )
+    pipeline_pb2_grpc.add_ReportServiceServicer_to_server(AsyncReportServiceServicer(), server)
+    await health.add_aio_health_servicer(server, 'pipeline.ReportService')
+    server.add_insecure_port(f'[::]:{port}')
+    await server.start()
+    logger.info(f"Report Service started on port {port} (aio mode, max {server_mode.max_concurrent_rpcs()} concurrent RPCs)")
+    logger.info("Waiting for requests...")
+    await server.wait_for_termination()
+
 if __name__ == '__main__':
     serve()
\ No newline at end of file